@@ -0,0 +1,90 @@
+"""Compares the memory held by per-path caption dicts against the compact image table.
+
+Builds the same synthetic captions twice in memory, once in the dict-of-Captions layout the dataset used to keep
+(with its list of paths, path-to-id dict and per-tag sets of paths) and once as an ImageTable with per-tag id arrays,
+and reports the bytes allocated by each. No files are written.
+Run from the repository root with `python benchmarks/bench_memory.py`.
+"""
+
+import argparse
+import os
+import random
+import sys
+import tracemalloc
+from array import array
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+)
+
+from caption import Caption
+from image_table import ImageTable, insert_sorted
+
+
+def synthetic_captions(root, images, per_dir, tags_per_caption, seed):
+    """Yields (png_path, tags) for 'images' images spread over directories of 'per_dir' images each"""
+    rng = random.Random(seed)
+    for i in range(images):
+        stem = os.path.join(root, f"d{i // per_dir}", f"img_{i:07d}")
+        tags = [f"tag_{rng.randint(0, 4999)}" for _ in range(tags_per_caption)]
+        yield f"{stem}.png", ["trigger"] + tags
+
+
+def build_dicts(captions):
+    cache = {}
+    tag_images = {}
+    for png_path, tags in captions:
+        cache[png_path] = (f"{png_path[:-4]}.txt", Caption(tags))
+        for tag in tags:
+            tag_images.setdefault(tag, set()).add(png_path)
+    image_set = list(cache)
+    image_ids = {png_path: i for i, png_path in enumerate(image_set)}
+    return cache, tag_images, image_set, image_ids
+
+
+def build_table(captions):
+    table = ImageTable()
+    tag_images = {}
+    for png_path, tags in captions:
+        i = table.add(png_path)
+        table.set_caption(i, tags)
+        for tag in tags:
+            if tag not in tag_images:
+                tag_images[tag] = array("I")
+            insert_sorted(tag_images[tag], i)
+    return table, tag_images
+
+
+def measure(build, captions):
+    """Returns the bytes still allocated by build(captions) once it returns"""
+    captions = list(captions)
+    tracemalloc.start()
+    result = build(captions)
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return used
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--images", type=int, default=100000)
+    parser.add_argument("--per-dir", type=int, default=1000)
+    parser.add_argument("--tags", type=int, default=30, help="tags per caption")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    root = os.path.join(os.sep, "datasets", "benchmark")
+
+    def captions():
+        return synthetic_captions(root, args.images, args.per_dir, args.tags, args.seed)
+
+    print(f"{args.images} captions of {args.tags + 1} tags")
+    dicts = measure(build_dicts, captions())
+    table = measure(build_table, captions())
+    print(f"{'dicts of Captions':24}{dicts / 2**20:>10.1f} MiB")
+    print(f"{'image table':24}{table / 2**20:>10.1f} MiB ({table / dicts:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Compares the scandir-based dataset scanner against the former recursive scanner.
+
+Builds a synthetic dataset tree in a temporary directory, then times both scanners over it.
+Run from the repository root with `python benchmarks/bench_scan.py`.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+)
+
+from scan import scan_dataset
+
+
+def legacy_scan(path, pairs, missing):
+    """The recursive os.listdir/os.path.isfile scan formerly used by Dataset.expand_dataset_recursive"""
+    if not os.path.isfile(path):
+        subpaths = os.listdir(path)
+        if len(subpaths) > 0:
+            for s in subpaths:
+                legacy_scan(os.path.join(path, s), pairs, missing)
+    elif path.endswith(".png"):
+        if os.path.isfile(path.replace(".png", ".txt")):
+            pairs.append((path, path.replace(".png", ".txt")))
+        else:
+            missing.append(path)
+    return pairs, missing
+
+
+def build_tree(root, images, per_dir, depth, missing_every):
+    """Writes 'images' empty .png files spread over nested directories, most with a .txt sibling"""
+    written = 0
+    dir_index = 0
+    while written < images:
+        parts = [f"d{(dir_index // (10**level)) % 10}" for level in range(depth)]
+        directory = os.path.join(root, *parts, f"leaf{dir_index}")
+        os.makedirs(directory, exist_ok=True)
+        for _ in range(min(per_dir, images - written)):
+            stem = os.path.join(directory, f"img_{written:07d}")
+            open(f"{stem}.png", "wb").close()
+            if missing_every == 0 or written % missing_every != 0:
+                with open(f"{stem}.txt", "w") as file:
+                    file.write("trigger, tag")
+            written += 1
+        dir_index += 1
+
+
+def best_of(repeats, func):
+    best = None
+    result = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--images", type=int, default=20000)
+    parser.add_argument("--per-dir", type=int, default=200)
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--missing-every", type=int, default=50)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        build_tree(root, args.images, args.per_dir, args.depth, args.missing_every)
+        legacy_time, legacy = best_of(args.repeats, lambda: legacy_scan(root, [], []))
+        scandir_time, scanned = best_of(args.repeats, lambda: scan_dataset(root))
+
+    if sorted(legacy[0]) != sorted(scanned[0]) or sorted(legacy[1]) != sorted(
+        scanned[1]
+    ):
+        raise Exception("scanners disagree on the contents of the synthetic dataset")
+    print(
+        f"{len(scanned[0])} pairs, {len(scanned[1])} missing captions (best of {args.repeats})"
+    )
+    print(f"recursive listdir scan: {legacy_time:.3f}s")
+    print(f"scandir scan:           {scandir_time:.3f}s")
+    print(f"speedup:                {legacy_time / scandir_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Compares single-process batch edits against sharded multi-process edits.
+
+Builds a synthetic captioned dataset in a temporary directory, then renames a tag back and forth across it,
+once with the streaming batch engine and once per requested number of worker processes.
+Run from the repository root with `python benchmarks/bench_shards.py`.
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+)
+
+from batch import RenameTags, run_batch
+from scan import iter_dataset
+from shards import run_sharded
+
+
+def build_dataset(root, images, per_dir, tags_per_caption, seed):
+    """Writes 'images' empty .png files with captions of random tags, every one containing 'common tag'"""
+    rng = random.Random(seed)
+    for i in range(images):
+        directory = os.path.join(root, f"d{i // per_dir}")
+        os.makedirs(directory, exist_ok=True)
+        stem = os.path.join(directory, f"img_{i:07d}")
+        open(f"{stem}.png", "wb").close()
+        tags = [f"tag_{rng.randint(0, 4999)}" for _ in range(tags_per_caption)]
+        with open(f"{stem}.txt", "w") as file:
+            file.write(", ".join(["trigger", "common tag"] + tags))
+
+
+def timed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--images", type=int, default=20000)
+    parser.add_argument("--per-dir", type=int, default=1000)
+    parser.add_argument("--tags", type=int, default=30, help="tags per caption")
+    parser.add_argument("--jobs", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        build_dataset(root, args.images, args.per_dir, args.tags, args.seed)
+        txt_paths = [txt for _, txt in iter_dataset(root) if txt is not None]
+        forward = RenameTags(["common tag"], "renamed tag")
+        back = RenameTags(["renamed tag"], "common tag")
+        print(
+            f"{args.images} captions of {args.tags + 2} tags, renaming one tag in all of them"
+        )
+        elapsed = timed(lambda: run_batch(root, forward)) + timed(
+            lambda: run_batch(root, back)
+        )
+        print(f"{'batch (threads)':24}{elapsed / 2:>10.2f}s")
+        for jobs in args.jobs:
+            elapsed = timed(lambda: run_sharded(txt_paths, forward, jobs=jobs)) + timed(
+                lambda: run_sharded(txt_paths, back, jobs=jobs)
+            )
+            print(f"{f'sharded, {jobs} processes':24}{elapsed / 2:>10.2f}s")
+
+
+if __name__ == "__main__":
+    main()
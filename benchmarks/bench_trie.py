@@ -0,0 +1,125 @@
+"""Compares the memory use and speed of the dict-per-character Trie and the compact RadixTrie.
+
+Builds both tries from the same synthetic vocabulary of booru-style tags, then measures
+memory held after construction and the time taken by common operations.
+Run from the repository root with `python benchmarks/bench_trie.py`.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+)
+
+from structures import Trie, RadixTrie
+
+SYLLABLES = [
+    "hair",
+    "long",
+    "short",
+    "blue",
+    "red",
+    "eyes",
+    "sky",
+    "cloud",
+    "shirt",
+    "skirt",
+    "holding",
+    "looking",
+    "at",
+    "viewer",
+    "open",
+    "mouth",
+    "smile",
+    "white",
+    "black",
+    "background",
+    "sitting",
+    "standing",
+    "outdoors",
+    "indoors",
+    "ribbon",
+    "bow",
+    "dress",
+    "gloves",
+    "thigh",
+    "highs",
+]
+
+
+def make_vocabulary(size, seed):
+    """Returns 'size' distinct tags of two to six words, each paired with a skewed usage count"""
+    rng = random.Random(seed)
+    vocabulary = {}
+    while len(vocabulary) < size:
+        words = [rng.choice(SYLLABLES) for _ in range(rng.randint(2, 6))]
+        tag = rng.choice(["_", " "]).join(words) + str(rng.randint(0, 99))
+        vocabulary[tag] = int(rng.paretovariate(1.2))
+    return list(vocabulary.items())
+
+
+def build(cls, vocabulary):
+    trie = cls()
+    for tag, count in vocabulary:
+        trie.add(tag, count)
+    return trie
+
+
+def measure_memory(cls, vocabulary):
+    tracemalloc.start()
+    trie = build(cls, vocabulary)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current, trie
+
+
+def timed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tags", type=int, default=40000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    vocabulary = make_vocabulary(args.tags, args.seed)
+    rng = random.Random(args.seed)
+    prefixes = [
+        tag[: rng.randint(1, 4)] for tag, _ in rng.sample(vocabulary, args.queries)
+    ]
+    lookups = [tag for tag, _ in rng.sample(vocabulary, args.queries)]
+
+    print(f"{args.tags} tags, {args.queries} queries per operation")
+    print(f"{'':24}{'Trie':>12}{'RadixTrie':>12}")
+    results = {}
+    for cls in (Trie, RadixTrie):
+        memory, trie = measure_memory(cls, vocabulary)
+        results[cls] = {
+            "memory (MiB)": memory / 2**20,
+            "build (s)": timed(lambda: build(cls, vocabulary)),
+            "get (ms)": 1000 * timed(lambda: [trie.get(tag) for tag in lookups]),
+            "words_with_prefix (ms)": 1000
+            * timed(lambda: [trie.words_with_prefix(prefix) for prefix in prefixes]),
+            "top 3 with prefix (ms)": 1000
+            * timed(
+                lambda: [trie.top_words_with_prefix(prefix, 3) for prefix in prefixes]
+            ),
+            "remove (ms)": 1000 * timed(lambda: [trie.remove(tag) for tag in lookups]),
+        }
+    for metric in results[Trie]:
+        print(
+            f"{metric:24}{results[Trie][metric]:>12.2f}{results[RadixTrie][metric]:>12.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+from scan import iter_dataset
+from ingest import IngestReport, read_caption, read_captions
+from caption import Caption
+from dataset import MAX_SAVE_WORKERS, write_caption_atomic
+from concurrent.futures import ThreadPoolExecutor
+from collections import Counter
+import difflib
+import time
+
+# number of captions read, edited and written at a time; bounds the memory held by a batch run
+BATCH_SIZE = 8192
+
+
+def iter_batches(directory, size=BATCH_SIZE):
+    """Yields lists of up to 'size' (png_path, txt_path) pairs for the captioned images under a directory"""
+    batch = []
+    for png_path, txt_path in iter_dataset(directory):
+        if txt_path is None:
+            continue
+        batch.append((png_path, txt_path))
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if len(batch) > 0:
+        yield batch
+
+
+def iter_captions(directory, workers=None, report=None):
+    """Yields (png_path, txt_path, tags) for every readable caption under a directory, reading BATCH_SIZE at a time"""
+    for batch in iter_batches(directory):
+        results = read_captions(
+            [txt_path for _, txt_path in batch], workers=workers, report=report
+        )
+        for (png_path, txt_path), result in zip(batch, results):
+            if result is not None:
+                yield png_path, txt_path, result[1]
+
+
+def find_trigger_word(directory):
+    """Returns the trigger word of the dataset under a directory, or None if no caption has any tags.
+
+    As when a Dataset is loaded, the trigger word is the first tag of the first caption, in dataset order, that has one.
+    """
+    for _, txt_path in iter_dataset(directory):
+        if txt_path is None:
+            continue
+        try:
+            _, tags = read_caption(txt_path)
+        except Exception:
+            continue
+        if len(tags) > 0:
+            return tags[0]
+    return None
+
+
+def protect_trigger_word(trigger_word, edit):
+    """Raises an Exception if the edit would add, remove or rename the trigger word"""
+    if trigger_word is not None and trigger_word in edit.tags():
+        raise Exception(f"The trigger word '{trigger_word}' cannot be edited.")
+
+
+def count_tag_deltas(old_tags, caption, deltas):
+    """Adds the change in tag counts from an edit of a caption, whose tags were previously old_tags, to deltas"""
+    old_tags = set(old_tags)
+    for tag in caption:
+        if tag not in old_tags:
+            deltas[tag] += 1
+    for tag in old_tags:
+        if tag not in caption:
+            deltas[tag] -= 1
+
+
+class AddTag:
+    """Appends a tag to every caption without it"""
+
+    def __init__(self, tag):
+        self.tag = tag
+
+    def tags(self):
+        return [self.tag]
+
+    def apply(self, caption):
+        return caption.add(self.tag)
+
+
+class RemoveTag:
+    """Removes a tag from every caption containing it"""
+
+    def __init__(self, tag):
+        self.tag = tag
+
+    def tags(self):
+        return [self.tag]
+
+    def apply(self, caption):
+        return caption.remove(self.tag)
+
+
+class RemoveTags:
+    """Removes several tags from every caption containing any of them"""
+
+    def __init__(self, tags):
+        self.removed = list(tags)
+
+    def tags(self):
+        return self.removed
+
+    def apply(self, caption):
+        changed = False
+        for tag in self.removed:
+            if caption.remove(tag):
+                changed = True
+        return changed
+
+
+class RenameTags:
+    """Replaces one or more tags with a single new tag, keeping the position of the first one replaced.
+
+    Captions that already contain the new tag simply lose the old ones, so renaming onto an existing tag merges the two.
+    """
+
+    def __init__(self, old_tags, new_tag):
+        self.old_tags = [tag for tag in old_tags if tag != new_tag]
+        self.new_tag = new_tag
+
+    def tags(self):
+        return self.old_tags + [self.new_tag]
+
+    def apply(self, caption):
+        changed = False
+        for tag in self.old_tags:
+            position = caption.index(tag)
+            if position is None:
+                continue
+            caption.remove(tag)
+            if self.new_tag not in caption:
+                caption.insert(position, self.new_tag)
+            changed = True
+        return changed
+
+
+class WhereQuery:
+    """Restricts another edit to the captions matching a Query"""
+
+    def __init__(self, edit, query):
+        self.edit = edit
+        self.query = query
+
+    def tags(self):
+        return self.edit.tags()
+
+    def apply(self, caption):
+        return self.query.matches(caption) and self.edit.apply(caption)
+
+
+class BatchReport:
+    """Summarizes a batch run over a dataset"""
+
+    def __init__(self):
+        self.captions_read = 0
+        self.captions_changed = 0
+        self.bytes_written = 0
+        self.elapsed = 0.0
+        self.read_report = IngestReport()
+        # change in the number of captions holding each tag
+        self.tag_deltas = Counter()
+
+    def merge(self, other):
+        """Adds the counts of another report, such as one from a single shard, to this one"""
+        self.captions_read += other.captions_read
+        self.captions_changed += other.captions_changed
+        self.bytes_written += other.bytes_written
+        self.read_report.errors.extend(other.read_report.errors)
+        self.tag_deltas.update(other.tag_deltas)
+
+    def __str__(self):
+        return f"{self.captions_changed} of {self.captions_read} captions changed ({self.bytes_written} bytes written) in {self.elapsed:.2f}s."
+
+
+def run_batch(directory, edit, dry_run=False, workers=None, out=print):
+    """Applies an edit to every caption under a directory in a single streaming pass.
+
+    Captions are read, edited and written BATCH_SIZE at a time, so memory stays bounded however large the dataset is.
+    Changed captions are written concurrently through 'write_caption_atomic'. With dry_run, nothing is written and
+    a unified diff of each change is passed to 'out' instead.
+    The trigger word is never edited: an edit involving it raises an Exception before any caption is read.
+    Captions changed on disk are re-read the next time the dataset is opened, as their modification times no longer
+    match the dataset index.
+    Returns a BatchReport.
+    """
+    protect_trigger_word(find_trigger_word(directory), edit)
+    report = BatchReport()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers or MAX_SAVE_WORKERS) as executor:
+        for batch in iter_batches(directory):
+            results = read_captions(
+                [txt_path for _, txt_path in batch],
+                workers=workers,
+                report=report.read_report,
+            )
+            changes = []
+            for (_, txt_path), result in zip(batch, results):
+                if result is None:
+                    continue
+                report.captions_read += 1
+                caption = Caption(result[1])
+                if not edit.apply(caption):
+                    continue
+                report.captions_changed += 1
+                count_tag_deltas(result[1], caption, report.tag_deltas)
+                if dry_run:
+                    for line in difflib.unified_diff(
+                        [result[0]],
+                        [caption.serialize()],
+                        txt_path,
+                        txt_path,
+                        lineterm="",
+                    ):
+                        out(line)
+                else:
+                    changes.append((txt_path, caption.serialize()))
+            for st in executor.map(
+                lambda change: write_caption_atomic(*change), changes
+            ):
+                report.bytes_written += st.st_size
+    report.elapsed = time.perf_counter() - start
+    return report
+
+
+class DatasetStats:
+    """Tag statistics gathered in one streaming pass over a dataset"""
+
+    def __init__(self):
+        self.images = 0
+        self.missing_captions = 0
+        self.captions = 0
+        self.empty_captions = 0
+        self.missing_trigger = 0
+        self.trigger_word = None
+        self.tag_counts = Counter()
+        self.read_report = IngestReport()
+
+    def summary(self, top=20):
+        lines = [
+            f"Images: {self.images} ({self.missing_captions} without captions)",
+            f"Captions: {self.captions} ({self.empty_captions} empty)",
+            f"Trigger word: {self.trigger_word} (missing from {self.missing_trigger} captions)",
+            f"Distinct tags: {len(self.tag_counts)}",
+        ]
+        if top > 0:
+            lines.append("Most common tags:")
+            for tag, count in self.tag_counts.most_common(top):
+                lines.append(f"  {count:>8}  {tag}")
+        if self.read_report.size() > 0:
+            lines.append(self.read_report.summary())
+        return "\n".join(lines)
+
+
+def gather_stats(directory, workers=None):
+    """Counts images, captions and tags under a directory, reading captions BATCH_SIZE at a time"""
+    stats = DatasetStats()
+    batch = []
+
+    def flush():
+        for result in read_captions(batch, workers=workers, report=stats.read_report):
+            if result is None:
+                continue
+            stats.captions += 1
+            tags = result[1]
+            if len(tags) == 0:
+                stats.empty_captions += 1
+                continue
+            if stats.trigger_word is None:
+                stats.trigger_word = tags[0]
+            if tags[0] != stats.trigger_word:
+                stats.missing_trigger += 1
+            stats.tag_counts.update(tags)
+        batch.clear()
+
+    for _, txt_path in iter_dataset(directory):
+        stats.images += 1
+        if txt_path is None:
+            stats.missing_captions += 1
+            continue
+        batch.append(txt_path)
+        if len(batch) == BATCH_SIZE:
+            flush()
+    flush()
+    return stats
@@ -0,0 +1,76 @@
+def split_tags(text):
+    """Splits caption text at commas into its tags, in order.
+
+    Surrounding whitespace is stripped from every tag; empty tags and repeats of an earlier tag are dropped.
+    """
+    tags = {}
+    for tag in text.split(","):
+        tag = tag.strip()
+        if tag:
+            tags[tag] = None
+    return list(tags)
+
+
+class Caption:
+    """The tags of a single image caption, parsed once when loaded and serialized only when saved.
+
+    Tags are held in an insertion-ordered dict used as an ordered hash set:
+    membership tests, additions and removals are O(1), and the tags keep the order they were written in.
+    """
+
+    def __init__(self, tags=()):
+        self.tags = dict.fromkeys(tags)
+
+    @classmethod
+    def parse(cls, text):
+        return cls(split_tags(text))
+
+    def serialize(self):
+        return ", ".join(self.tags)
+
+    def __contains__(self, tag):
+        return tag in self.tags
+
+    def __iter__(self):
+        # iterate over a snapshot, so a caption edited on another thread cannot break the iteration
+        return iter(list(self.tags))
+
+    def __len__(self):
+        return len(self.tags)
+
+    def __str__(self):
+        return self.serialize()
+
+    def first(self):
+        """Returns the first tag of the caption, or None if it has no tags"""
+        for tag in self.tags:
+            return tag
+        return None
+
+    def add(self, tag):
+        """Appends a tag to the caption. Returns False if it was already present."""
+        if tag in self.tags:
+            return False
+        self.tags[tag] = None
+        return True
+
+    def remove(self, tag):
+        """Removes a tag from the caption. Returns False if it was not present."""
+        if tag not in self.tags:
+            return False
+        del self.tags[tag]
+        return True
+
+    def index(self, tag):
+        """Returns the position of a tag within the caption, or None if it is not present"""
+        if tag not in self.tags:
+            return None
+        for position, t in enumerate(self.tags):
+            if t == tag:
+                return position
+
+    def insert(self, position, tag):
+        """Places a tag at the given position, moving it there if it is already present"""
+        tags = [t for t in self.tags if t != tag]
+        tags.insert(position, tag)
+        self.tags = dict.fromkeys(tags)
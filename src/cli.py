@@ -0,0 +1,243 @@
+"""Edits tagman datasets from the command line, without the GUI.
+
+Run with `python src/cli.py COMMAND DIRECTORY ...`; see `python src/cli.py --help` for the commands.
+"""
+
+from batch import (
+    AddTag,
+    RemoveTag,
+    RemoveTags,
+    RenameTags,
+    WhereQuery,
+    find_trigger_word,
+    gather_stats,
+    iter_captions,
+    protect_trigger_word,
+    run_batch,
+)
+from ingest import IngestReport
+from query import Query
+from shards import SHARDING, run_sharded
+from structures import InfixIndex
+from dataset import create_empty_caption
+from scan import iter_dataset
+import argparse
+import os
+import sys
+
+
+def run_edit_sharded(args, edit):
+    protect_trigger_word(find_trigger_word(args.directory), edit)
+    txt_paths = [
+        txt_path for _, txt_path in iter_dataset(args.directory) if txt_path is not None
+    ]
+    return run_sharded(
+        txt_paths, edit, jobs=args.jobs, shard_by=args.shard_by, dry_run=args.dry_run
+    )
+
+
+def command_edit(args, edit):
+    if args.where is not None:
+        edit = WhereQuery(edit, Query.parse(args.where))
+    if args.jobs is not None and args.jobs > 1:
+        report = run_edit_sharded(args, edit)
+    else:
+        report = run_batch(
+            args.directory, edit, dry_run=args.dry_run, workers=args.workers
+        )
+    if report.read_report.size() > 0:
+        print(report.read_report.summary(), file=sys.stderr)
+    if args.dry_run:
+        print(
+            f"Dry run: {report.captions_changed} of {report.captions_read} captions would change."
+        )
+    else:
+        print(report)
+
+
+def command_add(args):
+    command_edit(args, AddTag(args.tag))
+
+
+def tags_containing(args):
+    """Returns every tag of the dataset containing the '--containing' fragment, most frequent first.
+
+    The tags are gathered in one streaming pass and searched through an InfixIndex, as the GUI does for its
+    dataset; the trigger word is left out, as it cannot be edited.
+    """
+    stats = gather_stats(args.directory, workers=args.workers)
+    index = InfixIndex()
+    for tag in stats.tag_counts:
+        index.add(tag)
+    tags = sorted(
+        index.containing(args.containing) - {stats.trigger_word},
+        key=lambda tag: (-stats.tag_counts[tag], tag),
+    )
+    if len(tags) == 0:
+        raise Exception(f"No tag contains '{args.containing}'.")
+    print(f"Tags containing '{args.containing}': {', '.join(tags)}", file=sys.stderr)
+    return tags
+
+
+def command_remove(args):
+    if (args.tag is None) == (args.containing is None):
+        raise Exception("Give either a tag or --containing FRAGMENT.")
+    if args.containing is not None:
+        command_edit(args, RemoveTags(tags_containing(args)))
+    else:
+        command_edit(args, RemoveTag(args.tag))
+
+
+def command_rename(args):
+    if args.containing is not None:
+        if len(args.old) > 0:
+            raise Exception("Give either the tags to replace or --containing FRAGMENT.")
+        command_edit(args, RenameTags(tags_containing(args), args.new))
+    elif len(args.old) == 0:
+        raise Exception("Give the tags to replace, or --containing FRAGMENT.")
+    else:
+        command_edit(args, RenameTags(args.old, args.new))
+
+
+def command_stats(args):
+    print(gather_stats(args.directory, workers=args.workers).summary(top=args.top))
+
+
+def command_query(args):
+    query = Query.parse(args.query)
+    report = IngestReport()
+    count = 0
+    for png_path, _, tags in iter_captions(
+        args.directory, workers=args.workers, report=report
+    ):
+        if query.matches(tags):
+            count += 1
+            print(png_path)
+    if report.size() > 0:
+        print(report.summary(), file=sys.stderr)
+    print(f"{count} images match the query.", file=sys.stderr)
+
+
+def command_missing(args):
+    count = 0
+    for png_path, txt_path in iter_dataset(args.directory):
+        if txt_path is not None:
+            continue
+        count += 1
+        if args.create and not args.dry_run:
+            print(f"Created {create_empty_caption(png_path)}")
+        else:
+            print(png_path)
+    print(f"{count} images without captions.", file=sys.stderr)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("directory", help="root directory of the dataset")
+    common.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="number of threads reading and writing captions",
+    )
+    common.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=None,
+        help="edit captions in this many worker processes, each handling its own shards of the dataset",
+    )
+    common.add_argument(
+        "--shard-by",
+        choices=sorted(SHARDING),
+        default="hash",
+        help="how captions are split between worker processes (default: hash)",
+    )
+    common.add_argument(
+        "-n",
+        "--dry-run",
+        action="store_true",
+        help="show what would change without writing anything",
+    )
+    where = argparse.ArgumentParser(add_help=False)
+    where.add_argument(
+        "--where",
+        metavar="QUERY",
+        default=None,
+        help="only edit captions matching a tag query, e.g. 'outdoors AND NOT sky'",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    add = commands.add_parser(
+        "add",
+        parents=[common, where],
+        help="append a tag to every caption without it",
+    )
+    add.add_argument("tag")
+    add.set_defaults(func=command_add)
+
+    containing = argparse.ArgumentParser(add_help=False)
+    containing.add_argument(
+        "--containing",
+        metavar="FRAGMENT",
+        default=None,
+        help="edit every tag containing FRAGMENT, e.g. 'hair', instead of naming the tags",
+    )
+
+    remove = commands.add_parser(
+        "remove",
+        parents=[common, where, containing],
+        help="remove a tag, or every tag containing a fragment, from every caption",
+    )
+    remove.add_argument("tag", nargs="?", default=None)
+    remove.set_defaults(func=command_remove)
+
+    rename = commands.add_parser(
+        "rename",
+        parents=[common, where, containing],
+        help="replace one or more tags with a new tag, merging them if it already exists",
+    )
+    rename.add_argument("old", nargs="*", help="tags to replace")
+    rename.add_argument("new", help="tag to replace them with")
+    rename.set_defaults(func=command_rename)
+
+    stats = commands.add_parser(
+        "stats", parents=[common], help="count images, captions and tags"
+    )
+    stats.add_argument(
+        "--top", type=int, default=20, help="number of most common tags to list"
+    )
+    stats.set_defaults(func=command_stats)
+
+    query = commands.add_parser(
+        "query", parents=[common], help="list images whose captions match a tag query"
+    )
+    query.add_argument("query", help="tags combined with AND, OR, NOT and parentheses")
+    query.set_defaults(func=command_query)
+
+    missing = commands.add_parser(
+        "missing", parents=[common], help="list images without captions"
+    )
+    missing.add_argument(
+        "--create", action="store_true", help="create an empty caption for each one"
+    )
+    missing.set_defaults(func=command_missing)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if not os.path.isdir(args.directory):
+        print(f"Not a directory: {args.directory}", file=sys.stderr)
+        return 2
+    try:
+        args.func(args)
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
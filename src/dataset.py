@@ -1,55 +1,598 @@
-from tkinter import Tk
-from structures import Trie, Queue
+from structures import InfixIndex, RadixTrie
 from log_format import str_tail_after
+from scan import scan_dataset
+from ingest import IngestReport, read_captions, stat_files
+from caption import Caption
+from dataset_index import DatasetIndex
+from journal import Journal
+from image_table import (
+    CaptionCache,
+    ImageIds,
+    ImageSequence,
+    ImageTable,
+    insert_sorted,
+    remove_sorted,
+)
+from query import BitsetCache, Query, bitset_members, make_bitset
+from concurrent.futures import ThreadPoolExecutor
+from array import array
 import os
+import stat
+import tempfile
+import threading
+import time
+
+# upper bound on the threads used to write captions when saving
+MAX_SAVE_WORKERS = 8
+# captions read by each step of a lazy dataset's background load; the dataset lock is held while a step's captions are stored
+LOAD_BATCH_SIZE = 4096
+
+
+def write_caption_atomic(txt_path, caption):
+    """Writes a caption to a temporary file beside txt_path, then moves it over txt_path.
+
+    The temporary file is flushed to disk before it replaces the original, so a crash at any point
+    leaves either the old caption or the new one in place, never a truncated file.
+    The original file's permissions are carried over. Returns the os.stat_result of the written file.
+    """
+    mode = stat.S_IMODE(os.stat(txt_path).st_mode)
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(txt_path), prefix=".", suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, "w") as file:
+            file.write(caption)
+            file.flush()
+            os.fsync(file.fileno())
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, txt_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return os.stat(txt_path)
+
+
+def caption_path(png_path):
+    """Returns the path of the .txt caption belonging to a .png image"""
+    return os.path.splitext(png_path)[0] + ".txt"
+
+
+def create_empty_caption(png_path):
+    """Creates an empty .txt caption for a .png image unless one already exists, returning its path"""
+    txt_path = caption_path(png_path)
+    try:
+        with open(txt_path, "x"):
+            pass
+    except FileExistsError:
+        pass
+    return txt_path
+
+
+def create_all_missing(png_paths):
+    """Missing-caption policy creating an empty caption for every image"""
+    return list(png_paths)
+
+
+def skip_all_missing(png_paths):
+    """Missing-caption policy leaving every uncaptioned image out of the dataset"""
+    return []
+
+
+class SaveSummary:
+    """Describes the outcome of a call to 'Dataset.save_dataset'"""
+
+    def __init__(self, files_written, bytes_written, elapsed):
+        self.files_written = files_written
+        self.bytes_written = bytes_written
+        self.elapsed = elapsed
+
+    def __str__(self):
+        return f"Saved {self.files_written} caption(s), {self.bytes_written} bytes in {self.elapsed:.2f}s."
+
+
+class BulkTagEdit:
+    """Adds a tag to, or removes it from, many captions a few at a time, recording enough to undo every change.
+
+    Created through 'Dataset.bulk_edit'. Each call to 'step' edits the next captions among the targets;
+    'rollback' reverts every caption edited so far, restoring removed tags to their former positions.
+    An added tag is appended to each caption, or placed at the matching entry of 'positions' if given.
+    The whole edit is recorded as a single undoable edit (see 'Dataset.record_edit') once it finishes.
+    """
+
+    def __init__(self, dataset, action, tag, targets, positions=None):
+        if action not in ("add", "remove"):
+            raise ValueError("only 'add' and 'remove' are acceptable bulk actions")
+        self.dataset = dataset
+        self.action = action
+        self.tag = tag
+        self.targets = targets
+        self.positions = positions
+        self.done = 0
+        # (png_path, position the tag was added at or removed from, whether the caption was already unsaved,
+        #  whether it had already been edited this session)
+        self.changes = []
+
+    def total(self):
+        return len(self.targets)
+
+    def finished(self):
+        return self.done >= len(self.targets)
+
+    def step(self, count):
+        """Edits up to 'count' more captions"""
+        dataset = self.dataset
+        for k in range(self.done, min(self.done + count, len(self.targets))):
+            png_path = self.targets[k]
+            was_dirty = png_path in dataset.dirty
+            was_edited = png_path in dataset.edited
+            if self.action == "add":
+                if self.positions is None:
+                    changed = dataset.add_tag_to_image_caption(
+                        self.tag, png_path=png_path, record=False
+                    )
+                else:
+                    changed = dataset.insert_tag_into_image_caption(
+                        self.tag, png_path, self.positions[k], record=False
+                    )
+                if changed:
+                    position = dataset.loaded_caption(png_path).index(self.tag)
+                    self.changes.append((png_path, position, was_dirty, was_edited))
+            else:
+                position = dataset.loaded_caption(png_path).index(self.tag)
+                if dataset.remove_tag_from_image_caption(
+                    self.tag, png_path=png_path, record=False
+                ):
+                    self.changes.append((png_path, position, was_dirty, was_edited))
+            self.done += 1
+        if self.finished():
+            self.complete()
+
+    def complete(self):
+        """Records the finished edit on the undo stack"""
+        if len(self.changes) > 0:
+            self.dataset.record_edit(
+                self.action,
+                self.tag,
+                [(png_path, position) for png_path, position, _, _ in self.changes],
+            )
+
+    def run(self):
+        """Edits every remaining target at once; if an edit fails, every caption edited so far is reverted"""
+        try:
+            while not self.finished():
+                self.step(len(self.targets))
+        except Exception:
+            self.rollback()
+            raise
+
+    def rollback(self):
+        """Reverts every caption edited so far, most recent first"""
+        dataset = self.dataset
+        while len(self.changes) > 0:
+            png_path, position, was_dirty, was_edited = self.changes.pop()
+            if self.action == "add":
+                dataset.remove_tag_from_image_caption(
+                    self.tag, png_path=png_path, record=False
+                )
+            else:
+                dataset.insert_tag_into_image_caption(
+                    self.tag, png_path, position, record=False
+                )
+            if not was_dirty:
+                dataset.dirty.discard(png_path)
+            if not was_edited:
+                dataset.edited.discard(png_path)
+                dataset.notify(png_path)
+        self.done = 0
+
+
+class HistoryEdit(BulkTagEdit):
+    """Undoes or redoes an edit from the undo stack a few captions at a time, as a BulkTagEdit edits.
+
+    Created through 'Dataset.undo_edit' or 'Dataset.redo_edit', which move the edit to the opposite stack at once;
+    'rollback' moves it back. Once finished, the edit made is logged to the journal rather than recorded anew.
+    """
+
+    def __init__(self, dataset, edit, undo):
+        op, tag, changes = edit
+        if undo:
+            op = "remove" if op == "add" else "add"
+        super().__init__(
+            dataset,
+            op,
+            tag,
+            [dataset.image_set[i] for i, _ in changes],
+            positions=[position for _, position in changes],
+        )
+        self.edit = edit
+        self.undo = undo
+
+    def stacks(self):
+        """Returns the stack the edit was taken from and the one it was moved to"""
+        if self.undo:
+            return self.dataset.undo_stack, self.dataset.redo_stack
+        return self.dataset.redo_stack, self.dataset.undo_stack
+
+    def complete(self):
+        with self.dataset.lock:
+            self.dataset.log_edit(self.action, self.tag, self.edit[2])
+
+    def rollback(self):
+        super().rollback()
+        source, target = self.stacks()
+        with self.dataset.lock:
+            if len(target) > 0 and target[-1] is self.edit:
+                target.pop()
+            source.append(self.edit)
 
 
 class Dataset:
-    """Stores all data relevant to the current training session"""
+    """Stores all data relevant to the current training session.
+
+    The dataset does not depend on any user interface. Images found without a .txt caption are passed,
+    as a list of .png paths, to 'missing_policy', which returns the ones to create empty captions for;
+    the rest are left out of the dataset. 'create_all_missing' and 'skip_all_missing' cover the
+    non-interactive cases, and the GUI supplies a policy that asks the user about each image.
+
+    A dataset created with 'lazy' set returns once the directory is scanned, before any caption is read.
+    Captions are then read on demand, a few at a time through 'load_captions' or as single images are accessed,
+    while 'load_remaining' (normally run on a background thread) reads the rest in dataset order, filling in
+    the tag trie as it goes. Operations spanning the whole dataset, such as queries, bulk edits and saving,
+    first wait for that load to finish. State shared with the loading thread is guarded by 'self.lock'.
+
+    Tag edits are kept on an undo stack as (op, tag, [(image id, position), ...]) entries, where 'position' is
+    where the tag was added or removed within each caption; 'undo' and 'redo' replay them. With 'journal' set,
+    every edit is also logged to a Journal in the dataset root until the next save or until the edits are discarded
+    ('discard_journal'), so a journal left behind by a session that crashed is replayed when the dataset is loaded.
+    """
 
-    def __init__(self, directory, win):
+    def __init__(
+        self,
+        directory,
+        missing_policy=skip_all_missing,
+        workers=None,
+        lazy=False,
+        journal=False,
+    ):
         self.directory = directory
-        self.win = win
-        self.cache = {}
-        self.tag_trie = Trie()
+        self.workers = workers
+        self.lazy = lazy
+        # held while captions, the tag indexes or the tag trie change, and by readers that need them consistent
+        self.lock = threading.RLock()
+        # set once every caption has been read, or once a stopped load has ended
+        self.loaded = threading.Event()
+        self.load_started = False
+        # set by 'stop_loading' to end a background load between batches
+        self.load_stop = threading.Event()
+        # number of leading images read while searching for the trigger word (see 'settle_trigger_word')
+        self.trigger_scan = 0
+        # functions called with (captions loaded, total) as a lazy dataset's background load advances
+        self.load_listeners = []
+        self.journal = Journal(directory) if journal else None
+        self.undo_stack = []
+        self.redo_stack = []
+        # compact store of every image path and caption, addressed by integer image id
+        self.table = ImageTable()
+        # .png path -> (.txt path, caption), read from and written through to 'self.table'
+        self.cache = CaptionCache(self.table)
+        # .png paths in dataset order
+        self.image_set = ImageSequence(self.table)
+        # integer id of each .png path: its position in 'self.image_set'
+        self.image_ids = ImageIds(self.table)
+        self.tag_trie = RadixTrie()
+        # finds tags containing a fragment anywhere; holds exactly the tags present in 'self.tag_trie'
+        self.tag_infix = InfixIndex()
         self.trigger_word = None
-        self.add_txt_queue = None
+        # .png paths found without a corresponding .txt file
+        self.missing_captions = []
+        self.load_report = IngestReport()
+        # CompactIndex of the dataset index file, once every caption is loaded
+        self.index = None
+        # .png paths whose captions were changed since the dataset was last saved
+        self.dirty = set()
+        # .png paths whose captions were changed at any point this session, saved or not
+        self.edited = set()
+        # .png paths whose .txt files lacked the trigger word when loaded, and have not been saved since
+        self.missing_trigger = set()
+        # functions called with a .png path whenever its caption, or its saved state, changes
+        self.listeners = []
+        # inverted index of each tag to the sorted array of ids of the images whose captions contain it
+        self.tag_images = {}
+        # per-tag bitsets over image ids, built from 'self.tag_images' as queries need them
+        self.tag_bitsets = BitsetCache(self.build_tag_bitset)
         if os.path.isdir(self.directory):
-            self.expand_dataset_recursive(self.directory)
-        # prompt user for action on .png files unaccompanied by .txt files
-        if self.add_txt_queue is not None and self.win.active_queue_win is None:
-            self.win.start_queue(
-                self.add_txt_queue, func_on_yes=self.add_dataset_element
-            )
-        while self.win.active_queue_win is not None:
-            pass
-        self.generate_tag_trie()
-        self.image_set = list(self.cache.keys())
+            self.expand_dataset(self.directory)
+        if len(self.missing_captions) > 0:
+            self.create_missing_captions(missing_policy(self.missing_captions))
+        if not lazy:
+            self.generate_tag_trie()
+            self.loaded.set()
+        if self.journal is not None:
+            self.replay_journal()
         self.display_index = 0
 
     def save_dataset(self):
+        """Writes every caption edited since the last save to its .txt file.
+
+        Captions are written concurrently by a bounded thread pool, each through 'write_caption_atomic'.
+        Once every caption is written, the journal is emptied. Returns a SaveSummary of the files and bytes written and the time taken.
+        """
         if len(self.cache) == 0:
             raise Exception("No images were found in the dataset cache.")
-        for key in self.cache:
-            self.save_caption_to_txt(key)
+        self.wait_until_loaded()
+        start = time.perf_counter()
+        # only the edited captions, in dataset order
+        pending = sorted(self.dirty, key=self.image_ids.get)
+        bytes_written = 0
+        if len(pending) > 0:
+            workers = min(self.workers or MAX_SAVE_WORKERS, MAX_SAVE_WORKERS)
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                for png_path, st in zip(
+                    pending, executor.map(self.save_caption_to_txt, pending)
+                ):
+                    self.dirty.discard(png_path)
+                    bytes_written += st.st_size
+                    if png_path in self.missing_trigger:
+                        self.missing_trigger.discard(png_path)
+                        self.notify(png_path)
+                    if self.index is not None:
+                        self.index.update(
+                            png_path,
+                            self.cache[png_path][0],
+                            (st.st_size, st.st_mtime_ns),
+                            self.cache[png_path][1].serialize(),
+                        )
+        if self.index is not None and self.index.modified:
+            self.index.save(unsaved=self.dirty)
+        if self.journal is not None:
+            # every journaled edit is now in the captions themselves
+            with self.lock:
+                self.journal.truncate()
+        return SaveSummary(len(pending), bytes_written, time.perf_counter() - start)
 
     def save_caption_to_txt(self, png_path):
+        """Writes the cached caption of png_path to its .txt file, returning the os.stat_result of the file"""
         txt_path = self.cache[png_path][0]
         if not os.path.isfile(txt_path):
             raise Exception("Supposed *.txt path is not a valid file")
-        print(
-            f"Saving caption for {str_tail_after(png_path, '/')} at {str_tail_after(txt_path, f'{str_tail_after(self.directory, '/')}/')}"
+        return write_caption_atomic(txt_path, self.cache[png_path][1].serialize())
+
+    def notify(self, png_path):
+        for listener in self.listeners:
+            listener(png_path)
+
+    def caption_changed(self, png_path):
+        self.dirty.add(png_path)
+        self.edited.add(png_path)
+        self.notify(png_path)
+
+    def caption_of(self, png_path):
+        """Returns the cached caption of png_path, or an empty Caption if it could not be read"""
+        return self.loaded_caption(png_path) or Caption()
+
+    def loaded_caption(self, png_path):
+        """Returns the cached caption of png_path, reading it first if a lazy dataset has not loaded it yet"""
+        caption = self.cache[png_path][1]
+        if caption is None and not self.loaded.is_set():
+            self.load_captions([self.image_ids[png_path]])
+            caption = self.cache[png_path][1]
+        return caption
+
+    def is_loaded(self):
+        return self.loaded.is_set()
+
+    def wait_until_loaded(self):
+        """Blocks until every caption is loaded, loading them on this thread if no background load has started"""
+        self.load_remaining()
+        self.loaded.wait()
+
+    def store_caption(self, key, txt_path, file_content, count_tags=False):
+        """Parses caption text read for an image and caches it, moving or inserting the trigger word as needed.
+
+        With 'count_tags' set, the tags of the text are also added to the tag trie.
+        """
+        caption = Caption.parse(file_content)
+        if count_tags:
+            for tag in caption:
+                self.try_add_trie_tag(tag)
+        # set a trigger word for this dataset if it hasn't been set already
+        if self.trigger_word is None:
+            self.trigger_word = caption.first()
+        if self.trigger_word is not None and self.trigger_word != caption.first():
+            print(
+                f"NOTICE: Trigger word '{self.trigger_word}' not found in file '{txt_path}.' Inserting for cache."
+            )
+            # move the trigger word to the beginning of the caption, so it exists nowhere else within
+            caption.insert(0, self.trigger_word)
+            self.dirty.add(key)
+            self.missing_trigger.add(key)
+        # add caption to dataset
+        self.cache[key] = (txt_path, caption)
+        for tag in caption:
+            self.index_caption_tag(tag, key)
+
+    def settle_trigger_word(self):
+        """Reads captions in dataset order until the trigger word is known.
+
+        The trigger word is the first tag of the first caption with any tags, so captions further on
+        can only be stored once it is settled.
+        """
+        with self.lock:
+            while self.trigger_word is None and self.trigger_scan < len(self.table):
+                i = self.trigger_scan
+                self.trigger_scan += 1
+                if self.table.captions[i] is not None:
+                    continue
+                result = read_captions([self.table.txt_path(i)])[0]
+                if result is not None:
+                    self.store_caption(
+                        self.image_set[i],
+                        self.table.txt_path(i),
+                        result[0],
+                        count_tags=True,
+                    )
+
+    def load_captions(self, ids):
+        """Reads the captions of the given image ids that a lazy dataset has not loaded yet.
+
+        Meant for the handful of images about to be shown; files are read on the calling thread.
+        Files that cannot be read are left for the background load to report.
+        """
+        if self.loaded.is_set():
+            return
+        self.settle_trigger_word()
+        ids = [i for i in ids if self.table.captions[i] is None]
+        if len(ids) == 0:
+            return
+        results = read_captions([self.table.txt_path(i) for i in ids])
+        with self.lock:
+            for i, result in zip(ids, results):
+                # the background load may have stored it meanwhile, and it may have been edited since
+                if result is None or self.table.captions[i] is not None:
+                    continue
+                self.store_caption(
+                    self.image_set[i],
+                    self.table.txt_path(i),
+                    result[0],
+                    count_tags=True,
+                )
+
+    def load_remaining(self):
+        """Reads every caption a lazy dataset has not loaded yet, in dataset order and in batches of LOAD_BATCH_SIZE.
+
+        Captions already cached, and possibly edited, are kept. The dataset index is read and brought up to date
+        along the way, as 'generate_tag_trie' does, and 'self.load_listeners' are told of the progress after each
+        batch. Returns at once if a load has already started on another thread.
+        A load ended early by 'stop_loading' leaves the dataset partly loaded and the index file untouched.
+        """
+        with self.lock:
+            if self.load_started or self.loaded.is_set():
+                return
+            self.load_started = True
+        try:
+            self.settle_trigger_word()
+            index = DatasetIndex.load(self.directory)
+            total = len(self.table)
+            retained = []
+            for start in range(0, total, LOAD_BATCH_SIZE):
+                if self.load_stop.is_set():
+                    return
+                ids = range(start, min(start + LOAD_BATCH_SIZE, total))
+                keys = [self.image_set[i] for i in ids]
+                txt_paths = [self.table.txt_path(i) for i in ids]
+                contents = self.read_indexed(index, keys, txt_paths)
+                with self.lock:
+                    for i, key, txt_path, file_content in zip(
+                        ids, keys, txt_paths, contents
+                    ):
+                        if file_content is None:
+                            continue
+                        retained.append(key)
+                        if self.table.captions[i] is None:
+                            self.store_caption(
+                                key, txt_path, file_content, count_tags=True
+                            )
+                for listener in self.load_listeners:
+                    listener(ids.stop, total)
+            index.retain(retained)
+            if index.modified:
+                index.save()
+            with self.lock:
+                self.index = index.compact(self.table)
+        finally:
+            self.loaded.set()
+
+    def stop_loading(self):
+        """Ends a background load after its current batch, for a dataset about to be discarded.
+
+        Threads waiting for the load (see 'wait_until_loaded') are released, and find the dataset partly loaded.
+        """
+        self.load_stop.set()
+
+    def read_indexed(self, index, keys, txt_paths):
+        """Returns the caption text of each .txt path, from the dataset index where the file is unchanged.
+
+        Files that are new or modified are read, concurrently, using up to 'self.workers' threads, and recorded
+        in the index. Files that cannot be read are recorded in 'self.load_report' and given None.
+        """
+        stats = stat_files(txt_paths, workers=self.workers)
+        contents = [
+            index.lookup(key, txt_path, st)
+            for key, txt_path, st in zip(keys, txt_paths, stats)
+        ]
+        stale = [i for i in range(len(keys)) if contents[i] is None]
+        results = read_captions(
+            [txt_paths[i] for i in stale], workers=self.workers, report=self.load_report
         )
-        with open(txt_path, "w") as file:
-            file.write(self.cache[png_path][1])
+        for i, result in zip(stale, results):
+            if result is None or stats[i] is None:
+                index.discard(keys[i])
+                continue
+            contents[i] = result[0]
+            index.update(keys[i], txt_paths[i], stats[i], result[0])
+        return contents
 
-    def try_add_trie_tag(self, tag):
+    def try_add_trie_tag(self, tag, count=1):
         if not tag.isspace():
-            self.tag_trie.add(tag)
+            self.tag_trie.add(tag, count)
+            self.tag_infix.add(tag)
 
-    def try_remove_trie_tag(self, tag):
+    def try_remove_trie_tag(self, tag, count=1):
         if not tag.isspace():
-            self.tag_trie.remove(tag)
+            self.tag_trie.remove(tag, count)
+            if not self.tag_trie.exists(tag):
+                self.tag_infix.remove(tag)
+
+    def merge_tag_deltas(self, deltas):
+        """Applies changes in tag counts, such as those gathered by a sharded edit, to the tag trie"""
+        with self.lock:
+            for tag, delta in deltas.items():
+                if delta > 0:
+                    self.try_add_trie_tag(tag, delta)
+                elif delta < 0:
+                    self.try_remove_trie_tag(tag, -delta)
+
+    def apply_written_captions(self, written):
+        """Brings cached captions up to date with captions rewritten on disk outside of the dataset.
+
+        Takes (txt_path, caption_text, (size, mtime_ns)) tuples, as gathered by a sharded edit, and updates the cache,
+        the tag-to-image index and the dataset index. The tag trie is left to 'merge_tag_deltas'.
+        The undo history is cleared, as the positions it records may no longer match the rewritten captions.
+        """
+        self.wait_until_loaded()
+        with self.lock:
+            self.undo_stack.clear()
+            self.redo_stack.clear()
+        for txt_path, text, st in written:
+            png_path = f"{os.path.splitext(txt_path)[0]}.png"
+            if png_path not in self.cache:
+                continue
+            with self.lock:
+                old = self.cache[png_path][1] or Caption()
+                new = Caption.parse(text)
+                for tag in old:
+                    if tag not in new:
+                        self.unindex_caption_tag(tag, png_path)
+                for tag in new:
+                    if tag not in old:
+                        self.index_caption_tag(tag, png_path)
+                self.cache[png_path] = (txt_path, new)
+            if self.index is not None:
+                self.index.update(png_path, txt_path, st, text)
+            self.edited.add(png_path)
+            self.notify(png_path)
+        if self.index is not None and self.index.modified:
+            self.index.save(unsaved=self.dirty)
+
+    def tags_containing(self, fragment):
+        """Returns every tag in the dataset containing fragment, most frequent first (ties alphabetically).
+
+        Useful for finding a whole family of related tags, e.g. every tag containing "hair".
+        """
+        with self.lock:
+            tags = self.tag_infix.containing(fragment)
+            return sorted(tags, key=lambda tag: (-self.tag_trie.get(tag), tag))
 
     def tag_in_caption(self, tag, index=None, png_path=None):
         """Returns whether or not the given tag is found within a specified caption.
@@ -61,75 +604,277 @@ class Dataset:
         """
         if index is None:
             index = self.display_index
-        if png_path is not None:
-            caption = self.cache[png_path][1]
+        if png_path is None:
+            png_path = self.image_set[index]
+        return tag in self.caption_of(png_path)
+
+    def images_with_tag(self, tag):
+        """Returns the set of .png paths whose captions contain the given tag"""
+        return {self.image_set[i] for i in self.tag_images.get(tag, ())}
+
+    def build_tag_bitset(self, tag):
+        return make_bitset(self.tag_images.get(tag, ()), len(self.image_set))
+
+    def query_ids(self, expression):
+        """Returns the ids of the images whose captions match a query (see 'Query'), in ascending order.
+
+        The query is evaluated with bitwise operations over per-tag bitsets, which are cached between queries.
+        """
+        query = Query.parse(expression)
+        self.wait_until_loaded()
+        bits = query.evaluate(self.tag_bitsets.get, len(self.image_set))
+        return bitset_members(bits)
+
+    def query(self, expression):
+        """Returns the .png paths of the images whose captions match a query, in dataset order"""
+        return [self.image_set[i] for i in self.query_ids(expression)]
+
+    def index_caption_tag(self, tag, png_path):
+        if tag not in self.tag_images:
+            self.tag_images[tag] = array("I")
+        insert_sorted(self.tag_images[tag], self.image_ids[png_path])
+        self.tag_bitsets.invalidate(tag)
+
+    def unindex_caption_tag(self, tag, png_path):
+        images = self.tag_images.get(tag)
+        if images is None:
+            return
+        remove_sorted(images, self.image_ids[png_path])
+        self.tag_bitsets.invalidate(tag)
+        if len(images) == 0:
+            del self.tag_images[tag]
+
+    def bulk_edit(self, action, tag, targets=None):
+        """Prepares a BulkTagEdit that adds ('add') or removes ('remove') tag across many captions.
+
+        'targets' is an iterable of .png paths, defaulting to the whole dataset.
+        Only captions the edit would change are targeted: those without the tag for an addition,
+        those with it for a removal. Images whose caption could not be read are never targeted.
+        """
+        self.wait_until_loaded()
+        tagged = self.tag_images.get(tag, ())
+        image_ids = self.image_ids
+        if action == "remove" and targets is None:
+            targets = [self.image_set[i] for i in tagged]
         else:
-            caption = self.cache[self.image_set[index]][1]
-        search = "," + caption.replace(", ", ",").strip()
-        return f",{tag}," in search
+            # membership in a set is O(1), where the sorted array would need a bisection per target
+            tagged = set(tagged)
+            if action == "add":
+                if targets is None:
+                    targets = self.cache
+                captions = self.table.captions
+                targets = [
+                    key
+                    for key in targets
+                    if image_ids[key] not in tagged
+                    and captions[image_ids[key]] is not None
+                ]
+            else:
+                targets = [key for key in targets if image_ids[key] in tagged]
+        return BulkTagEdit(self, action, tag, targets)
+
+    def record_edit(self, op, tag, changes):
+        """Records an edit made to the captions on the undo stack and in the journal, clearing the redo stack.
+
+        'op' is "add" or "remove", and changes is a list of (png_path, position) pairs.
+        """
+        ids = [(self.image_ids[png_path], position) for png_path, position in changes]
+        with self.lock:
+            self.undo_stack.append((op, tag, ids))
+            self.redo_stack.clear()
+            if self.journal is not None:
+                self.journal.append(op, tag, changes)
+
+    def apply_edit(self, op, tag, changes):
+        """Adds tag at the recorded positions ("add"), or removes it ("remove"), for (image id, position) pairs"""
+        for i, position in changes:
+            png_path = self.image_set[i]
+            if op == "add":
+                self.insert_tag_into_image_caption(
+                    tag, png_path, position, record=False
+                )
+            else:
+                self.remove_tag_from_image_caption(tag, png_path=png_path, record=False)
+
+    def log_edit(self, op, tag, changes):
+        """Appends an edit given as (image id, position) pairs to the journal, if the dataset keeps one"""
+        if self.journal is not None:
+            self.journal.append(
+                op, tag, [(self.image_set[i], position) for i, position in changes]
+            )
+
+    def undo_edit(self):
+        """Returns a HistoryEdit reverting the most recent edit on the undo stack, or None if there is none.
+
+        The edit is moved to the redo stack at once; the captions change as the HistoryEdit is run or stepped.
+        """
+        with self.lock:
+            if len(self.undo_stack) == 0:
+                return None
+            edit = self.undo_stack.pop()
+            self.redo_stack.append(edit)
+        return HistoryEdit(self, edit, undo=True)
 
-    def add_tag_to_image_caption(self, tag, png_path=None, all=False):
+    def redo_edit(self):
+        """Returns a HistoryEdit making again the most recently undone edit, or None if there is none.
+
+        The edit is moved back to the undo stack at once; the captions change as the HistoryEdit is run or stepped.
+        """
+        with self.lock:
+            if len(self.redo_stack) == 0:
+                return None
+            edit = self.redo_stack.pop()
+            self.undo_stack.append(edit)
+        return HistoryEdit(self, edit, undo=False)
+
+    def undo(self):
+        """Reverts the most recent edit on the undo stack, returning it as (op, tag, changes), or None if there is none"""
+        history = self.undo_edit()
+        if history is None:
+            return None
+        history.run()
+        return history.edit
+
+    def redo(self):
+        """Makes again the most recently undone edit, returning it as (op, tag, changes), or None if there is none"""
+        history = self.redo_edit()
+        if history is None:
+            return None
+        history.run()
+        return history.edit
+
+    def flush_journal(self):
+        if self.journal is not None:
+            with self.lock:
+                self.journal.flush()
+
+    def journal_disabled(self):
+        """Returns whether the dataset's journal stopped after failing to write its file"""
+        return self.journal is not None and self.journal.disabled
+
+    def has_unsaved_edits(self):
+        """Returns whether tags were edited since the last save.
+
+        Captions that only had the trigger word inserted when they were loaded do not count.
+        """
+        with self.lock:
+            if self.journal is not None and not self.journal.empty():
+                return True
+            return any(key not in self.missing_trigger for key in self.dirty)
+
+    def discard_journal(self):
+        """Empties the journal without saving, so the edits it holds are not restored the next time the dataset is loaded"""
+        if self.journal is not None:
+            with self.lock:
+                self.journal.truncate()
+
+    def replay_journal(self):
+        """Re-applies the edits logged in the journal by a session that ended without saving them.
+
+        The replayed edits stay in the journal until the next save, and are placed on the undo stack.
+        """
+        entries = self.journal.read()
+        for op, tag, images in entries:
+            changes = [
+                (self.image_ids[png_path], position)
+                for png_path, position in images
+                if png_path in self.image_ids
+            ]
+            self.apply_edit(op, tag, changes)
+            self.undo_stack.append((op, tag, changes))
+        if len(entries) > 0:
+            print(f"Restored {len(entries)} unsaved edit(s) from the journal.")
+
+    def add_tag_to_image_caption(self, tag, png_path=None, all=False, record=True):
+        """Adds a tag to the caption of png_path, or to every caption if 'all' is set.
+
+        Returns whether any caption changed. Unless 'record' is cleared, the edit can be undone (see 'record_edit').
+        """
         if all:
-            for key in self.cache:
-                self.add_tag_to_image_caption(tag, png_path=key, all=False)
-            return
+            edit = self.bulk_edit("add", tag)
+            edit.run()
+            return len(edit.changes) > 0
         if not png_path:
             raise ValueError(
                 "a .png path must be provided for the addition of a single tag to a corresponding .txt file"
             )
-        if self.tag_in_caption(tag, png_path=png_path):
-            return
-        caption = self.cache[png_path][1]
-        txt_path = self.cache[png_path][0]
-        if caption.endswith(","):
-            self.cache[png_path] = (txt_path, (caption + f" {tag}, "))
-        else:
-            self.cache[png_path] = (txt_path, (caption + f"{tag}, "))
-        self.try_add_trie_tag(tag)
+        with self.lock:
+            caption = self.loaded_caption(png_path)
+            if not caption.add(tag):
+                return False
+            self.index_caption_tag(tag, png_path)
+            self.try_add_trie_tag(tag)
+        self.caption_changed(png_path)
+        if record:
+            self.record_edit("add", tag, [(png_path, len(caption) - 1)])
+        return True
+
+    def insert_tag_into_image_caption(self, tag, png_path, position, record=True):
+        """Adds a tag to the caption of png_path at the given position. Returns whether the caption changed."""
+        with self.lock:
+            caption = self.loaded_caption(png_path)
+            if tag in caption:
+                return False
+            caption.insert(position, tag)
+            self.index_caption_tag(tag, png_path)
+            self.try_add_trie_tag(tag)
+        self.caption_changed(png_path)
+        if record:
+            self.record_edit("add", tag, [(png_path, caption.index(tag))])
+        return True
 
-    def remove_tag_from_image_caption(self, tag, png_path=None, all=False):
+    def remove_tag_from_image_caption(self, tag, png_path=None, all=False, record=True):
+        """Removes a tag from the caption of png_path, or from every caption if 'all' is set.
+
+        Returns whether any caption changed. Unless 'record' is cleared, the edit can be undone (see 'record_edit').
+        """
         if all:
-            for key in self.cache:
-                self.remove_tag_from_image_caption(tag, png_path=key, all=False)
-            return
+            edit = self.bulk_edit("remove", tag)
+            edit.run()
+            return len(edit.changes) > 0
         if not png_path:
             raise ValueError(
                 "a .png path must be provided for the removal of a single tag from a corresponding .txt file"
             )
-        if not self.tag_in_caption(tag, png_path=png_path):
-            return
-        txt_path = self.cache[png_path][0]
-        caption = self.cache[png_path][1]
-        self.cache[png_path] = (
-            txt_path,
-            (caption.replace(f", {tag}, ", ", ").replace(f", {tag},", ", ")),
-        )
-        self.try_remove_trie_tag(tag)
+        with self.lock:
+            caption = self.loaded_caption(png_path)
+            position = caption.index(tag)
+            if not caption.remove(tag):
+                return False
+            self.unindex_caption_tag(tag, png_path)
+            self.try_remove_trie_tag(tag)
+        self.caption_changed(png_path)
+        if record:
+            self.record_edit("remove", tag, [(png_path, position)])
+        return True
 
-    def expand_dataset_recursive(self, path):
+    def expand_dataset(self, path):
         """Given a directory, loads files within as a dataset.
 
-        Takes a directory, then searches for files with .png extensions within. Recursively calls on directories.
-        For each one found, an identically-named file with a .txt extension is sought.
-        For each .png file without a corresponding .txt file, users are asked whether they'd like one generated.
-            Users are only asked after all others are built.
-            If the user chooses not to generate for a given file, the .png is discarded from the dataset.
-            Users may select "Yes to All" in this popup menu to avoid choosing for each .png file missing a .txt.
-        The property 'self.cache' is built as a dictionary of .png paths corresponding with tuple pairings
-          of .txt paths and their contents (captions, separated by commas) in cache.
-        """
-        if not os.path.isfile(path):
-            subpaths = os.listdir(path)
-            if len(subpaths) > 0:
-                for s in subpaths:
-                    self.expand_dataset_recursive(os.path.join(path, s))
-        elif path.endswith(".png"):
-            if os.path.isfile(path.replace(".png", ".txt")):
-                self.add_dataset_element(path)
-            else:
-                if self.add_txt_queue is None:
-                    self.add_txt_queue = Queue()
-                self.add_txt_queue.push(path)
+        Takes a directory, then searches the whole hierarchy beneath it for files with .png extensions in a single pass.
+        For each one found, an identically-named file with a .txt extension is sought within the same directory.
+        Each .png file without a corresponding .txt file is recorded in 'self.missing_captions',
+          to be settled by the dataset's missing-caption policy once the whole hierarchy is scanned.
+        The property 'self.cache' is built as a mapping of .png paths corresponding with tuple pairings
+          of .txt paths and their contents (Caption objects holding the tags of each caption) in cache.
+        """
+        pairs, missing = scan_dataset(path)
+        for png_path, txt_path in pairs:
+            if png_path not in self.cache:
+                self.cache[png_path] = (txt_path, None)
+        print(
+            f"Found {len(pairs)} training pairs under {str_tail_after(path, '/')} ({len(missing)} images without captions)."
+        )
+        self.missing_captions.extend(missing)
+
+    def create_missing_captions(self, png_paths):
+        """Creates an empty .txt caption for each given .png path, and adds the pair to the dataset"""
+        for png_path in png_paths:
+            create_empty_caption(png_path)
+            self.add_dataset_element(png_path)
+        self.missing_captions = [
+            png_path for png_path in self.missing_captions if png_path not in self.cache
+        ]
 
     def add_dataset_element(self, png_path):
         """Given a path to a png file, adds existing txt file of the same name, or else returns an error"""
@@ -138,7 +883,7 @@ class Dataset:
                 f"Skipping {str_tail_after(png_path, f'{self.directory}/')} (already in dataset)."
             )
             return
-        txt_path = png_path.replace(".png", ".txt")
+        txt_path = caption_path(png_path)
         if os.path.isfile(txt_path):
             self.cache[png_path] = (txt_path, None)
             print(
@@ -152,40 +897,31 @@ class Dataset:
     def generate_tag_trie(self):
         """Populates tag trie and captions for the dataset.
 
-        Reads each .txt file and populates the 'self.tag_trie' property with their contents.
-        The tag trie also stores an integer associated with each tag representing the number of times it appears in the dataset.
-        Also creates a cache for caption editing.
+        Captions whose .txt file is unchanged since the last session are taken from the dataset index
+        (see 'DatasetIndex'); only new or modified files are read, concurrently, using up to 'self.workers' threads.
+        Captions are then cached in dataset order, so the result does not depend on which file finished reading first.
+        The 'self.tag_trie' property is populated from the tag counts kept by the index;
+        the tag trie stores an integer associated with each tag representing the number of times it appears in the dataset.
+        Files that cannot be read are recorded in 'self.load_report' and left without a caption.
         """
         if len(self.cache) == 0:
             raise Exception(
                 "nothing exists in the '.png_path : (.txt_path, caption)' dataset property"
             )
-        for key in self.cache:
-            txt_path = self.cache[key][0]
-            if not txt_path:
-                continue
-            try:
-                with open(txt_path, "r") as file:
-                    file_content = file.read().strip()
-                # eliminate all whitespace and delimit at commas to get a list of tags for this caption
-                caption_tags = file_content.replace(", ", ",").split(",")
-                # set a trigger word for this dataset if it hasn't been set already
-                if self.trigger_word is None:
-                    self.trigger_word = caption_tags[0]
-                if self.trigger_word != caption_tags[0]:
-                    print(
-                        f"NOTICE: Trigger word '{self.trigger_word}' not found in file '{txt_path}.' Inserting for cache."
-                    )
-                    # ensure the trigger word does not exist anywhere ELSE within the caption
-                    file_content = file_content.replace(f"{self.trigger_word}", f"")
-                    # add the trigger word to the beginning of the caption
-                    file_content = f"{self.trigger_word}, " + file_content.strip()
-                # add caption to dataset
-                self.cache[key] = (txt_path, file_content)
-                # add all tags to the tag trie
-                for tag in caption_tags:
-                    self.try_add_trie_tag(tag)
-            except FileNotFoundError:
-                print(f"Error: The file '{txt_path}' was not found.")
-            except Exception as e:
-                print(f"An error occurred: {e}")
+        index = DatasetIndex.load(self.directory)
+        keys = [key for key in self.cache if self.cache[key][0]]
+        txt_paths = [self.cache[key][0] for key in keys]
+        contents = self.read_indexed(index, keys, txt_paths)
+        index.retain(
+            [key for key, content in zip(keys, contents) if content is not None]
+        )
+        for key, txt_path, file_content in zip(keys, txt_paths, contents):
+            if file_content is not None:
+                self.store_caption(key, txt_path, file_content)
+        # add all tags to the tag trie
+        for tag, count in index.tag_counts.items():
+            self.try_add_trie_tag(tag, count)
+        if index.modified:
+            index.save()
+        # the captions are now cached in the table, so the index need not hold them too
+        self.index = index.compact(self.table)
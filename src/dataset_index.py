@@ -0,0 +1,236 @@
+from caption import split_tags
+from collections import Counter
+from array import array
+import json
+import os
+
+INDEX_FILENAME = ".tagman_index.json"
+INDEX_VERSION = 2
+# entries serialized at a time when a CompactIndex is saved
+SAVE_CHUNK_SIZE = 4096
+
+
+def replace_index_file(index, write):
+    """Writes an index file through write(file) to a temporary file, then moves it over the previous one.
+
+    An OSError, as on a read-only or full volume, is reported once, after which the index is kept in memory only
+    and later saves do nothing. Returns whether the file was written.
+    """
+    if not index.persistent:
+        return False
+    tmp_path = f"{index.path}.tmp"
+    try:
+        with open(tmp_path, "w") as file:
+            write(file)
+        os.replace(tmp_path, index.path)
+    except OSError as e:
+        index.persistent = False
+        print(
+            f"Could not write the dataset index '{index.path}' ({e}); captions will be re-read next time."
+        )
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        return False
+    index.modified = False
+    return True
+
+
+class DatasetIndex:
+    """Persistent record of a dataset's captions, kept in the dataset root between sessions.
+
+    For every .png path, the index stores its .txt path, the size and modification time of the .txt file
+    when it was last read, and the caption text read from it. It also keeps the number of captions each
+    tag appears in across all entries, so the tag trie can be rebuilt without re-reading any caption.
+    Paths are stored relative to the dataset root.
+    Once a dataset has cached every caption, it replaces its index with a CompactIndex (see 'compact').
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = os.path.join(directory, INDEX_FILENAME)
+        self.prefix = os.path.join(directory, "")
+        # .png path -> [.txt path, size, mtime_ns, caption]
+        self.entries = {}
+        self.tag_counts = {}
+        self.modified = False
+        # cleared once the index file cannot be written (see 'replace_index_file')
+        self.persistent = True
+
+    @classmethod
+    def load(cls, directory):
+        """Reads the index of a dataset root, or returns an empty index if none can be used"""
+        index = cls(directory)
+        try:
+            with open(index.path, "r") as file:
+                data = json.load(file)
+        except FileNotFoundError:
+            return index
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable dataset index '{index.path}': {e}")
+            return index
+        if not isinstance(data, dict) or data.get("version") != INDEX_VERSION:
+            print(f"Ignoring dataset index '{index.path}' of an unsupported version.")
+            return index
+        index.entries = data["entries"]
+        index.tag_counts = data["tag_counts"]
+        return index
+
+    def save(self):
+        """Writes the index through 'replace_index_file'. Returns whether it was written."""
+        data = {
+            "version": INDEX_VERSION,
+            "entries": self.entries,
+            "tag_counts": self.tag_counts,
+        }
+        return replace_index_file(
+            self, lambda file: json.dump(data, file, separators=(",", ":"))
+        )
+
+    def relative(self, path):
+        if path.startswith(self.prefix):
+            return path[len(self.prefix) :]
+        return os.path.relpath(path, self.directory)
+
+    def lookup(self, png_path, txt_path, stat):
+        """Returns the indexed caption for png_path, or None if its .txt file changed since it was indexed"""
+        entry = self.entries.get(self.relative(png_path))
+        if entry is None or stat is None:
+            return None
+        if entry[0] != self.relative(txt_path) or (entry[1], entry[2]) != stat:
+            return None
+        return entry[3]
+
+    def update(self, png_path, txt_path, stat, caption):
+        """Records the caption read from (or written to) txt_path along with the file's (size, mtime_ns)"""
+        key = self.relative(png_path)
+        self.discard(png_path)
+        self.entries[key] = [self.relative(txt_path), stat[0], stat[1], caption]
+        for tag in split_tags(caption):
+            self.tag_counts[tag] = self.tag_counts.get(tag, 0) + 1
+        self.modified = True
+
+    def discard(self, png_path):
+        """Removes an entry from the index, along with its contribution to the tag counts"""
+        entry = self.entries.pop(self.relative(png_path), None)
+        if entry is None:
+            return
+        for tag in split_tags(entry[3]):
+            if tag not in self.tag_counts:
+                continue
+            if self.tag_counts[tag] > 1:
+                self.tag_counts[tag] -= 1
+            else:
+                del self.tag_counts[tag]
+        self.modified = True
+
+    def retain(self, png_paths):
+        """Discards every entry whose .png path is not among png_paths"""
+        keep = set(self.relative(png_path) for png_path in png_paths)
+        for key in [key for key in self.entries if key not in keep]:
+            self.discard(os.path.join(self.directory, key))
+
+    def compact(self, table):
+        """Returns a CompactIndex of the entries, for a dataset whose captions are all cached in an ImageTable"""
+        index = CompactIndex(self.directory, table)
+        for key, entry in self.entries.items():
+            i = table.id_of(os.path.join(self.directory, key))
+            if i is not None and entry[0] == self.relative(table.txt_path(i)):
+                index.sizes[i] = entry[1]
+                index.mtimes[i] = entry[2]
+        index.modified = self.modified
+        index.persistent = self.persistent
+        return index
+
+
+class CompactIndex:
+    """The dataset index of a loaded dataset, holding only the size and modification time of each indexed file.
+
+    A DatasetIndex keeps every relative path and the full caption text in memory, though a loaded dataset already
+    holds the same paths and captions in its ImageTable. The compact form keeps one (size, mtime_ns) pair per image
+    id, and rebuilds the index file from the table when saved.
+    """
+
+    def __init__(self, directory, table):
+        self.directory = directory
+        self.path = os.path.join(directory, INDEX_FILENAME)
+        self.prefix = os.path.join(directory, "")
+        self.table = table
+        # size of each image's .txt file when indexed, by image id; -1 for images without an entry
+        self.sizes = array("q", [-1]) * len(table)
+        self.mtimes = array("q", [0]) * len(table)
+        self.modified = False
+        self.persistent = True
+
+    def relative(self, path):
+        if path.startswith(self.prefix):
+            return path[len(self.prefix) :]
+        return os.path.relpath(path, self.directory)
+
+    def update(self, png_path, txt_path, stat, caption):
+        """Records the (size, mtime_ns) of a caption just written; the caption text is taken from the table on save"""
+        i = self.table.id_of(png_path)
+        if i is None:
+            return
+        while len(self.sizes) <= i:
+            self.sizes.append(-1)
+            self.mtimes.append(0)
+        self.sizes[i] = stat[0]
+        self.mtimes[i] = stat[1]
+        self.modified = True
+
+    def discard(self, png_path):
+        i = self.table.id_of(png_path)
+        if i is not None and i < len(self.sizes) and self.sizes[i] >= 0:
+            self.sizes[i] = -1
+            self.modified = True
+
+    def save(self, unsaved=()):
+        """Writes the index file, in the format of a DatasetIndex, from the captions cached in the table.
+
+        Captions in 'unsaved' (.png paths whose cached caption differs from the file) are left out of the file,
+        so that they are read again the next time the dataset is loaded. Entries are serialized SAVE_CHUNK_SIZE
+        at a time, so the text of the whole index is never held in memory at once.
+        Returns whether the file was written (see 'replace_index_file').
+        """
+        table = self.table
+        tags = table.vocabulary.tags
+        skip = set(table.id_of(png_path) for png_path in unsaved)
+        ids = [
+            i
+            for i in range(len(self.sizes))
+            if self.sizes[i] >= 0 and table.captions[i] is not None and i not in skip
+        ]
+        prefixes = {}
+        tag_counts = Counter()
+
+        def write(file):
+            file.write(f'{{"version":{INDEX_VERSION},"entries":{{')
+            for start in range(0, len(ids), SAVE_CHUNK_SIZE):
+                chunk = {}
+                for i in ids[start : start + SAVE_CHUNK_SIZE]:
+                    p = table.prefix_of[i]
+                    if p not in prefixes:
+                        prefixes[p] = self.relative(table.prefixes[p])
+                    stem = f"{prefixes[p]}{table.stems[i]}"
+                    caption = table.captions[i]
+                    tag_counts.update(caption)
+                    chunk[f"{stem}.png"] = [
+                        f"{stem}.txt",
+                        self.sizes[i],
+                        self.mtimes[i],
+                        ", ".join([tags[j] for j in caption]),
+                    ]
+                if start > 0:
+                    file.write(",")
+                file.write(json.dumps(chunk, separators=(",", ":"))[1:-1])
+            file.write('},"tag_counts":')
+            json.dump(
+                {tags[j]: count for j, count in tag_counts.items()},
+                file,
+                separators=(",", ":"),
+            )
+            file.write("}")
+
+        return replace_index_file(self, write)
@@ -16,20 +16,58 @@ from tkinter import (
     Text,
     Entry,
     filedialog,
+    messagebox,
     StringVar,
     IntVar,
     Checkbutton,
 )
-from PIL import Image, ImageTk
+from PIL import ImageTk
 from tags import TagBox
 from dataset import Dataset
+from structures import Queue
+from image_cache import ImageCache
+from preview_cache import PreviewCache
+from tasks import TaskRunner
+from shards import ShardedDatasetEdit
+from batch import AddTag, RemoveTag
+from views import ALL_IMAGES, DatasetViews
+from stats import TagStats
 from log_format import str_tail_after
+from concurrent.futures import ThreadPoolExecutor
+from queue import Empty, SimpleQueue
 import os
 
+# number of images on either side of the current one decoded ahead of navigation
+PREFETCH_RADIUS = 3
+# number of images on either side of the current one whose captions are read ahead while a dataset is still loading
+CAPTION_READ_AHEAD = 16
+
+# interval at which the Tk thread checks on background work, only while some is outstanding
+POLL_INTERVAL_MS = 50
+
+# interval at which edits logged to the dataset's journal are flushed to disk
+JOURNAL_FLUSH_MS = 1000
+
+# typed tags at least this long are also matched against existing tags within an edit distance of 1
+FUZZY_MIN_LENGTH = 3
+# typed tags at least this long are matched within an edit distance of 2
+FUZZY_WIDE_LENGTH = 6
+
+# number of tags suggested for the current caption from tag co-occurrence
+RECOMMENDATION_COUNT = 6
+
+# dataset-wide edits of at least this many captions may instead be written straight to disk by worker processes
+SHARDED_EDIT_MIN_CAPTIONS = 100000
+
 
 class Window:
     def __init__(self, gui_width, gui_height, title="Tagman", is_child=False):
         self.__is_running = False
+        self.__is_child = is_child
+        self.__background_executor = None
+        self.__background_jobs = []
+        self.__ui_calls = SimpleQueue()
+        self.__polling = False
         if is_child:
             self.__root = Toplevel()
         else:
@@ -50,18 +88,98 @@ class Window:
         self.__root.update()
 
     def wait_for_close(self):
+        """Processes events until the window is closed, sleeping in Tk's event loop while idle"""
         self.__is_running = True
-        while self.__is_running:
-            self.redraw()
-        print("Window closed.")
+        if self.__is_child:
+            if self.__root.winfo_exists():
+                self.__root.wait_window()
+        else:
+            self.__root.mainloop()
+            print("Window closed.")
+
+    def schedule(self, delay_ms, func, *args):
+        """Calls func(*args) on the Tk thread after delay_ms; returns an id for 'cancel_scheduled'"""
+        return self.__root.after(delay_ms, func, *args)
+
+    def cancel_scheduled(self, after_id):
+        self.__root.after_cancel(after_id)
+
+    def bind_shortcut(self, sequence, func):
+        """Calls func() whenever the key sequence is pressed anywhere in the window"""
+        self.__root.bind(sequence, lambda event: func())
+
+    def run_in_background(self, func, on_done=None, own_thread=False):
+        """Runs func on a worker thread, then calls on_done(result) on the Tk thread once it completes.
+
+        With 'own_thread' set, func runs on a thread of its own rather than in the shared pool, for long work
+        such as loading a dataset that jobs in the pool may wait on.
+        Returns the concurrent.futures.Future of the call.
+        """
+        if own_thread:
+            executor = ThreadPoolExecutor(max_workers=1)
+            future = executor.submit(func)
+            # the thread exits once func returns
+            executor.shutdown(wait=False)
+        else:
+            if self.__background_executor is None:
+                self.__background_executor = ThreadPoolExecutor(max_workers=2)
+            future = self.__background_executor.submit(func)
+        self.__background_jobs.append((future, on_done))
+        self.start_polling()
+        return future
+
+    def call_on_ui_thread(self, func, *args):
+        """Queues func(*args) to be called on the Tk thread; safe to call from any thread.
+
+        Queued calls are made while background work started with 'run_in_background' is outstanding.
+        """
+        self.__ui_calls.put((func, args))
+
+    def start_polling(self):
+        if not self.__polling:
+            self.__polling = True
+            self.schedule(POLL_INTERVAL_MS, self.poll_background)
+
+    def poll_background(self):
+        """Makes the queued UI calls and delivers finished background jobs to their on_done callbacks.
+
+        A failing call or job is reported and skipped, so the others are still delivered and polling carries on.
+        """
+        try:
+            while True:
+                try:
+                    func, args = self.__ui_calls.get_nowait()
+                except Empty:
+                    break
+                try:
+                    func(*args)
+                except Exception as e:
+                    print(f"Error: {e}")
+            finished = [job for job in self.__background_jobs if job[0].done()]
+            self.__background_jobs = [
+                job for job in self.__background_jobs if not job[0].done()
+            ]
+            for future, on_done in finished:
+                try:
+                    result = future.result()
+                    if on_done is not None:
+                        on_done(result)
+                except Exception as e:
+                    print(f"Background operation failed: {e}")
+        finally:
+            if len(self.__background_jobs) > 0 or not self.__ui_calls.empty():
+                self.schedule(POLL_INTERVAL_MS, self.poll_background)
+            else:
+                self.__polling = False
 
     def start_queue(self, queue, func_on_yes=None):
-        self.active_queue_win = AddTxtQueueWin(
-            300, 125, queue, self, func_on_yes=func_on_yes
-        )
-        self.active_queue_win.progress()
-        # MAINLOOP
-        self.active_queue_win.wait_for_close()
+        """Prompts the user on each item of the queue, returning once the prompt window is closed"""
+        queue_win = AddTxtQueueWin(300, 125, queue, self, func_on_yes=func_on_yes)
+        self.active_queue_win = queue_win
+        queue_win.progress()
+        if self.active_queue_win is not None:
+            queue_win._Window__root.grab_set()
+            queue_win.wait_for_close()
 
     def end_queue(self):
         self.active_queue_win.close()
@@ -69,6 +187,8 @@ class Window:
 
     def close(self):
         self.__is_running = False
+        if self.__background_executor is not None:
+            self.__background_executor.shutdown(wait=False, cancel_futures=True)
         self.__root.destroy()
 
     def on_resize(self, event):
@@ -115,8 +235,6 @@ class AddTxtQueueWin(Window):
         print(f"Choose 'Yes' or 'No' for the current queue item: {self.current}")
 
     def confirm_yes(self):
-        with open(f"{self.current.replace('.png', '.txt')}", "x"):
-            pass
         self.func_on_yes(self.current)
         self.progress()
 
@@ -157,8 +275,26 @@ class TagManagerWin(Window):
     def __init__(self, gui_width, gui_height, title="Tagman"):
         super().__init__(gui_width, gui_height, title="Tagman")
         self.tag_btlist = []
+        # hidden tagboxes kept for reuse
+        self.tagbox_pool = []
         self.dataset = None
         self.current_display_image = None
+        self.current_display_path = None
+        # navigation views of the loaded dataset
+        self.views = None
+        # tag statistics of the loaded dataset, or None if they are unavailable
+        self.stats = None
+        self.stats_building = False
+        self.preview_cache = PreviewCache()
+        self.image_cache = ImageCache(loader=self.preview_cache.load)
+        self.task_runner = TaskRunner(
+            self, on_progress=self.show_task_progress, on_finish=self.end_task
+        )
+        self.journal_flush_id = None
+        for sequence in ("<Control-z>", "<Control-Z>"):
+            self.bind_shortcut(sequence, self.undo)
+        for sequence in ("<Control-y>", "<Control-Y>"):
+            self.bind_shortcut(sequence, self.redo)
 
         def build_info_pane():
             self.__p_info = Frame(
@@ -180,6 +316,13 @@ class TagManagerWin(Window):
             self.__l_info.pack(side=LEFT)
             self.__l_index_counter = Label(self.__p_info, text="N/A")
             self.__l_index_counter.pack(side=RIGHT, padx=5)
+            # progress of dataset-wide tasks; only shown while one is running
+            self.__bt_cancel_task = Button(
+                self.__p_info, text="Cancel", command=self.task_runner.cancel
+            )
+            self.__pb_task = ttk.Progressbar(
+                self.__p_info, orient="horizontal", length=150, mode="determinate"
+            )
 
         def build_dataset_pane():
             self.__p_hrzbox = Frame(self._Window__p_master)
@@ -214,6 +357,51 @@ class TagManagerWin(Window):
                 self.__nbk_tagmodes_tab3, text="Save Dataset", command=self.save_dataset
             )
             self.__bt_savedataset.pack(padx=5, pady=5)
+            self.__bt_buildpreviews = Button(
+                self.__nbk_tagmodes_tab3,
+                text="Build Preview Cache",
+                command=self.build_previews,
+            )
+            self.__bt_buildpreviews.pack(padx=5, pady=5)
+            # restrict navigation and dataset-wide edits to a view of the dataset
+            self.__p_view = Frame(self.__nbk_tagmodes_tab3)
+            self.__p_view.pack(padx=5, pady=5)
+            Label(self.__p_view, text="View:").pack(side=LEFT)
+            self.view_name = StringVar(value=ALL_IMAGES)
+            self.__cb_view = ttk.Combobox(
+                self.__p_view, textvariable=self.view_name, state="readonly", width=40
+            )
+            self.__cb_view.pack(side=LEFT)
+            self.__cb_view.bind(
+                "<<ComboboxSelected>>",
+                lambda event: self.select_view(self.view_name.get()),
+            )
+            self.__p_query = Frame(self.__nbk_tagmodes_tab3)
+            self.__p_query.pack(padx=5, pady=5)
+            Label(self.__p_query, text="Query:").pack(side=LEFT)
+            self.query_text = StringVar()
+            self.__txt_query = Entry(
+                self.__p_query, textvariable=self.query_text, width=40
+            )
+            self.__txt_query.pack(side=LEFT)
+            self.__txt_query.bind("<Return>", lambda event: self.apply_query())
+            Button(self.__p_query, text="Filter", command=self.apply_query).pack(
+                side=LEFT
+            )
+            Button(self.__p_query, text="Clear", command=self.clear_query).pack(
+                side=LEFT
+            )
+            # statistics panel, filled in the background on request
+            self.__bt_stats = Button(
+                self.__nbk_tagmodes_tab3,
+                text="Refresh Statistics",
+                command=self.refresh_statistics,
+            )
+            self.__bt_stats.pack(padx=5, pady=5)
+            self.__stats_txt_field = Text(
+                self.__nbk_tagmodes_tab3, wrap=WORD, height=20, state="disabled"
+            )
+            self.__stats_txt_field.pack(fill=BOTH, expand=True, padx=5, pady=5)
             self.__caption_txt_field = Text(
                 self.__nbk_tagmodes_tab2, wrap=WORD, state="disabled"
             )
@@ -237,6 +425,13 @@ class TagManagerWin(Window):
                 ).pack(side=LEFT, fill=X, ipady=5)
             self.__p_tag_container = Frame(self.__nbk_tagmodes_tab1)
             self.__p_tag_container.pack(anchor="sw", padx=5, pady=5)
+            # tags suggested for the current caption; clicking one adds it to the caption
+            self.__p_recommend = Frame(self.__nbk_tagmodes_tab1)
+            self.__p_recommend.pack(anchor="sw", padx=5, pady=5)
+            self.__l_recommend = Label(self.__p_recommend, text="Suggested:")
+            self.__recommend_bts = [
+                Button(self.__p_recommend) for _ in range(RECOMMENDATION_COUNT)
+            ]
 
             # pane for singular tag entry
             self.__p_tagger = Frame(self.__p_editor)
@@ -287,6 +482,16 @@ class TagManagerWin(Window):
                     value=value,
                 )
                 new_bt.pack(side=LEFT, fill=X, ipady=5)
+            # allow users to suggest tags containing the entry text anywhere, not just at the start
+            self.infix_mode = IntVar(self.__p_radio_bts, 0)
+            Checkbutton(
+                self.__p_radio_bts,
+                text="Match Anywhere",
+                variable=self.infix_mode,
+                onvalue=1,
+                offvalue=0,
+                command=lambda: self.trace_tag_entry(None, None, None),
+            ).pack(side=LEFT, fill=X, ipady=5)
 
             # expose a box for tag suggestions based on existing tag entry text
             self.__autofill_box = SuggestBox(self.__p_editor, color="red")
@@ -326,9 +531,308 @@ class TagManagerWin(Window):
         build_editor_pane()
         build_display_pane()
 
+    def close(self):
+        if not self.settle_unsaved_edits("closing"):
+            return
+        if self.dataset:
+            self.dataset.stop_loading()
+        self.preview_cache.cancel_build()
+        self.image_cache.shutdown()
+        super().close()
+
+    def settle_unsaved_edits(self, action):
+        """Asks whether to save or discard the dataset's unsaved edits before it is closed.
+
+        Discarded edits are cleared from the journal, so they are not restored the next time the dataset is opened;
+        the journal only outlives a session that ends without this question being answered, such as a crash.
+        Returns False if the user cancels, or if a dataset-wide operation is still running.
+        """
+        if not self.dataset:
+            return True
+        if self.task_runner.busy():
+            print(
+                f"Wait for the dataset-wide operation to finish, or cancel it, before {action}."
+            )
+            return False
+        if not self.dataset.has_unsaved_edits():
+            return True
+        answer = messagebox.askyesnocancel(
+            "Unsaved edits",
+            f"Save the edited captions of {self.directory} before {action}?",
+        )
+        if answer is None:
+            return False
+        if answer:
+            print(self.dataset.save_dataset())
+        else:
+            self.dataset.discard_journal()
+        return True
+
+    def flush_journal(self):
+        """Flushes the edits journaled since the last flush to disk, then schedules the next flush.
+
+        If the journal has stopped after a failed write, the user is warned once and no flush is scheduled.
+        """
+        self.journal_flush_id = None
+        if not self.dataset:
+            return
+        self.dataset.flush_journal()
+        if self.dataset.journal_disabled():
+            messagebox.showwarning(
+                "Edit journal disabled",
+                f"The edit journal of {self.directory} could not be written, so edits are no longer journaled. "
+                "Save often: unsaved edits will be lost if Tagman exits unexpectedly.",
+            )
+            return
+        self.journal_flush_id = self.schedule(JOURNAL_FLUSH_MS, self.flush_journal)
+
+    @require_Dataset
+    def undo(self):
+        self.step_history(self.dataset.undo_edit, "Nothing to undo.", "Undoing")
+
+    @require_Dataset
+    def redo(self):
+        self.step_history(self.dataset.redo_edit, "Nothing to redo.", "Redoing")
+
+    def step_history(self, step, empty_message, verb):
+        """Undoes or redoes an edit through the HistoryEdit returned by step().
+
+        An edit of a single caption is applied at once, and the image it changed is shown; one spanning
+        several captions runs in the background like any dataset-wide edit, and can be canceled.
+        """
+        if self.task_runner.busy():
+            print("Captions cannot be edited while a dataset-wide operation runs.")
+            return
+        history = step()
+        if history is None:
+            print(empty_message)
+            return
+        op, tag, changes = history.edit
+        action = "adding" if op == "add" else "removing"
+        print(f'{verb} {action} tag "{tag}" ({len(changes)} caption(s)).')
+        if history.total() > 1:
+            self.__pb_task.config(maximum=history.total(), value=0)
+            self.__bt_cancel_task.pack(side=RIGHT, padx=5)
+            self.__pb_task.pack(side=RIGHT, padx=5)
+            self.task_runner.start(history)
+            return
+        history.run()
+        if len(changes) == 1:
+            self.set_display_index(changes[0][0])
+        self.refresh()
+
     @require_Dataset
     def save_dataset(self):
-        self.dataset.save_dataset()
+        if self.captions_loading("saving"):
+            return
+        print(self.dataset.save_dataset())
+
+    @require_Dataset
+    def build_previews(self):
+        """Creates previews of every image in the dataset at the current display height, in the background"""
+        paths = list(self.dataset.image_set)
+        height = max(self.__l_image.winfo_height(), 1)
+
+        print(f"Building previews of {len(paths)} images...")
+        self.run_in_background(
+            lambda: self.preview_cache.build(paths, height),
+            on_done=self.end_preview_build,
+        )
+
+    def end_preview_build(self, failures):
+        if failures is None:
+            print("Preview cache build canceled.")
+            return
+        print(f"Preview cache built ({failures} images could not be previewed).")
+
+    @require_Dataset
+    def start_bulk_edit(self, action, tag):
+        """Adds ('add') or removes ('remove') a tag across the whole dataset in the background"""
+        if self.task_runner.busy():
+            print("Another dataset-wide operation is still running.")
+            return
+        if self.captions_loading("editing the whole dataset"):
+            return
+        edit = self.dataset.bulk_edit(action, tag, targets=self.view_targets())
+        if edit.total() == 0:
+            return
+        if not self.views.is_filtered() and edit.total() >= SHARDED_EDIT_MIN_CAPTIONS:
+            sharded = self.ask_sharded_edit(edit.total())
+            if sharded is None:
+                return
+            if sharded:
+                edit = ShardedDatasetEdit(
+                    self.dataset, AddTag(tag) if action == "add" else RemoveTag(tag)
+                )
+        scope = f"dataset {self.directory}"
+        if self.views.is_filtered():
+            scope = f"view {self.views.active.name}"
+        if action == "add":
+            print(f'Applying tag "{tag}" to all .txt files in {scope}')
+        else:
+            print(f'Removing tag "{tag}" from all .txt files in {scope}')
+        self.__pb_task.config(maximum=edit.total(), value=0)
+        self.__bt_cancel_task.pack(side=RIGHT, padx=5)
+        self.__pb_task.pack(side=RIGHT, padx=5)
+        self.task_runner.start(edit)
+
+    def ask_sharded_edit(self, count):
+        """Asks whether an edit of count captions should be written straight to disk across worker processes.
+
+        Returns True or False, or None if the edit is called off. Single-core machines are never asked.
+        """
+        jobs = os.cpu_count() or 1
+        if jobs < 2:
+            return False
+        return messagebox.askyesnocancel(
+            "Large edit",
+            f"This edit changes {count} captions. Write it straight to disk across {jobs} processes?\n\n"
+            "Doing so saves any unsaved edits first and cannot be undone. "
+            "Choose No to edit the captions in memory, to be saved later.",
+        )
+
+    @require_Dataset
+    def select_view(self, name):
+        """Restricts navigation and dataset-wide edits to the named view, moving to its nearest image if needed"""
+        if self.task_runner.busy():
+            print(
+                "Wait for the dataset-wide operation to finish before changing views."
+            )
+            self.view_name.set(self.views.active.name)
+            return
+        if name not in self.views.views and self.captions_loading("changing views"):
+            self.view_name.set(self.views.active.name)
+            return
+        view = self.views.activate(name)
+        self.show_view(view)
+
+    @require_Dataset
+    def apply_query(self):
+        """Creates a view of the images matching the query entry and makes it active"""
+        if self.task_runner.busy():
+            print("Wait for the dataset-wide operation to finish before filtering.")
+            return
+        text = self.query_text.get().strip()
+        if not text:
+            self.clear_query()
+            return
+        if self.captions_loading("filtering"):
+            return
+        try:
+            view = self.views.add_query(text)
+        except ValueError as e:
+            print(f"Invalid query: {e}")
+            return
+        self.__cb_view.config(values=self.views.names())
+        self.show_view(view)
+
+    def clear_query(self):
+        self.query_text.set("")
+        if self.dataset:
+            self.select_view(ALL_IMAGES)
+
+    def show_view(self, view):
+        self.view_name.set(view.name)
+        print(f"{len(view)} images in view {view.name}.")
+        index = self.get_display_index()
+        if view.position(index) is None and len(view) > 0:
+            self.set_display_index(view.neighbour(index, 1))
+        self.display_training_element()
+
+    def captions_loading(self, action):
+        """Returns whether the dataset's captions are still loading, telling the user the action must wait if so"""
+        if self.dataset.is_loaded():
+            return False
+        print(f"Captions are still loading; wait for them to finish before {action}.")
+        return True
+
+    def view_targets(self):
+        """Returns the .png paths of the active view, or None if it holds the whole dataset"""
+        if not self.views.is_filtered():
+            return None
+        return self.views.active.png_paths()
+
+    def neighbour_index(self, step):
+        """Returns the display index 'step' images away from the current one within the active view, wrapping around"""
+        index = self.get_display_index()
+        neighbour = self.views.active.neighbour(index, step)
+        if neighbour is None:
+            return index
+        return neighbour
+
+    @require_Dataset
+    def refresh_statistics(self):
+        """Computes the tag statistics of the dataset in the background and shows them in the Options tab"""
+        if self.stats is None:
+            self.set_statistics_text(
+                "Statistics are unavailable; NumPy is not installed."
+            )
+            return
+        self.set_statistics_text("Computing statistics...")
+        self.run_in_background(self.stats.summary, on_done=self.set_statistics_text)
+
+    def build_statistics(self):
+        """Builds the tag statistics in the background, then shows recommendations for the current image"""
+        if self.stats is None or self.stats_building:
+            return
+        self.stats_building = True
+
+        def end_build(result):
+            self.stats_building = False
+            if self.dataset:
+                self.show_recommendations()
+
+        self.run_in_background(self.stats.ensure_built, on_done=end_build)
+
+    def show_recommendations(self):
+        """Shows the tags recommended for the current caption as buttons that add them to it.
+
+        Recommendations are read from already-built statistics, so this returns at once; if the statistics
+        need building, that is started in the background and the buttons are filled in when it finishes.
+        """
+        recommendations = []
+        if self.stats is not None:
+            if self.stats.ready():
+                recommendations = self.stats.recommend(
+                    self.dataset.caption_of(self.get_png_path()),
+                    RECOMMENDATION_COUNT,
+                    exclude=(self.dataset.trigger_word,),
+                )
+            else:
+                self.build_statistics()
+        self.__l_recommend.pack_forget()
+        for bt in self.__recommend_bts:
+            bt.pack_forget()
+        if len(recommendations) == 0:
+            return
+        self.__l_recommend.pack(side=LEFT)
+        for bt, (tag, score) in zip(self.__recommend_bts, recommendations):
+            bt.config(text=tag, command=lambda tag=tag: self.apply_recommendation(tag))
+            bt.pack(side=LEFT, padx=2)
+
+    @require_Dataset
+    def apply_recommendation(self, tag):
+        if self.task_runner.busy():
+            print("Captions cannot be edited while a dataset-wide operation runs.")
+            return
+        self.dataset.add_tag_to_image_caption(tag, png_path=self.get_png_path())
+        self.refresh()
+
+    def set_statistics_text(self, text):
+        self.__stats_txt_field.config(state="normal")
+        self.__stats_txt_field.delete("1.0", "end")
+        self.__stats_txt_field.insert(END, text)
+        self.__stats_txt_field.config(state="disabled")
+
+    def show_task_progress(self, done, total):
+        self.__pb_task.config(value=done)
+
+    def end_task(self, completed):
+        self.__pb_task.pack_forget()
+        self.__bt_cancel_task.pack_forget()
+        if not completed:
+            print("Dataset-wide operation canceled; all captions were restored.")
+        self.refresh()
 
     def on_resize(self, event):
         if not self.display_image:
@@ -340,7 +844,7 @@ class TagManagerWin(Window):
 
     @require_Dataset
     def get_txt_caption(self):
-        return self.dataset.cache[self.get_png_path()][1]
+        return self.dataset.caption_of(self.get_png_path())
 
     @require_Dataset
     def get_display_index(self):
@@ -358,19 +862,18 @@ class TagManagerWin(Window):
         self.display_training_element()
 
     def display_training_element(self):
+        self.read_captions_ahead()
         self.update_index_counter_label_text()
         self.open_image(self.get_png_path())
         self.load_caption(self.get_png_path())
+        self.show_recommendations()
 
     def incr_display_handle(self, event):
         """For non-Button widget events passing 'event' as an argument"""
         self.incr_display()
 
     def incr_display(self):
-        if self.get_display_index() == len(self.dataset.image_set) - 1:
-            self.set_display_index(0)
-        else:
-            self.set_display_index(self.get_display_index() + 1)
+        self.set_display_index(self.neighbour_index(1))
         self.display_training_element()
 
     def decr_display_handle(self, event):
@@ -378,10 +881,7 @@ class TagManagerWin(Window):
         self.decr_display()
 
     def decr_display(self):
-        if self.get_display_index() == 0:
-            self.set_display_index(len(self.dataset.image_set) - 1)
-        else:
-            self.set_display_index(self.get_display_index() - 1)
+        self.set_display_index(self.neighbour_index(-1))
         self.display_training_element()
 
     def update_index_counter_label_text(self):
@@ -391,6 +891,11 @@ class TagManagerWin(Window):
         if len(self.dataset.image_set) == 0:
             return text
         text = f"{self.get_display_index() + 1}/{len(self.dataset.image_set)}"
+        if self.views.is_filtered():
+            view = self.views.active
+            position = view.position(self.get_display_index())
+            position = "-" if position is None else position + 1
+            text = f"{position}/{len(view)} in {view.name} ({text})"
         self.__l_index_counter.config(text=text)
         return text
 
@@ -407,8 +912,9 @@ class TagManagerWin(Window):
         2) Adds contents of txt_path file corresponding to png_path in the Dataset cache.
         3) Generates buttons representing each tag within the Dataset and displays them in the 'Tags' window.
         """
-        self.set_caption_display_text(self.get_txt_caption())
-        self.display_tags_as_boxes(self.__p_tag_container, self.get_txt_caption())
+        caption = self.get_txt_caption()
+        self.set_caption_display_text(caption.serialize())
+        self.display_tags_as_boxes(self.__p_tag_container, caption)
 
     def open_image(self, png_path):
         if png_path and png_path.endswith(".png"):
@@ -421,80 +927,184 @@ class TagManagerWin(Window):
             raise Exception("only images with .png extensions may be opened")
 
     def load_image(self, file_path):
-        self.current_display_image = Image.open(file_path)
+        self.current_display_path = file_path
 
     def display_image(self):
-        if not self.current_display_image:
+        if not self.current_display_path:
             raise Exception("No image set to display")
 
         # FIXME: resizing does not fill entire image label; takes a few refreshes before it does.
         def img_fit_to_height(label):
             label.update_idletasks()
             label.update()
-            img = self.current_display_image
-            target_height = label.winfo_height()
-            # get original aspect ratio as width/height
-            original_aspect = img.size[0] / img.size[1]
-            target_width = int(target_height * original_aspect)
-            resized = img.resize((target_width, target_height))
-            return resized
+            target_height = max(label.winfo_height(), 1)
+            return self.image_cache.get(self.current_display_path, target_height)
 
         resized_image = img_fit_to_height(self.__l_image)
+        self.current_display_image = resized_image
         photo = ImageTk.PhotoImage(resized_image)  # convert for tkinter compatibility
         self.__l_image.config(image=photo)
         self.__l_image.image = photo
+        self.prefetch_neighbours(resized_image.size[1])
+
+    def prefetch_neighbours(self, height):
+        """Queues the images around the current one for decoding, nearest first"""
+        if not self.dataset or len(self.dataset.image_set) < 2:
+            return
+        image_set = self.dataset.image_set
+        paths = []
+        for offset in range(1, PREFETCH_RADIUS + 1):
+            for step in (offset, -offset):
+                path = image_set[self.neighbour_index(step)]
+                if path not in paths and path != self.current_display_path:
+                    paths.append(path)
+        self.image_cache.prefetch(paths, height)
+
+    def read_captions_ahead(self):
+        """Reads the captions of the current image and its neighbours in the active view, if not loaded yet"""
+        if self.dataset.is_loaded():
+            return
+        ids = [self.get_display_index()]
+        for offset in range(1, CAPTION_READ_AHEAD + 1):
+            ids.append(self.neighbour_index(offset))
+            ids.append(self.neighbour_index(-offset))
+        self.dataset.load_captions(ids)
+
+    def show_load_progress(self, dataset, loaded, total):
+        if dataset is not self.dataset:
+            return
+        self.__l_info.config(
+            text=f"Working under directory: {self.directory} (loading captions: {loaded}/{total})"
+        )
+        # tag counts grow as captions load, so refresh any suggestions being shown for the tag entry
+        if self.tag_entry_text.get():
+            self.trace_tag_entry(None, None, None)
+
+    def end_load(self, dataset):
+        if dataset is not self.dataset:
+            return
+        self.__l_info.config(text=f"Working under directory: {self.directory}")
+        if dataset.load_report.size() > 0:
+            print(dataset.load_report.summary())
+        self.refresh()
 
     def load_directory(self):
-        self.directory = filedialog.askdirectory()
-        if not os.path.isdir(self.directory):
+        directory = filedialog.askdirectory()
+        if not os.path.isdir(directory):
+            print("Directory load operation was canceled.")
+            return
+        if not self.settle_unsaved_edits("opening another directory"):
             print("Directory load operation was canceled.")
             return
+        self.directory = directory
         if self.dataset:
+            self.dataset.stop_loading()
+            self.preview_cache.cancel_build()
+            self.release_tagboxes()
             self.dataset = None
+            self.views = None
+            self.stats = None
+            self.image_cache.clear()
         self.__l_info.config(text=f"Working under directory: {self.directory}")
-        self.dataset = Dataset(self.directory, self)
+        self.dataset = Dataset(
+            self.directory,
+            missing_policy=self.ask_missing_captions,
+            lazy=True,
+            journal=True,
+        )
         if len(self.dataset.cache) == 0:
             self.dataset = None
             raise Exception(f"No images were found under directory {self.directory}")
+        # captions load in the background; the current image's captions are read as they are shown
+        dataset = self.dataset
+        dataset.load_listeners.append(
+            lambda loaded, total: self.call_on_ui_thread(
+                self.show_load_progress, dataset, loaded, total
+            )
+        )
+        # the load gets its own thread, as jobs in the shared pool (see 'TagStats.ensure_built') wait for it
+        self.run_in_background(
+            dataset.load_remaining,
+            on_done=lambda result: self.end_load(dataset),
+            own_thread=True,
+        )
+        if self.journal_flush_id is None:
+            self.flush_journal()
+        self.views = DatasetViews(self.dataset)
+        self.view_name.set(ALL_IMAGES)
+        self.__cb_view.config(values=self.views.names())
+        try:
+            self.stats = TagStats(self.dataset)
+        except Exception as e:
+            print(e)
+        self.set_statistics_text("")
         self.display_training_element()
 
-    def add_new_tagbox(self, widget, tag):
-        new_bt = TagBox(self, widget, tag)
-        self.tag_btlist.append(new_bt)
-        self.display_tagbox_grid()
+    def ask_missing_captions(self, png_paths):
+        """Missing-caption policy for the dataset: asks the user, image by image, whether to create each caption"""
+        queue = Queue()
+        for png_path in png_paths:
+            queue.push(png_path)
+        accepted = []
+        if self.active_queue_win is None:
+            self.start_queue(queue, func_on_yes=accepted.append)
+        return accepted
+
+    def acquire_tagbox(self, widget, tag):
+        """Returns a TagBox for the given tag, reusing a pooled one when available"""
+        if len(self.tagbox_pool) > 0:
+            tagbox = self.tagbox_pool.pop()
+            tagbox.assign(tag)
+            return tagbox
+        return TagBox(self, widget, tag)
+
+    def release_tagboxes(self):
+        """Hides every shown tagbox and returns it to the pool, to be reassigned (and its trigger state recomputed) on reuse"""
+        for tagbox in self.tag_btlist:
+            tagbox.hide()
+            self.tagbox_pool.append(tagbox)
+        self.tag_btlist = []
+
+    def display_tags_as_boxes(self, widget, caption, reload=True):
+        """Shows one tagbox per caption tag, in caption order.
 
-    def display_tags_as_boxes(self, widget, tag_string, reload=True):
-        # FIXME: when entering an already existing tag, SOME existing tag is generated (though no doubles are added, as intended)
-        """Deletes tagboxes that should not exist, adds those that should"""
-        tag_strs = tag_string.rstrip(", ").split(", ")
-        if len(self.tag_btlist) > 0:
-            keep_bts = []
-            for button in self.tag_btlist:
-                if button.is_trigger:
-                    keep_bts.append(button)
-                    tag_strs.remove(button.tag_text)
-                elif self.tag_in_caption(button.tag_text):
-                    keep_bts.append(button)
-                    tag_strs.remove(button.tag_text)
+        Tagboxes already showing a tag of the caption are kept as they are; the others are reconfigured
+        for the new tags or hidden and returned to the pool, so buttons are never destroyed and recreated.
+        """
+        tags = [tag for tag in caption if tag and not tag.isspace()]
+        if [tagbox.tag_text for tagbox in self.tag_btlist] == tags:
+            return
+        showing = {tagbox.tag_text: tagbox for tagbox in self.tag_btlist}
+        for tag in tags:
+            showing.pop(tag, None)
+        # tagboxes whose tag left the caption are recycled for the tags that entered it
+        spare = list(showing.values())
+        current = {tagbox.tag_text: tagbox for tagbox in self.tag_btlist}
+        tag_btlist = []
+        for tag in tags:
+            tagbox = current.get(tag)
+            if tagbox is None:
+                if len(spare) > 0:
+                    tagbox = spare.pop()
+                    tagbox.assign(tag)
                 else:
-                    button.destroy()
-            self.tag_btlist = keep_bts
-        for tag in tag_strs:
-            if tag.isspace() or not tag:
-                continue
-            self.add_new_tagbox(self.__p_tag_container, tag)
+                    tagbox = self.acquire_tagbox(widget, tag)
+            tag_btlist.append(tagbox)
+        for tagbox in spare:
+            tagbox.hide()
+            self.tagbox_pool.append(tagbox)
+        self.tag_btlist = tag_btlist
         self.display_tagbox_grid()
 
     def display_tagbox_grid(self):
+        """Lays out all shown tagboxes in a single pass, only re-gridding those whose cell changed"""
         col_n = 0
         row_n = 0
         for tagbox in self.tag_btlist:
             span = max((len(tagbox.tag_text) // 16), 1)
             if tagbox.bt is None:
                 continue
-            tagbox.bt.grid(
-                sticky="w", row=row_n, column=col_n, padx=2, pady=2, columnspan=span
-            )
+            tagbox.place(row_n, col_n, span)
             col_n += span
             if col_n > 3:
                 col_n = 0
@@ -515,6 +1125,9 @@ class TagManagerWin(Window):
         def try_continue(self):
             if text == self.dataset.trigger_word:
                 return
+            if self.task_runner.busy():
+                print("Captions cannot be edited while a dataset-wide operation runs.")
+                return
             match self.application_mode.get():
                 case "Apply":
                     if negate:
@@ -527,19 +1140,10 @@ class TagManagerWin(Window):
                         )
                 case "Apply_All":
                     if negate:
-                        print(
-                            f'Removing tag "{text}" from all .txt files in dataset {self.directory}'
-                        )
-                        self.dataset.remove_tag_from_image_caption(
-                            text, png_path=self.get_png_path(), all=True
-                        )
+                        self.start_bulk_edit("remove", text)
                     else:
-                        print(
-                            f'Applying tag "{text}" to all .txt files in dataset {self.directory}'
-                        )
-                        self.dataset.add_tag_to_image_caption(
-                            text, png_path=self.get_png_path(), all=True
-                        )
+                        self.start_bulk_edit("add", text)
+                    return
                 case _:
                     raise ValueError(
                         "only 'Apply' and 'Apply_All' are acceptable actions"
@@ -565,21 +1169,45 @@ class TagManagerWin(Window):
         if not text:
             self.__autofill_box.update([])
             return
-        words_with_pre = self.dataset.tag_trie.words_with_prefix(text.lstrip("-"))
-        options = []
-        if len(words_with_pre) > 0:
-            for suggestion in words_with_pre:
-                if self.dataset.trigger_word == suggestion:
-                    continue
-                if text.startswith("-"):
-                    if not self.tag_in_caption(suggestion):
-                        continue
-                else:
-                    if self.tag_in_caption(suggestion):
-                        continue
-                options.append(suggestion)
-                if len(options) == 3:
-                    break
+        # the tag trie may still be filling in on the loading thread
+        with self.dataset.lock:
+            self.update_tag_suggestions(text)
+
+    def update_tag_suggestions(self, text):
+        prefix = text.lstrip("-")
+        trie = self.dataset.tag_trie
+        infix = self.infix_mode.get() == 1
+        if text.startswith("-"):
+            # only tags of the current caption may be removed from it
+            options = [
+                tag
+                for tag in self.get_txt_caption()
+                if (prefix in tag if infix else tag.startswith(prefix))
+                and tag != self.dataset.trigger_word
+            ]
+            options.sort(key=lambda tag: (-trie.get(tag), tag))
+        elif infix:
+            caption = self.get_txt_caption()
+            options = [
+                tag
+                for tag in self.dataset.tags_containing(prefix)
+                if tag not in caption and tag != self.dataset.trigger_word
+            ]
+        else:
+            skip = set(self.get_txt_caption())
+            skip.add(self.dataset.trigger_word)
+            options = trie.top_words_with_prefix(prefix, 3, skip=skip)
+            if len(options) < 3 and len(prefix) >= FUZZY_MIN_LENGTH:
+                # fill the remaining slots with near-misses, in case the entry is a typo of an existing tag
+                max_distance = 1 if len(prefix) < FUZZY_WIDE_LENGTH else 2
+                skip.update(options)
+                approximate = [
+                    tag
+                    for tag in trie.fuzzy_words(prefix, max_distance)
+                    if tag not in skip
+                ]
+                self.__autofill_box.update(options, approximate[: 3 - len(options)])
+                return
         self.__autofill_box.update(options[:3])
 
     def nav_autofill(self, event):
@@ -630,6 +1258,8 @@ class SuggestBox:
         self.lighten_foreground_color(self.__l_opt3, color, 0.33)
         self.__l_opt3.grid(column=0, row=2, sticky="w")
         self.labels = [self.__l_opt1, self.__l_opt2, self.__l_opt3]
+        self.exact_font = ("Helvetica", 10, "bold")
+        self.approximate_font = ("Helvetica", 10, "bold italic")
         self.selected = None
         self.default_label_bg_color = self.__l_opt1.cget("bg")
         self.clear()
@@ -663,16 +1293,23 @@ class SuggestBox:
     def set_label_text(self, label, text):
         label.config(text=text)
 
-    def update(self, options):
+    def update(self, options, approximate=()):
+        """Shows up to three suggestions: 'options' first, then 'approximate' matches in italics"""
+        options = list(options) + list(approximate)
         # if the first option is empty, it means that no text is entered
         if len(options) == 0 or not options[0]:
             self.clear()
             return
+        exact_count = len(options) - len(approximate)
         for i in range(0, 3):
             if i > (len(options) - 1):
                 self.set_label_text(self.labels[i], "")
                 continue
             self.set_label_text(self.labels[i], options[i])
+            if i < exact_count:
+                self.labels[i].config(font=self.exact_font)
+            else:
+                self.labels[i].config(font=self.approximate_font)
 
     def clear(self):
         for label in self.labels:
@@ -0,0 +1,97 @@
+from PIL import Image
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+# default memory budget for decoded display images, in bytes
+DEFAULT_CACHE_BYTES = 256 * 2**20
+
+
+def image_nbytes(img):
+    """Approximates the memory held by a decoded image"""
+    return img.size[0] * img.size[1] * len(img.getbands())
+
+
+def load_display_image(path, height):
+    """Decodes the image at path and resizes it to the given height, keeping its aspect ratio"""
+    with Image.open(path) as img:
+        # get original aspect ratio as width/height
+        original_aspect = img.size[0] / img.size[1]
+        width = max(1, int(height * original_aspect))
+        return img.resize((width, height))
+
+
+class ImageCache:
+    """Least-recently-used cache of display-ready images, keyed by path and target height.
+
+    Entries are evicted, oldest use first, once the decoded images together exceed 'max_bytes'.
+    A single background worker decodes images ahead of time through 'prefetch'; each call to 'prefetch'
+    supersedes the previous one, so requests left over from earlier navigation are skipped.
+    The cache may be read from the Tk thread while the worker fills it.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES, loader=load_display_image):
+        self.max_bytes = max_bytes
+        self.loader = loader
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.generation = 0
+
+    def lookup(self, path, height):
+        """Returns the cached image for (path, height), or None, marking it as recently used"""
+        key = (path, height)
+        with self.lock:
+            img = self.entries.get(key)
+            if img is not None:
+                self.entries.move_to_end(key)
+            return img
+
+    def put(self, path, height, img):
+        key = (path, height)
+        nbytes = image_nbytes(img)
+        if nbytes > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self.total_bytes -= image_nbytes(self.entries.pop(key))
+            self.entries[key] = img
+            self.total_bytes += nbytes
+            while self.total_bytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.total_bytes -= image_nbytes(evicted)
+
+    def get(self, path, height):
+        """Returns the display-ready image for (path, height), decoding it now if it is not cached"""
+        img = self.lookup(path, height)
+        if img is None:
+            img = self.loader(path, height)
+            self.put(path, height, img)
+        return img
+
+    def prefetch(self, paths, height):
+        """Decodes the given paths in the background, in order, skipping those already cached"""
+        with self.lock:
+            self.generation += 1
+            generation = self.generation
+        for path in paths:
+            self.executor.submit(self.prefetch_one, path, height, generation)
+
+    def prefetch_one(self, path, height, generation):
+        if generation != self.generation or self.lookup(path, height) is not None:
+            return
+        try:
+            self.put(path, height, self.loader(path, height))
+        except Exception as e:
+            print(f"Could not prefetch image '{path}': {e}")
+
+    def clear(self):
+        with self.lock:
+            self.generation += 1
+            self.entries.clear()
+            self.total_bytes = 0
+
+    def shutdown(self):
+        self.clear()
+        self.executor.shutdown(wait=False, cancel_futures=True)
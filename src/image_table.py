@@ -0,0 +1,301 @@
+from collections.abc import Mapping, Sequence
+from array import array
+from bisect import bisect_left
+import os
+
+# captions with more tags than this also keep a set of their tag ids, so that membership tests stay O(1);
+# shorter ones are scanned, which is as fast at that size and costs no memory
+LONG_CAPTION_TAGS = 64
+
+
+def insert_sorted(ids, i):
+    """Adds id i to a sorted array of ids unless it is already present"""
+    # images are mostly indexed in id order, so check the end first to keep appends O(1)
+    if len(ids) == 0 or ids[-1] < i:
+        ids.append(i)
+        return
+    position = bisect_left(ids, i)
+    if ids[position] != i:
+        ids.insert(position, i)
+
+
+def remove_sorted(ids, i):
+    """Removes id i from a sorted array of ids if it is present"""
+    position = bisect_left(ids, i)
+    if position < len(ids) and ids[position] == i:
+        del ids[position]
+
+
+class TagVocabulary:
+    """Interns tags as dense integer ids, so each distinct tag string is stored once however many captions hold it"""
+
+    def __init__(self):
+        self.ids = {}
+        self.tags = []
+
+    def __len__(self):
+        return len(self.tags)
+
+    def intern(self, tag):
+        """Returns the id of a tag, assigning the next free id if it is new"""
+        i = self.ids.get(tag)
+        if i is None:
+            i = len(self.tags)
+            self.ids[tag] = i
+            self.tags.append(tag)
+        return i
+
+
+class ImageTable:
+    """Compact store of a dataset's images and captions, addressed by dense integer image ids.
+
+    Image ids are assigned in the order images are added. A .png path is stored as the id of its directory prefix
+    (everything up to and including the last path separator), kept once per directory, plus its stem; the .png and
+    .txt paths are rebuilt from those on demand. A caption is stored as an array('I') of ids in 'self.vocabulary',
+    or None until it has been read; 'caption' returns a CaptionView through which it can be read and edited.
+    Captions longer than LONG_CAPTION_TAGS also get a set of their tag ids in 'self.caption_sets'.
+    """
+
+    def __init__(self):
+        self.prefixes = []
+        self.prefix_ids = {}
+        self.prefix_of = array("I")
+        self.stems = []
+        # for each directory prefix, its stems mapped to image ids
+        self.stem_ids = []
+        self.captions = []
+        # image id -> set of the tag ids of its caption, for long captions only
+        self.caption_sets = {}
+        self.vocabulary = TagVocabulary()
+
+    def __len__(self):
+        return len(self.stems)
+
+    def split(self, png_path):
+        cut = png_path.rfind(os.sep) + 1
+        return png_path[:cut], png_path[cut:-4]
+
+    def id_of(self, png_path):
+        """Returns the id of a .png path, or None if it is not in the table"""
+        if not png_path.endswith(".png"):
+            return None
+        prefix, stem = self.split(png_path)
+        p = self.prefix_ids.get(prefix)
+        if p is None:
+            return None
+        return self.stem_ids[p].get(stem)
+
+    def add(self, png_path):
+        """Adds a .png path with no caption, returning its id; a path already present keeps its id"""
+        if not png_path.endswith(".png"):
+            raise ValueError(f"not a .png path: '{png_path}'")
+        prefix, stem = self.split(png_path)
+        p = self.prefix_ids.get(prefix)
+        if p is None:
+            p = len(self.prefixes)
+            self.prefix_ids[prefix] = p
+            self.prefixes.append(prefix)
+            self.stem_ids.append({})
+        i = self.stem_ids[p].get(stem)
+        if i is None:
+            i = len(self.stems)
+            self.stem_ids[p][stem] = i
+            self.prefix_of.append(p)
+            self.stems.append(stem)
+            self.captions.append(None)
+        return i
+
+    def png_path(self, i):
+        return f"{self.prefixes[self.prefix_of[i]]}{self.stems[i]}.png"
+
+    def txt_path(self, i):
+        return f"{self.prefixes[self.prefix_of[i]]}{self.stems[i]}.txt"
+
+    def caption(self, i):
+        """Returns a CaptionView of image i, or None if its caption has not been read"""
+        if self.captions[i] is None:
+            return None
+        return CaptionView(self, i)
+
+    def set_caption(self, i, caption):
+        """Stores the tags of a caption (any iterable of tags, or None) as the caption of image i"""
+        self.caption_sets.pop(i, None)
+        if caption is None:
+            self.captions[i] = None
+            return
+        intern = self.vocabulary.intern
+        ids = array("I", [intern(tag) for tag in caption])
+        self.captions[i] = ids
+        if len(ids) > LONG_CAPTION_TAGS:
+            self.caption_sets[i] = set(ids)
+
+
+class CaptionView:
+    """A caption held in an ImageTable, with the interface of a Caption.
+
+    The view reads and edits the table's tag-id array in place, so it stays current however long it is held.
+    Membership is tested against the caption's id set where the table keeps one, and by scanning the array otherwise;
+    either way it is O(1), as the scanned captions are at most LONG_CAPTION_TAGS long.
+    """
+
+    def __init__(self, table, i):
+        self.table = table
+        self.i = i
+
+    def ids(self):
+        return self.table.captions[self.i]
+
+    def tag_id(self, tag):
+        return self.table.vocabulary.ids.get(tag)
+
+    def has_id(self, j):
+        tag_set = self.table.caption_sets.get(self.i)
+        if tag_set is not None:
+            return j in tag_set
+        return j in self.ids()
+
+    def added(self, j):
+        """Keeps the caption's id set, if any, up to date after tag id j was added"""
+        tag_set = self.table.caption_sets.get(self.i)
+        if tag_set is not None:
+            tag_set.add(j)
+        elif len(self.ids()) > LONG_CAPTION_TAGS:
+            self.table.caption_sets[self.i] = set(self.ids())
+
+    def __contains__(self, tag):
+        j = self.tag_id(tag)
+        return j is not None and self.has_id(j)
+
+    def __iter__(self):
+        # iterate over a snapshot, so a caption edited on another thread cannot break the iteration
+        tags = self.table.vocabulary.tags
+        return iter([tags[j] for j in self.ids().tolist()])
+
+    def __len__(self):
+        return len(self.ids())
+
+    def __str__(self):
+        return self.serialize()
+
+    def serialize(self):
+        return ", ".join(self)
+
+    def first(self):
+        """Returns the first tag of the caption, or None if it has no tags"""
+        ids = self.ids()
+        if len(ids) == 0:
+            return None
+        return self.table.vocabulary.tags[ids[0]]
+
+    def add(self, tag):
+        """Appends a tag to the caption. Returns False if it was already present."""
+        if tag in self:
+            return False
+        j = self.table.vocabulary.intern(tag)
+        self.ids().append(j)
+        self.added(j)
+        return True
+
+    def remove(self, tag):
+        """Removes a tag from the caption. Returns False if it was not present."""
+        if tag not in self:
+            return False
+        j = self.tag_id(tag)
+        self.ids().remove(j)
+        tag_set = self.table.caption_sets.get(self.i)
+        if tag_set is not None:
+            tag_set.discard(j)
+        return True
+
+    def index(self, tag):
+        """Returns the position of a tag within the caption, or None if it is not present"""
+        if tag not in self:
+            return None
+        return self.ids().index(self.tag_id(tag))
+
+    def insert(self, position, tag):
+        """Places a tag at the given position, moving it there if it is already present"""
+        ids = self.ids()
+        j = self.table.vocabulary.intern(tag)
+        if self.has_id(j):
+            ids.remove(j)
+        ids.insert(position, j)
+        self.added(j)
+
+
+class CaptionCache(Mapping):
+    """The mapping of .png paths to (.txt path, caption) tuples that 'Dataset.cache' has always been, over an ImageTable.
+
+    Assigning a (txt_path, caption) tuple to a .png path adds the image if needed and stores a copy of the caption;
+    the .txt path is always the one derived from the .png path.
+    """
+
+    def __init__(self, table):
+        self.table = table
+
+    def __getitem__(self, png_path):
+        i = self.table.id_of(png_path)
+        if i is None:
+            raise KeyError(png_path)
+        return self.table.txt_path(i), self.table.caption(i)
+
+    def __setitem__(self, png_path, value):
+        self.table.set_caption(self.table.add(png_path), value[1])
+
+    def __contains__(self, png_path):
+        return self.table.id_of(png_path) is not None
+
+    def __iter__(self):
+        for i in range(len(self.table)):
+            yield self.table.png_path(i)
+
+    def __len__(self):
+        return len(self.table)
+
+
+class ImageSequence(Sequence):
+    """The .png paths of an ImageTable in id order, as a read-only sequence"""
+
+    def __init__(self, table):
+        self.table = table
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.table.png_path(j) for j in range(len(self.table))[i]]
+        if i < 0:
+            i += len(self.table)
+        if not 0 <= i < len(self.table):
+            raise IndexError("image index out of range")
+        return self.table.png_path(i)
+
+    def __len__(self):
+        return len(self.table)
+
+    def index(self, png_path, start=0, stop=None):
+        i = self.table.id_of(png_path)
+        if i is None or i < start or (stop is not None and i >= stop):
+            raise ValueError(f"'{png_path}' is not in the dataset")
+        return i
+
+
+class ImageIds(Mapping):
+    """The mapping of .png paths to their image ids in an ImageTable"""
+
+    def __init__(self, table):
+        self.table = table
+
+    def __getitem__(self, png_path):
+        i = self.table.id_of(png_path)
+        if i is None:
+            raise KeyError(png_path)
+        return i
+
+    def __contains__(self, png_path):
+        return self.table.id_of(png_path) is not None
+
+    def __iter__(self):
+        for i in range(len(self.table)):
+            yield self.table.png_path(i)
+
+    def __len__(self):
+        return len(self.table)
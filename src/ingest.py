@@ -0,0 +1,94 @@
+from concurrent.futures import ThreadPoolExecutor
+from caption import split_tags
+import os
+
+# number of files handed to a worker thread at a time, amortizing the executor's per-task overhead
+CHUNK_SIZE = 256
+
+
+class IngestReport:
+    """Collects the files that could not be read while ingesting captions"""
+
+    def __init__(self):
+        self.errors = []
+
+    def add_error(self, path, error):
+        self.errors.append((path, error))
+
+    def size(self):
+        return len(self.errors)
+
+    def summary(self):
+        if len(self.errors) == 0:
+            return "All captions were read successfully."
+        lines = [f"{len(self.errors)} caption(s) could not be read:"]
+        for path, error in self.errors:
+            lines.append(f"  {path}: {error}")
+        return "\n".join(lines)
+
+
+def read_caption(txt_path):
+    """Reads a caption file, returning its stripped contents and the list of tags within"""
+    with open(txt_path, "r") as file:
+        file_content = file.read().strip()
+    return file_content, split_tags(file_content)
+
+
+def _try_read_caption(txt_path):
+    try:
+        return read_caption(txt_path), None
+    except FileNotFoundError:
+        return None, "file not found"
+    except Exception as e:
+        return None, str(e)
+
+
+def _map_chunked(func, items, workers):
+    """Applies func to every item through a thread pool, submitting items in chunks of CHUNK_SIZE"""
+    if len(items) <= CHUNK_SIZE:
+        return [func(item) for item in items]
+    chunks = [items[i : i + CHUNK_SIZE] for i in range(0, len(items), CHUNK_SIZE)]
+    results = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for chunk_results in executor.map(
+            lambda chunk: [func(item) for item in chunk], chunks
+        ):
+            results.extend(chunk_results)
+    return results
+
+
+def read_captions(txt_paths, workers=None, report=None):
+    """Reads many caption files concurrently through a thread pool.
+
+    Returns a list with one entry per path, in the same order as 'txt_paths':
+    the (file_content, caption_tags) result of 'read_caption', or None if the file could not be read.
+    Files that could not be read are recorded in 'report' rather than raising.
+    'workers' caps the number of threads; None lets the executor choose.
+    """
+    if report is None:
+        report = IngestReport()
+    results = []
+    for txt_path, (result, error) in zip(
+        txt_paths, _map_chunked(_try_read_caption, txt_paths, workers)
+    ):
+        if error is not None:
+            report.add_error(txt_path, error)
+        results.append(result)
+    return results
+
+
+def _try_stat(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+def stat_files(paths, workers=None):
+    """Stats many files concurrently through a thread pool.
+
+    Returns a list with one (size, mtime_ns) tuple per path, in the same order as 'paths',
+    or None for paths that could not be stat-ed.
+    """
+    return _map_chunked(_try_stat, paths, workers)
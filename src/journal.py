@@ -0,0 +1,142 @@
+import json
+import os
+
+JOURNAL_FILENAME = ".tagman_journal"
+# entries buffered before 'Journal.append' flushes them itself, without waiting for the next scheduled flush
+JOURNAL_BATCH_SIZE = 64
+
+
+class Journal:
+    """Append-only log of the tag edits made to a dataset since it was last saved, kept in the dataset root.
+
+    Each line is a JSON object {"op": "add" or "remove", "tag": tag, "images": [[png_path, position], ...]},
+    one per edit: a single tag added to or removed from one caption, or a whole bulk edit. 'position' is where
+    the tag was placed, or removed from, within each caption. Paths are stored relative to the dataset root.
+
+    Appended entries are buffered and written, then flushed to disk with a single fsync, by 'flush', which the
+    owner calls periodically; at most JOURNAL_BATCH_SIZE entries are buffered before 'append' flushes by itself.
+    A crash therefore loses at most the edits made since the last flush.
+    If the journal file cannot be written, as on a read-only or full volume, a warning is printed and journaling
+    stops for the rest of the session; edits carry on without it.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = os.path.join(directory, JOURNAL_FILENAME)
+        self.prefix = os.path.join(directory, "")
+        self.pending = []
+        self.file = None
+        # set once writing the journal file failed; no further entries are kept
+        self.disabled = False
+
+    def relative(self, path):
+        if path.startswith(self.prefix):
+            return path[len(self.prefix) :]
+        return os.path.relpath(path, self.directory)
+
+    def read(self):
+        """Returns the entries of the journal file, as (op, tag, [(png_path, position), ...]) tuples.
+
+        A partly written last line, left by a crash during a write, is dropped and cut from the file,
+        so that later entries are appended after the last complete one.
+        """
+        try:
+            with open(self.path, "rb") as file:
+                data = file.read()
+        except FileNotFoundError:
+            return []
+        except OSError as e:
+            self.disable(e)
+            return []
+        entries = []
+        end = 0
+        for line in data.splitlines(keepends=True):
+            try:
+                entry = json.loads(line)
+                images = [
+                    (os.path.join(self.directory, png_path), position)
+                    for png_path, position in entry["images"]
+                ]
+                entries.append((entry["op"], entry["tag"], images))
+            except (ValueError, KeyError, TypeError):
+                print(
+                    f"Ignoring the journal of '{self.directory}' after a damaged entry."
+                )
+                break
+            end += len(line)
+        if end < len(data):
+            try:
+                with open(self.path, "r+b") as file:
+                    file.truncate(end)
+            except OSError as e:
+                self.disable(e)
+        return entries
+
+    def append(self, op, tag, images):
+        """Buffers an entry for 'flush'; images is a list of (png_path, position) pairs"""
+        if self.disabled:
+            return
+        entry = {
+            "op": op,
+            "tag": tag,
+            "images": [
+                [self.relative(png_path), position] for png_path, position in images
+            ],
+        }
+        self.pending.append(json.dumps(entry, separators=(",", ":")) + "\n")
+        if len(self.pending) >= JOURNAL_BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        """Writes every buffered entry to the journal file and flushes it to disk"""
+        if len(self.pending) == 0:
+            return
+        try:
+            if self.file is None:
+                self.file = open(self.path, "a")
+            self.file.write("".join(self.pending))
+            self.file.flush()
+            os.fsync(self.file.fileno())
+        except OSError as e:
+            self.disable(e)
+            return
+        self.pending.clear()
+
+    def disable(self, error):
+        """Stops journaling after the journal file could not be written, warning only the first time"""
+        if self.disabled:
+            return
+        print(
+            f"WARNING: Could not write the edit journal '{self.path}' ({error}). "
+            "Edits are no longer journaled and will be lost if Tagman exits before they are saved."
+        )
+        self.disabled = True
+        self.pending.clear()
+        try:
+            self.close()
+        except OSError:
+            self.file = None
+
+    def empty(self):
+        """Returns whether the journal holds no entries, buffered or on disk"""
+        if len(self.pending) > 0:
+            return False
+        try:
+            return os.path.getsize(self.path) == 0
+        except FileNotFoundError:
+            return True
+
+    def truncate(self):
+        """Discards every entry, once the edits they record have been saved to the captions or abandoned"""
+        self.pending.clear()
+        try:
+            self.close()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+        except OSError as e:
+            self.disable(e)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
@@ -0,0 +1,176 @@
+from PIL import Image
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import os
+import tempfile
+import threading
+
+# default cap on the disk space used by stored previews, in bytes
+DEFAULT_PREVIEW_CACHE_BYTES = 1024 * 2**20
+# previews are stored at the next multiple of this height, then scaled to the exact display height
+PREVIEW_HEIGHT_STEP = 256
+# number of previews written between checks of the cache size
+PRUNE_INTERVAL = 200
+
+
+def default_cache_directory():
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(base, "tagman", "previews")
+
+
+def preview_height(height):
+    """Returns the height at which previews for the given display height are stored"""
+    return -(-height // PREVIEW_HEIGHT_STEP) * PREVIEW_HEIGHT_STEP
+
+
+class PreviewCache:
+    """Persistent cache of downscaled image previews, shared by all datasets and sessions.
+
+    A preview is stored per (image path, modification time, file size, preview height), so editing or
+    replacing an image invalidates its previews. 'Image.thumbnail' shrinks each image by integer factors with
+    'Image.reduce' before resampling; for JPEG images, 'Image.draft' also lets the decoder itself work at a fraction
+    of full size, while PNG images are always decoded in full.
+    Once the stored previews exceed 'max_bytes', the least recently used ones are deleted.
+    """
+
+    def __init__(self, directory=None, max_bytes=DEFAULT_PREVIEW_CACHE_BYTES):
+        self.directory = directory or default_cache_directory()
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.writes_since_prune = 0
+        # one event per running 'build', set by 'cancel_build' to stop it
+        self.build_cancels = set()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def preview_path(self, path, height):
+        st = os.stat(path)
+        key = f"{os.path.abspath(path)}\0{st.st_mtime_ns}\0{st.st_size}\0{height}"
+        digest = hashlib.sha1(key.encode()).hexdigest()
+        return os.path.join(self.directory, f"{digest}.png")
+
+    def get_preview(self, path, height):
+        """Returns the stored preview of path at the given preview height, creating it if needed"""
+        cached_path = self.preview_path(path, height)
+        try:
+            with Image.open(cached_path) as cached:
+                cached.load()
+            # mark the preview as recently used for pruning
+            os.utime(cached_path)
+            return cached
+        except (FileNotFoundError, OSError):
+            pass
+        preview = self.make_preview(path, height)
+        self.store(cached_path, preview)
+        return preview
+
+    def make_preview(self, path, height):
+        """Returns a copy of the image at path, shrunk to at most the given height.
+
+        Only JPEG images are decoded at reduced size ('Image.draft' does nothing for other formats).
+        """
+        with Image.open(path) as img:
+            img.draft("RGB", (img.size[0], height))
+            img.thumbnail((img.size[0], height), reducing_gap=2.0)
+            img.load()
+            return img.copy()
+
+    def store(self, cached_path, preview):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                preview.save(file, format="PNG", compress_level=1)
+            os.replace(tmp_path, cached_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        with self.lock:
+            self.writes_since_prune += 1
+            due = self.writes_since_prune >= PRUNE_INTERVAL
+        if due:
+            self.prune()
+
+    def load(self, path, height):
+        """Returns the image at path scaled to the given display height, decoding the original only if no preview exists.
+
+        Suitable as the loader of an 'ImageCache'.
+        """
+        preview = self.get_preview(path, preview_height(height))
+        if preview.size[1] == height:
+            return preview
+        # get original aspect ratio as width/height
+        original_aspect = preview.size[0] / preview.size[1]
+        width = max(1, int(height * original_aspect))
+        return preview.resize((width, height))
+
+    def build(self, paths, height, workers=None):
+        """Creates any missing previews of paths for the given display height, using a thread pool.
+
+        Returns the number of images that could not be previewed, or None if the build was stopped by 'cancel_build'.
+        Each build has its own cancel event, so starting a build never revives one that was canceled.
+        """
+        stored_height = preview_height(height)
+        cancel = threading.Event()
+        with self.lock:
+            self.build_cancels.add(cancel)
+
+        def build_one(path):
+            if cancel.is_set():
+                return None
+            try:
+                if not os.path.exists(self.preview_path(path, stored_height)):
+                    self.store(
+                        self.preview_path(path, stored_height),
+                        self.make_preview(path, stored_height),
+                    )
+                return True
+            except Exception as e:
+                print(f"Could not build a preview of '{path}': {e}")
+                return False
+
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                failures = list(executor.map(build_one, paths)).count(False)
+        finally:
+            with self.lock:
+                self.build_cancels.discard(cancel)
+        self.prune()
+        if cancel.is_set():
+            return None
+        return failures
+
+    def cancel_build(self):
+        """Stops every running 'build' once the previews being made are stored; the remaining paths are skipped"""
+        with self.lock:
+            for cancel in self.build_cancels:
+                cancel.set()
+
+    def prune(self):
+        """Deletes the least recently used previews until the cache fits within 'max_bytes'"""
+        with self.lock:
+            self.writes_since_prune = 0
+        entries = []
+        total = 0
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if not entry.name.endswith(".png"):
+                    continue
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime_ns, st.st_size, entry.path))
+                total += st.st_size
+        if total <= self.max_bytes:
+            return
+        entries.sort()
+        for _, size, path in entries:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            if total <= self.max_bytes:
+                break
@@ -0,0 +1,212 @@
+from collections import OrderedDict
+import re
+
+# number of per-tag bitsets kept by a BitsetCache before the least recently used is dropped
+BITSET_CACHE_SIZE = 256
+
+TOKEN_PATTERN = re.compile(r'\s*(?:([()&|!])|"([^"]*)"|([^\s()"&|!]+))')
+KEYWORDS = {"AND": "&", "OR": "|", "NOT": "!"}
+
+
+def make_bitset(ids, size):
+    """Returns an int with bit i set for every image id i in ids, each below size"""
+    buffer = bytearray((size + 7) // 8)
+    for i in ids:
+        buffer[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(buffer, "little")
+
+
+def bitset_members(bits):
+    """Returns the ids set in a bitset, in ascending order"""
+    # binary digits with the lowest bit first
+    digits = bin(bits)[:1:-1]
+    ids = []
+    i = digits.find("1")
+    while i != -1:
+        ids.append(i)
+        i = digits.find("1", i + 1)
+    return ids
+
+
+def tokenize(text):
+    """Splits a query into operator and tag tokens, as ('op', symbol) or ('tag', name) tuples.
+
+    Runs of unquoted words form a single tag, joined by single spaces, so 'long hair AND sky' names two tags.
+    """
+    tokens = []
+    position = 0
+    text = text.rstrip()
+    while position < len(text):
+        match = TOKEN_PATTERN.match(text, position)
+        if match is None:
+            raise ValueError(f"unterminated quote in query: {text[position:].strip()}")
+        position = match.end()
+        symbol, quoted, word = match.groups()
+        if symbol is not None:
+            tokens.append(("op", symbol))
+        elif quoted is not None:
+            tokens.append(("tag", quoted.strip()))
+        elif word in KEYWORDS:
+            tokens.append(("op", KEYWORDS[word]))
+        elif len(tokens) > 0 and tokens[-1][0] == "word":
+            tokens[-1] = ("word", f"{tokens[-1][1]} {word}")
+        else:
+            tokens.append(("word", word))
+    return [
+        ("tag", value) if kind == "word" else (kind, value) for kind, value in tokens
+    ]
+
+
+class Query:
+    """A boolean expression over the tags of a caption.
+
+    Tags are combined with AND (or &), OR (or |) and NOT (or !), grouped with parentheses; NOT binds tightest,
+    then AND, then OR. Tags containing spaces may be written bare, e.g. 'long hair AND NOT sky', while tags
+    containing parentheses, quotes or operator symbols must be quoted, e.g. '"hatsune miku (cosplay)" OR "!?"'.
+    The parsed expression is a tree of ('tag', name), ('not', node), ('and', [nodes]) and ('or', [nodes]) tuples.
+    """
+
+    def __init__(self, tree, text=""):
+        self.tree = tree
+        self.text = text
+
+    @classmethod
+    def parse(cls, text):
+        tokens = tokenize(text)
+        if len(tokens) == 0:
+            raise ValueError("empty query")
+        parser = QueryParser(tokens)
+        tree = parser.parse_or()
+        if parser.position < len(tokens):
+            raise ValueError(f"unexpected '{tokens[parser.position][1]}' in query")
+        return cls(tree, text)
+
+    def __str__(self):
+        return self.text
+
+    def tags(self):
+        """Returns the set of tags named in the query"""
+        found = set()
+        stack = [self.tree]
+        while stack:
+            kind, value = stack.pop()
+            if kind == "tag":
+                found.add(value)
+            elif kind == "not":
+                stack.append(value)
+            else:
+                stack.extend(value)
+        return found
+
+    def evaluate(self, tag_bitset, size):
+        """Returns the bitset of images matching the query.
+
+        'tag_bitset' returns the bitset of images holding a given tag, and 'size' is the number of image ids.
+        """
+        universe = (1 << size) - 1
+
+        def evaluate_node(node):
+            kind, value = node
+            if kind == "tag":
+                return tag_bitset(value)
+            if kind == "not":
+                return universe & ~evaluate_node(value)
+            bits = evaluate_node(value[0])
+            for child in value[1:]:
+                if kind == "and":
+                    if bits == 0:
+                        break
+                    bits &= evaluate_node(child)
+                else:
+                    bits |= evaluate_node(child)
+            return bits
+
+        return evaluate_node(self.tree)
+
+    def matches(self, tags):
+        """Returns whether a single caption, given as a container of its tags, matches the query"""
+
+        def match_node(node):
+            kind, value = node
+            if kind == "tag":
+                return value in tags
+            if kind == "not":
+                return not match_node(value)
+            if kind == "and":
+                return all(match_node(child) for child in value)
+            return any(match_node(child) for child in value)
+
+        return match_node(self.tree)
+
+
+class QueryParser:
+    """Recursive-descent parser turning query tokens into a Query tree"""
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.position = 0
+
+    def peek(self):
+        if self.position < len(self.tokens):
+            return self.tokens[self.position]
+        return None
+
+    def parse_or(self):
+        children = [self.parse_and()]
+        while self.peek() == ("op", "|"):
+            self.position += 1
+            children.append(self.parse_and())
+        return children[0] if len(children) == 1 else ("or", children)
+
+    def parse_and(self):
+        children = [self.parse_not()]
+        while self.peek() == ("op", "&"):
+            self.position += 1
+            children.append(self.parse_not())
+        return children[0] if len(children) == 1 else ("and", children)
+
+    def parse_not(self):
+        token = self.peek()
+        if token is None:
+            raise ValueError("query ends unexpectedly")
+        self.position += 1
+        if token == ("op", "!"):
+            return ("not", self.parse_not())
+        if token == ("op", "("):
+            node = self.parse_or()
+            if self.peek() != ("op", ")"):
+                raise ValueError("missing ')' in query")
+            self.position += 1
+            return node
+        if token[0] == "tag":
+            return token
+        raise ValueError(f"unexpected '{token[1]}' in query")
+
+
+class BitsetCache:
+    """Least-recently-used cache of per-tag image bitsets.
+
+    'build' computes the bitset of a tag on a miss; 'invalidate' must be called whenever the images holding a tag change.
+    """
+
+    def __init__(self, build, max_entries=BITSET_CACHE_SIZE):
+        self.build = build
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+
+    def get(self, tag):
+        bits = self.entries.get(tag)
+        if bits is not None:
+            self.entries.move_to_end(tag)
+            return bits
+        bits = self.build(tag)
+        self.entries[tag] = bits
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return bits
+
+    def invalidate(self, tag):
+        self.entries.pop(tag, None)
+
+    def clear(self):
+        self.entries.clear()
@@ -0,0 +1,57 @@
+import os
+
+
+def iter_dataset(directory):
+    """Walks a directory tree once, yielding each .png image with its .txt caption as it is found.
+
+    Yields (png_path, txt_path) tuples, with txt_path None for images without a caption.
+    Only one directory listing is held at a time, so memory does not grow with the size of the dataset.
+    The tree is traversed with an explicit stack rather than recursion, so deep hierarchies cannot
+    exceed Python's recursion limit. Each directory is listed once with os.scandir, and the type
+    information cached on every os.DirEntry is reused instead of stat-ing each path again.
+    A .png file is paired with a .txt file of the same stem found in the same directory listing.
+    Images are yielded depth-first, with the entries of each directory sorted by name.
+    """
+    stack = [directory]
+    while stack:
+        path = stack.pop()
+        with os.scandir(path) as it:
+            entries = sorted(it, key=lambda entry: entry.name)
+        subdirs = []
+        png_stems = []
+        txt_stems = set()
+        for entry in entries:
+            if entry.is_dir():
+                subdirs.append(entry.path)
+            elif entry.name.endswith(".png"):
+                if entry.is_file():
+                    png_stems.append(entry.name[:-4])
+            elif entry.name.endswith(".txt"):
+                if entry.is_file():
+                    txt_stems.add(entry.name[:-4])
+        for stem in png_stems:
+            png_path = os.path.join(path, f"{stem}.png")
+            if stem in txt_stems:
+                yield png_path, os.path.join(path, f"{stem}.txt")
+            else:
+                yield png_path, None
+        # push in reverse so that subdirectories are visited in sorted order
+        stack.extend(reversed(subdirs))
+
+
+def scan_dataset(directory):
+    """Pairs every .png image under a directory with its .txt caption, using 'iter_dataset'.
+
+    Returns a tuple of two lists:
+        pairs: (png_path, txt_path) tuples for every captioned image
+        missing: png paths for which no .txt caption exists
+    Both lists are in the order images were found by 'iter_dataset'.
+    """
+    pairs = []
+    missing = []
+    for png_path, txt_path in iter_dataset(directory):
+        if txt_path is None:
+            missing.append(png_path)
+        else:
+            pairs.append((png_path, txt_path))
+    return pairs, missing
@@ -0,0 +1,183 @@
+from batch import BatchReport, count_tag_deltas, protect_trigger_word
+from ingest import read_caption
+from caption import Caption
+from dataset import write_caption_atomic
+from concurrent.futures import ProcessPoolExecutor
+import difflib
+import os
+import time
+import zlib
+
+# number of shards handed out per worker process, so that unevenly sized shards still keep every process busy
+SHARDS_PER_JOB = 4
+
+
+def split_by_hash(txt_paths, count):
+    """Splits caption paths into 'count' shards by a stable hash of each path"""
+    shards = [[] for _ in range(count)]
+    for txt_path in txt_paths:
+        shards[zlib.crc32(txt_path.encode()) % count].append(txt_path)
+    return [shard for shard in shards if len(shard) > 0]
+
+
+def split_by_directory(txt_paths, count):
+    """Splits caption paths into up to 'count' shards, keeping the captions of each directory together.
+
+    Directories are assigned largest first to the shard with the fewest captions, balancing the shards.
+    """
+    directories = {}
+    for txt_path in txt_paths:
+        directories.setdefault(os.path.dirname(txt_path), []).append(txt_path)
+    shards = [[] for _ in range(count)]
+    for paths in sorted(directories.values(), key=len, reverse=True):
+        min(shards, key=len).extend(paths)
+    return [shard for shard in shards if len(shard) > 0]
+
+
+SHARDING = {"hash": split_by_hash, "directory": split_by_directory}
+
+
+class ShardResult(BatchReport):
+    """The outcome of editing one shard in a worker process.
+
+    On top of the counts of a BatchReport, holds (txt_path, caption_text, (size, mtime_ns)) for every caption written
+    when asked to collect them, and, for dry runs, the diff lines of every change in the shard.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.written = []
+        self.diff_lines = []
+
+    def merge(self, other):
+        super().merge(other)
+        self.written.extend(other.written)
+        self.diff_lines.extend(other.diff_lines)
+
+
+def edit_shard(txt_paths, edit, dry_run=False, collect_written=False):
+    """Applies an edit to every caption of a shard; runs in a worker process. Returns a ShardResult.
+
+    The captions written are only listed in the result with 'collect_written' set.
+    """
+    result = ShardResult()
+    for txt_path in txt_paths:
+        try:
+            text, tags = read_caption(txt_path)
+        except Exception as e:
+            result.read_report.add_error(txt_path, str(e))
+            continue
+        result.captions_read += 1
+        caption = Caption(tags)
+        if not edit.apply(caption):
+            continue
+        result.captions_changed += 1
+        count_tag_deltas(tags, caption, result.tag_deltas)
+        new_text = caption.serialize()
+        if dry_run:
+            result.diff_lines.extend(
+                difflib.unified_diff(
+                    [text], [new_text], txt_path, txt_path, lineterm=""
+                )
+            )
+            continue
+        st = write_caption_atomic(txt_path, new_text)
+        result.bytes_written += st.st_size
+        if collect_written:
+            result.written.append((txt_path, new_text, (st.st_size, st.st_mtime_ns)))
+    return result
+
+
+def run_sharded(
+    txt_paths,
+    edit,
+    jobs=None,
+    shard_by="hash",
+    dry_run=False,
+    out=print,
+    collect_written=False,
+):
+    """Applies an edit to many captions across a pool of worker processes.
+
+    The captions are split into shards, by path hash or by directory (see SHARDING), several per process;
+    each worker parses, edits and writes its shard independently, so the work is not serialized by the GIL.
+    With dry_run, nothing is written and the diff lines of each shard are passed to 'out' as the shard completes,
+    rather than kept. Returns a ShardResult merged from every shard, whose 'tag_deltas' give the change in each
+    tag's count; its 'written' list is only filled in with 'collect_written' set, as it holds every caption's text.
+    The trigger word is not checked here; callers protect it with 'protect_trigger_word'.
+    """
+    jobs = jobs or os.cpu_count() or 1
+    shards = SHARDING[shard_by](txt_paths, jobs * SHARDS_PER_JOB)
+    result = ShardResult()
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        for shard_result in executor.map(
+            edit_shard,
+            shards,
+            [edit] * len(shards),
+            [dry_run] * len(shards),
+            [collect_written] * len(shards),
+        ):
+            for line in shard_result.diff_lines:
+                out(line)
+            shard_result.diff_lines = []
+            result.merge(shard_result)
+    result.elapsed = time.perf_counter() - start
+    return result
+
+
+def edit_dataset_sharded(dataset, edit, jobs=None, shard_by="hash"):
+    """Applies an edit to every caption of a loaded Dataset with 'run_sharded', then updates the dataset to match.
+
+    Workers read captions from disk, so a lazy dataset is first loaded in full and any unsaved edits are saved.
+    The tag-count deltas returned by the workers are merged into the dataset's tag trie. Returns the ShardResult.
+    """
+    dataset.wait_until_loaded()
+    protect_trigger_word(dataset.trigger_word, edit)
+    if len(dataset.dirty) > 0:
+        dataset.save_dataset()
+    txt_paths = [txt_path for txt_path, _ in dataset.cache.values() if txt_path]
+    result = run_sharded(
+        txt_paths, edit, jobs=jobs, shard_by=shard_by, collect_written=True
+    )
+    dataset.apply_written_captions(result.written)
+    dataset.merge_tag_deltas(result.tag_deltas)
+    return result
+
+
+class ShardedDatasetEdit:
+    """Runs 'edit_dataset_sharded' as a TaskRunner task of a single step, for the GUI.
+
+    Captions are written to disk as the edit runs, so it cannot be rolled back: cancelling only stops it
+    before it starts, and a failure is reported rather than raised, as the captions already written stay edited.
+    """
+
+    def __init__(self, dataset, edit, jobs=None, shard_by="hash"):
+        self.dataset = dataset
+        self.edit = edit
+        self.jobs = jobs
+        self.shard_by = shard_by
+        self.done = 0
+        self.result = None
+
+    def total(self):
+        return 1
+
+    def finished(self):
+        return self.done == 1
+
+    def step(self, count):
+        try:
+            self.result = edit_dataset_sharded(
+                self.dataset, self.edit, jobs=self.jobs, shard_by=self.shard_by
+            )
+            print(f"Sharded edit finished: {self.result}")
+        except Exception as e:
+            print(
+                f"Sharded edit failed: {e}. Captions it already wrote stay edited on disk; "
+                "reopen the dataset to see them."
+            )
+        self.done = 1
+
+    def rollback(self):
+        pass
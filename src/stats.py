@@ -0,0 +1,334 @@
+import threading
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# number of most frequent tags whose pairwise co-occurrence is tracked
+TOP_TAGS = 256
+# tags used at most this many times are listed as rare
+RARE_TAG_COUNT = 1
+# images multiplied at a time when computing co-occurrence; bounds the dense block held in memory
+COOCCURRENCE_CHUNK = 8192
+# once more than this fraction of the images has been edited, statistics are rebuilt on next use rather than patched
+STALE_FRACTION = 0.125
+
+
+class TagStats:
+    """Vectorized tag statistics over a Dataset, built on an image x tag incidence matrix.
+
+    Images are numbered by 'Dataset.image_ids' and tags by their position in 'self.tags'. The incidence matrix is
+    held in compressed sparse row form: the tag ids of image i are 'self.indices[self.indptr[i]:self.indptr[i + 1]]'.
+    From it, tag frequencies come from one bincount and the co-occurrence counts of the TOP_TAGS most frequent tags
+    from dense products of blocks of rows.
+
+    The statistics follow the dataset through its listeners. An edited image's old row is compared with its
+    current caption, and the counts are patched with the difference; the new row is kept in 'self.edited_rows'.
+    Patching is idempotent, so an image can be reported any number of times. The co-occurrence matrix only covers
+    the top tags chosen at build time, so an edit that changes which tags are the TOP_TAGS most frequent marks the
+    statistics stale, as do very many edits such as a dataset-wide one; stale statistics are rebuilt the next time
+    they are read.
+    Requires NumPy.
+    """
+
+    def __init__(self, dataset, top_tags=TOP_TAGS):
+        if np is None:
+            raise Exception(
+                "Tag statistics require NumPy, an optional dependency; install it with `pip install numpy`."
+            )
+        self.dataset = dataset
+        self.top_tags = top_tags
+        self.lock = threading.RLock()
+        # held for the whole of a build, so that concurrent readers wait for one build instead of starting another
+        self.build_lock = threading.Lock()
+        self.stale = True
+        self.building = False
+        # images edited while a build was running; their rows are re-checked once it finishes
+        self.pending = set()
+        dataset.listeners.append(self.update)
+
+    def build(self):
+        """Builds the incidence matrix and every statistic derived from it in a few vectorized passes"""
+        self.dataset.wait_until_loaded()
+        with self.lock:
+            self.building = True
+            self.pending.clear()
+        try:
+            dataset = self.dataset
+            tags = list(dataset.tag_images)
+            tag_ids = {tag: j for j, tag in enumerate(tags)}
+            # iterating a Caption takes a snapshot, so captions edited meanwhile cannot break the pass
+            captions = [list(dataset.caption_of(png)) for png in dataset.image_set]
+            lengths = np.fromiter(
+                map(len, captions), dtype=np.int64, count=len(captions)
+            )
+            indptr = np.zeros(len(captions) + 1, dtype=np.int64)
+            np.cumsum(lengths, out=indptr[1:])
+            indices = np.fromiter(
+                (
+                    tag_ids.setdefault(tag, len(tag_ids))
+                    for caption in captions
+                    for tag in caption
+                ),
+                dtype=np.int64,
+                count=int(indptr[-1]),
+            )
+            del captions
+            tags = list(tag_ids)
+            counts = np.bincount(indices, minlength=len(tags))
+            top = np.argsort(-counts, kind="stable")[: self.top_tags]
+            top = top[counts[top] > 0]
+            top_index = np.full(len(tags), -1, dtype=np.int64)
+            top_index[top] = np.arange(len(top))
+            outside = counts[top_index < 0]
+            outside_max = int(outside.max()) if len(outside) > 0 else 0
+            cooccurrence = self.count_cooccurrence(indptr, indices, top_index, len(top))
+        except BaseException:
+            with self.lock:
+                self.building = False
+            raise
+        with self.lock:
+            self.tags = tags
+            self.tag_ids = tag_ids
+            self.indptr = indptr
+            self.indices = indices
+            self.lengths = lengths
+            self.counts = counts
+            self.top = top
+            self.top_index = top_index
+            self.outside_max = outside_max
+            self.cooccurrence = cooccurrence
+            self.edited_rows = {}
+            self.stale = False
+            self.building = False
+            pending = list(self.pending)
+            self.pending.clear()
+            for png_path in pending:
+                self.update(png_path)
+
+    def count_cooccurrence(self, indptr, indices, top_index, size):
+        """Returns the size x size matrix counting, for each pair of top tags, the images holding both"""
+        cooccurrence = np.zeros((size, size), dtype=np.int64)
+        if size == 0:
+            return cooccurrence
+        n = len(indptr) - 1
+        for start in range(0, n, COOCCURRENCE_CHUNK):
+            stop = min(start + COOCCURRENCE_CHUNK, n)
+            columns = top_index[indices[indptr[start] : indptr[stop]]]
+            rows = np.repeat(np.arange(stop - start), np.diff(indptr[start : stop + 1]))
+            kept = columns >= 0
+            block = np.zeros((stop - start, size), dtype=np.float32)
+            block[rows[kept], columns[kept]] = 1.0
+            # exact: every entry of the product is an integer no larger than COOCCURRENCE_CHUNK
+            cooccurrence += (block.T @ block).astype(np.int64)
+        return cooccurrence
+
+    def ensure_built(self):
+        with self.build_lock:
+            if self.stale:
+                self.build()
+
+    def ready(self):
+        """Returns whether the statistics can be read without waiting for a build"""
+        with self.lock:
+            return not self.stale and not self.building
+
+    def recommend(self, tags, limit=8, exclude=()):
+        """Suggests top tags likely to belong in a caption holding the given tags, best first.
+
+        Each candidate t is scored by its mean conditional frequency P(t | s) = cooccurrence(s, t) / count(s)
+        over the caption's tags s that are among the top tags. Returns (tag, score) pairs with a positive score,
+        or an empty list if the statistics are not ready; this never waits for a build, so it is safe to call
+        on every navigation step.
+        """
+        with self.lock:
+            if self.stale or self.building:
+                return []
+            present = [self.tag_ids[tag] for tag in tags if tag in self.tag_ids]
+            present = self.top_index[present] if len(present) > 0 else present
+            present = [k for k in present if k >= 0]
+            if len(present) == 0:
+                return []
+            top_counts = np.maximum(np.diagonal(self.cooccurrence)[present], 1)
+            scores = (self.cooccurrence[present] / top_counts[:, None]).mean(axis=0)
+            scores[present] = 0.0
+            for tag in exclude:
+                k = self.top_index[self.tag_ids[tag]] if tag in self.tag_ids else -1
+                if k >= 0:
+                    scores[k] = 0.0
+            limit = min(limit, np.count_nonzero(scores > 0))
+            if limit == 0:
+                return []
+            best = np.argpartition(-scores, limit - 1)[:limit]
+            best = best[np.argsort(-scores[best], kind="stable")]
+            return [(self.tags[self.top[k]], float(scores[k])) for k in best]
+
+    def tag_id(self, tag):
+        """Returns the id of a tag, numbering it if it is new to the statistics"""
+        j = self.tag_ids.get(tag)
+        if j is None:
+            j = len(self.tags)
+            self.tag_ids[tag] = j
+            self.tags.append(tag)
+            if j >= len(self.counts):
+                grown = max(2 * len(self.counts), j + 1)
+                self.counts = np.concatenate(
+                    [self.counts, np.zeros(grown - len(self.counts), dtype=np.int64)]
+                )
+                self.top_index = np.concatenate(
+                    [
+                        self.top_index,
+                        np.full(grown - len(self.top_index), -1, dtype=np.int64),
+                    ]
+                )
+        return j
+
+    def row(self, i):
+        row = self.edited_rows.get(i)
+        if row is None:
+            row = self.indices[self.indptr[i] : self.indptr[i + 1]]
+        return row
+
+    def update(self, png_path):
+        """Patches the statistics with the difference between an image's recorded tags and its current caption"""
+        with self.lock:
+            if self.building:
+                self.pending.add(png_path)
+                return
+            if self.stale:
+                return
+            i = self.dataset.image_ids.get(png_path)
+            if i is None:
+                return
+            old = self.row(i)
+            new = np.fromiter(
+                (self.tag_id(tag) for tag in self.dataset.caption_of(png_path)),
+                dtype=np.int64,
+            )
+            if len(old) == len(new) and np.array_equal(np.sort(old), np.sort(new)):
+                return
+            self.counts[old] -= 1
+            self.counts[new] += 1
+            self.lengths[i] = len(new)
+            for row, delta in ((old, -1), (new, 1)):
+                top = self.top_index[row]
+                top = top[top >= 0]
+                self.cooccurrence[np.ix_(top, top)] += delta
+            self.edited_rows[i] = new
+            if (
+                self.top_changed(np.union1d(old, new))
+                or len(self.edited_rows) > STALE_FRACTION * len(self.lengths) + 1024
+            ):
+                self.stale = True
+                self.edited_rows = {}
+
+    def top_changed(self, changed):
+        """Returns whether patching the counts of the given tag ids changed which tags are the top tags.
+
+        'self.outside_max' bounds the count of every tag outside the top tags from above. A top tag falling to
+        zero, an outside tag appearing while there are fewer than TOP_TAGS top tags, or the bound exceeding the
+        lowest top count means a rebuild would choose differently. Ties are left as they are.
+        """
+        inside = self.top_index[changed] >= 0
+        if np.any(self.counts[changed[inside]] == 0):
+            return True
+        outside = self.counts[changed[~inside]]
+        if len(outside) > 0:
+            self.outside_max = max(self.outside_max, int(outside.max()))
+        if self.outside_max == 0:
+            return False
+        if len(self.top) < self.top_tags:
+            return True
+        return int(self.counts[self.top].min()) < self.outside_max
+
+    def tag_count(self, tag):
+        self.ensure_built()
+        with self.lock:
+            j = self.tag_ids.get(tag)
+            return 0 if j is None else int(self.counts[j])
+
+    def frequencies(self, limit=None):
+        """Returns (tag, count) pairs for every tag in use, most frequent first"""
+        self.ensure_built()
+        with self.lock:
+            counts = self.counts[: len(self.tags)]
+            order = np.argsort(-counts, kind="stable")
+            order = order[counts[order] > 0][:limit]
+            return [(self.tags[j], int(counts[j])) for j in order]
+
+    def histogram(self):
+        """Returns an array whose entry n is the number of captions holding exactly n tags"""
+        self.ensure_built()
+        with self.lock:
+            return np.bincount(self.lengths)
+
+    def rare_tags(self, max_count=RARE_TAG_COUNT):
+        """Returns (tag, count) pairs for the tags used at least once but at most max_count times, rarest first"""
+        self.ensure_built()
+        with self.lock:
+            counts = self.counts[: len(self.tags)]
+            rare = np.nonzero((counts > 0) & (counts <= max_count))[0]
+            rare = rare[np.argsort(counts[rare], kind="stable")]
+            return [(self.tags[j], int(counts[j])) for j in rare]
+
+    def cooccurrence_of(self, tag_a, tag_b):
+        """Returns the number of images holding both tags, or None if either is not among the top tags"""
+        self.ensure_built()
+        with self.lock:
+            a = self.top_index[self.tag_ids[tag_a]] if tag_a in self.tag_ids else -1
+            b = self.top_index[self.tag_ids[tag_b]] if tag_b in self.tag_ids else -1
+            if a < 0 or b < 0:
+                return None
+            return int(self.cooccurrence[a, b])
+
+    def top_pairs(self, limit=10):
+        """Returns (tag_a, tag_b, count) for the most frequent pairs of distinct top tags"""
+        self.ensure_built()
+        with self.lock:
+            upper = np.triu(self.cooccurrence, 1)
+            flat = upper.ravel()
+            limit = min(limit, np.count_nonzero(flat))
+            if limit == 0:
+                return []
+            best = np.argpartition(-flat, limit - 1)[:limit]
+            best = best[np.argsort(-flat[best], kind="stable")]
+            size = len(self.cooccurrence)
+            return [
+                (
+                    self.tags[self.top[k // size]],
+                    self.tags[self.top[k % size]],
+                    int(flat[k]),
+                )
+                for k in best
+            ]
+
+    def summary(self, limit=10):
+        """Returns a plain-text report of the statistics, for the statistics panel"""
+        frequencies = self.frequencies()
+        histogram = self.histogram()
+        rare = self.rare_tags()
+        pairs = self.top_pairs(limit)
+        with self.lock:
+            images = len(self.lengths)
+            occurrences = int(self.lengths.sum())
+        lines = [
+            f"Images: {images}",
+            f"Distinct tags: {len(frequencies)}",
+            f"Tags per caption: {occurrences / max(images, 1):.1f} on average, {len(histogram) - 1} at most",
+            "",
+            "Most common tags:",
+        ]
+        lines += [f"  {count:>8}  {tag}" for tag, count in frequencies[:limit]]
+        lines += ["", "Captions by number of tags:"]
+        # group the histogram into at most 'limit' rows
+        step = max(1, -(-len(histogram) // limit))
+        for start in range(0, len(histogram), step):
+            stop = min(start + step, len(histogram))
+            label = f"{start}" if stop - start == 1 else f"{start}-{stop - 1}"
+            lines.append(f"  {label:>8}  {int(histogram[start:stop].sum())}")
+        lines += ["", f"Rare tags (used at most {RARE_TAG_COUNT}x): {len(rare)}"]
+        lines += [f"  {tag}" for tag, _ in rare[:limit]]
+        lines += ["", "Most common tag pairs:"]
+        lines += [f"  {count:>8}  {a} + {b}" for a, b, count in pairs]
+        return "\n".join(lines)
@@ -1,3 +1,16 @@
+import bisect
+import heapq
+
+
+def next_distance_row(row, word, char):
+    """Given the row of the edit-distance table for some prefix against word, returns the row for prefix + char"""
+    next_row = [row[0] + 1]
+    for i in range(1, len(row)):
+        cost = 0 if word[i - 1] == char else 1
+        next_row.append(min(next_row[i - 1] + 1, row[i] + 1, row[i - 1] + cost))
+    return next_row
+
+
 class Queue:
     def __init__(self):
         self.items = []
@@ -22,20 +35,32 @@ class Queue:
 
 
 class Trie:
-    def __init__(self):
+    def __init__(self, top_k=8):
         self.root = {}
         self.end_symbol = "*"
+        # key under which each node caches the (-count, word) pairs of the most frequent words beneath it;
+        # being two characters long, it can never collide with a single-character child key
+        self.top_symbol = "**"
+        self.top_k = top_k
+
+    def children(self, node):
+        """Returns the (char, child) pairs of a node, leaving out its end and top symbols"""
+        return [
+            (key, child)
+            for key, child in node.items()
+            if key != self.end_symbol and key != self.top_symbol
+        ]
 
     def longest_common_prefix(self):
         current = self.root
         prefix = ""
         while True:
-            keys = list(current.keys())
-            if self.end_symbol in keys:
+            if self.end_symbol in current:
                 break
-            if len(keys) == 1:
-                prefix = prefix + keys[0]
-                current = current[keys[0]]
+            children = self.children(current)
+            if len(children) == 1:
+                prefix = prefix + children[0][0]
+                current = children[0][1]
             else:
                 break
         return prefix
@@ -56,7 +81,7 @@ class Trie:
         if self.end_symbol in current_level:
             words.append(current_prefix)
         for key in sorted(current_level):
-            if key != self.end_symbol:
+            if key != self.end_symbol and key != self.top_symbol:
                 self.search_level(current_level[key], (current_prefix + key), words)
         return words
 
@@ -70,6 +95,64 @@ class Trie:
         self.search_level(current, prefix, matching)
         return matching
 
+    def top_words_with_prefix(self, prefix, k, skip=()):
+        """Returns up to k words beginning with prefix, most frequent first (ties alphabetically).
+
+        Words in 'skip' are left out of the results.
+        Without skipped words, the result is read straight from the list cached on the prefix node.
+        Otherwise the subtree is searched best-first, each node ordered by the best word cached beneath it,
+        so only as much of the trie is visited as is needed to find k words.
+        """
+        current = self.root
+        for c in prefix:
+            if c not in current:
+                return []
+            current = current[c]
+        top = current.get(self.top_symbol, [])
+        if k <= self.top_k:
+            words = [word for _, word in top if word not in skip]
+            if len(words) >= k or len(top) < self.top_k:
+                return words[:k]
+        # entries are (-count, word, kind, prefix, node); words (kind 0) precede nodes (kind 1) with the same key
+        heap = []
+        if len(top) > 0:
+            heap.append((top[0][0], top[0][1], 1, prefix, current))
+        words = []
+        while len(heap) > 0 and len(words) < k:
+            neg_count, word, kind, node_prefix, node = heapq.heappop(heap)
+            if kind == 0:
+                if word not in skip:
+                    words.append(word)
+                continue
+            if self.end_symbol in node:
+                heapq.heappush(
+                    heap, (-node[self.end_symbol], node_prefix, 0, node_prefix, None)
+                )
+            for key, child in self.children(node):
+                best = child[self.top_symbol][0]
+                heapq.heappush(heap, (best[0], best[1], 1, node_prefix + key, child))
+        return words
+
+    def fuzzy_words(self, word, max_distance):
+        """Returns the words within 'max_distance' edits (Levenshtein distance) of word, most frequent first.
+
+        Walks the trie while carrying one row of the edit-distance table per node, so every word sharing
+        a prefix shares its computation, and abandons a branch as soon as no entry of its row is within
+        'max_distance', since no word beneath it can be either.
+        """
+        matches = []
+        first_row = list(range(len(word) + 1))
+        stack = [(self.root, "", first_row)]
+        while len(stack) > 0:
+            node, node_word, row = stack.pop()
+            if self.end_symbol in node and row[-1] <= max_distance:
+                matches.append((-node[self.end_symbol], row[-1], node_word))
+            for char, child in self.children(node):
+                next_row = next_distance_row(row, word, char)
+                if min(next_row) <= max_distance:
+                    stack.append((child, node_word + char, next_row))
+        return [match for _, _, match in sorted(matches)]
+
     def exists(self, word):
         current = self.root
         for char in word:
@@ -97,18 +180,31 @@ class Trie:
                 return current[self.end_symbol]
         return 0
 
-    def add(self, word):
+    def add(self, word, count=1):
         current = self.root
+        path = [current]
         for char in word:
             if char not in current:
-                current[char] = {}
+                current[char] = {self.top_symbol: []}
             current = current[char]
+            path.append(current)
         if self.end_symbol not in current:
-            current[self.end_symbol] = 1
+            current[self.end_symbol] = count
         else:
-            current[self.end_symbol] = current[self.end_symbol] + 1
+            current[self.end_symbol] = current[self.end_symbol] + count
+        # a word's count only grows here, so it can only enter or rise within each cached list along its path
+        entry = (-current[self.end_symbol], word)
+        for node in path:
+            top = node.setdefault(self.top_symbol, [])
+            for i in range(len(top)):
+                if top[i][1] == word:
+                    del top[i]
+                    break
+            if len(top) < self.top_k or entry < top[-1]:
+                bisect.insort(top, entry)
+                del top[self.top_k :]
 
-    def remove(self, word):
+    def remove(self, word, count=1):
         current = self.root
         parent_stack = []
         parent_keys = []
@@ -120,17 +216,355 @@ class Trie:
             else:
                 # word does not exist in trie
                 return
-        if self.end_symbol in current:
-            if current[self.end_symbol] > 1:
-                current[self.end_symbol] = current[self.end_symbol] - 1
-                return
+        if self.end_symbol not in current:
+            return
+        if current[self.end_symbol] > count:
+            current[self.end_symbol] = current[self.end_symbol] - count
+        else:
             del current[self.end_symbol]
-            while len(parent_stack) > 0:
-                current = parent_stack.pop()
-                key = parent_keys.pop()
-                if len(current[key]) == 0:
-                    del current[key]
+        # walk back up, pruning emptied nodes and rebuilding the cached lists the word was ranked in
+        node_prefix = word
+        while True:
+            if self.word_in_top(current, word):
+                self.rebuild_top(current, node_prefix)
+            if len(parent_stack) == 0:
+                break
+            parent = parent_stack.pop()
+            key = parent_keys.pop()
+            if self.end_symbol not in current and len(self.children(current)) == 0:
+                del parent[key]
+            current = parent
+            node_prefix = node_prefix[:-1]
+        return
+
+    def word_in_top(self, node, word):
+        for _, top_word in node.get(self.top_symbol, []):
+            if top_word == word:
+                return True
+        return False
+
+    def rebuild_top(self, node, node_prefix):
+        """Recomputes a node's cached list from its own word and the cached lists of its children"""
+        candidates = []
+        if self.end_symbol in node:
+            candidates.append((-node[self.end_symbol], node_prefix))
+        for _, child in self.children(node):
+            candidates.extend(child[self.top_symbol])
+        node[self.top_symbol] = heapq.nsmallest(self.top_k, candidates)
+
+
+class RadixNode:
+    __slots__ = ("label", "children", "count", "top")
+
+    def __init__(self, label, count=None):
+        # characters on the edge leading into this node
+        self.label = label
+        # first character of each child's label -> child; None while the node is a leaf
+        self.children = None
+        # number of times the word ending at this node was added; None if no word ends here
+        self.count = count
+        # (-count, word) pairs of the most frequent words beneath this node, best first
+        self.top = []
+
+
+class RadixTrie:
+    """A path-compressed trie offering the same interface as 'Trie'.
+
+    Chains of single-child nodes are collapsed into one node whose edge carries a whole substring,
+    and every node is a slotted object rather than a dict. Vocabularies of long tags therefore need
+    a small fraction of the nodes, and the memory, of a trie with one dict per character.
+    """
+
+    def __init__(self, top_k=8):
+        self.root = RadixNode("")
+        self.top_k = top_k
+
+    def find(self, word):
+        """Returns the path of (node, node_word) pairs from the root to the node where word ends, or None"""
+        node = self.root
+        node_word = ""
+        path = [(node, node_word)]
+        i = 0
+        while i < len(word):
+            if node.children is None or word[i] not in node.children:
+                return None
+            node = node.children[word[i]]
+            if not word.startswith(node.label, i):
+                return None
+            i += len(node.label)
+            node_word = word[:i]
+            path.append((node, node_word))
+        return path
+
+    def locate(self, prefix):
+        """Returns (node, node_word) for the shallowest node whose word begins with prefix, or (None, None)"""
+        node = self.root
+        i = 0
+        while i < len(prefix):
+            if node.children is None or prefix[i] not in node.children:
+                return None, None
+            node = node.children[prefix[i]]
+            label = node.label
+            rest = prefix[i:]
+            if len(rest) <= len(label):
+                if not label.startswith(rest):
+                    return None, None
+                return node, prefix[:i] + label
+            if not prefix.startswith(label, i):
+                return None, None
+            i += len(label)
+        return node, prefix
+
+    def longest_common_prefix(self):
+        node = self.root
+        prefix = ""
+        while node.count is None and node.children is not None:
+            if len(node.children) != 1:
+                break
+            node = next(iter(node.children.values()))
+            prefix = prefix + node.label
+        return prefix
+
+    def find_matches(self, document):
+        matches = set()
+        for i in range(len(document)):
+            node = self.root
+            j = i
+            while j < len(document):
+                if node.children is None or document[j] not in node.children:
+                    break
+                node = node.children[document[j]]
+                if not document.startswith(node.label, j):
+                    break
+                j += len(node.label)
+                if node.count is not None:
+                    matches.add(document[i:j])
+        return matches
+
+    def words_with_prefix(self, prefix):
+        node, node_word = self.locate(prefix)
+        if node is None:
+            return []
+        matching = []
+        stack = [(node, node_word)]
+        while len(stack) > 0:
+            node, node_word = stack.pop()
+            if node.count is not None:
+                matching.append(node_word)
+            if node.children is not None:
+                for key in sorted(node.children, reverse=True):
+                    child = node.children[key]
+                    stack.append((child, node_word + child.label))
+        return matching
+
+    def top_words_with_prefix(self, prefix, k, skip=()):
+        """Returns up to k words beginning with prefix, most frequent first (ties alphabetically).
+
+        Works as 'Trie.top_words_with_prefix' does, reading each node's cached list of best words.
+        """
+        node, node_word = self.locate(prefix)
+        if node is None:
+            return []
+        top = node.top
+        if k <= self.top_k:
+            words = [word for _, word in top if word not in skip]
+            if len(words) >= k or len(top) < self.top_k:
+                return words[:k]
+        # entries are (-count, word, kind, node_word, node); words (kind 0) precede nodes (kind 1) with the same key
+        heap = []
+        if len(top) > 0:
+            heap.append((top[0][0], top[0][1], 1, node_word, node))
+        words = []
+        while len(heap) > 0 and len(words) < k:
+            neg_count, word, kind, node_word, node = heapq.heappop(heap)
+            if kind == 0:
+                if word not in skip:
+                    words.append(word)
+                continue
+            if node.count is not None:
+                heapq.heappush(heap, (-node.count, node_word, 0, node_word, None))
+            if node.children is not None:
+                for child in node.children.values():
+                    best = child.top[0]
+                    heapq.heappush(
+                        heap, (best[0], best[1], 1, node_word + child.label, child)
+                    )
+        return words
+
+    def fuzzy_words(self, word, max_distance):
+        """Returns the words within 'max_distance' edits (Levenshtein distance) of word, most frequent first.
+
+        Works as 'Trie.fuzzy_words' does, advancing the edit-distance row one character at a time along each edge.
+        """
+        matches = []
+        first_row = list(range(len(word) + 1))
+        stack = [(self.root, "", first_row)]
+        while len(stack) > 0:
+            node, node_word, row = stack.pop()
+            if node.count is not None and row[-1] <= max_distance:
+                matches.append((-node.count, row[-1], node_word))
+            if node.children is None:
+                continue
+            for child in node.children.values():
+                child_row = row
+                for char in child.label:
+                    child_row = next_distance_row(child_row, word, char)
+                    if min(child_row) > max_distance:
+                        break
                 else:
+                    stack.append((child, node_word + child.label, child_row))
+        return [match for _, _, match in sorted(matches)]
+
+    def exists(self, word):
+        path = self.find(word)
+        return path is not None and path[-1][0].count is not None
+
+    def get(self, word):
+        """Returns the count stored for a word.
+
+        A return value of 0 does NOT necessarily mean the word does not exist!
+        """
+        path = self.find(word)
+        if path is None or path[-1][0].count is None:
+            return 0
+        return path[-1][0].count
+
+    def add(self, word, count=1):
+        node = self.root
+        path = [node]
+        i = 0
+        while i < len(word):
+            if node.children is None:
+                node.children = {}
+            child = node.children.get(word[i])
+            if child is None:
+                child = RadixNode(word[i:])
+                node.children[word[i]] = child
+                path.append(child)
+                node = child
+                break
+            label = child.label
+            j = 1
+            while j < len(label) and i + j < len(word) and label[j] == word[i + j]:
+                j += 1
+            if j < len(label):
+                # the word diverges (or ends) partway along the edge: split it at the divergence
+                middle = RadixNode(label[:j])
+                middle.children = {label[j]: child}
+                middle.top = list(child.top)
+                child.label = label[j:]
+                node.children[word[i]] = middle
+                child = middle
+            path.append(child)
+            node = child
+            i += j
+        if node.count is None:
+            node.count = count
+        else:
+            node.count = node.count + count
+        # a word's count only grows here, so it can only enter or rise within each cached list along its path
+        entry = (-node.count, word)
+        for node in path:
+            top = node.top
+            for i in range(len(top)):
+                if top[i][1] == word:
+                    del top[i]
                     break
+            if len(top) < self.top_k or entry < top[-1]:
+                bisect.insort(top, entry)
+                del top[self.top_k :]
+
+    def remove(self, word, count=1):
+        path = self.find(word)
+        if path is None or path[-1][0].count is None:
+            # word does not exist in trie
+            return
+        node = path[-1][0]
+        if node.count > count:
+            node.count = node.count - count
+        else:
+            node.count = None
+        # walk back up, rebuilding the cached lists the word was ranked in and re-compressing emptied nodes
+        for depth in range(len(path) - 1, -1, -1):
+            node, node_word = path[depth]
+            if self.word_in_top(node, word):
+                self.rebuild_top(node, node_word)
+            if depth == 0 or node.count is not None:
+                continue
+            parent = path[depth - 1][0]
+            if node.children is None:
+                del parent.children[node.label[0]]
+                if len(parent.children) == 0:
+                    parent.children = None
+            elif len(node.children) == 1:
+                child = next(iter(node.children.values()))
+                child.label = node.label + child.label
+                parent.children[node.label[0]] = child
         return
 
+    def word_in_top(self, node, word):
+        for _, top_word in node.top:
+            if top_word == word:
+                return True
+        return False
+
+    def rebuild_top(self, node, node_word):
+        """Recomputes a node's cached list from its own word and the cached lists of its children"""
+        candidates = []
+        if node.count is not None:
+            candidates.append((-node.count, node_word))
+        if node.children is not None:
+            for child in node.children.values():
+                candidates.extend(child.top)
+        node.top = heapq.nsmallest(self.top_k, candidates)
+
+
+class InfixIndex:
+    """Finds the words of a vocabulary that contain a given fragment anywhere within them.
+
+    Every word is indexed under each of its trigrams (substrings of three characters).
+    A fragment of three or more characters can then only occur in words sharing all of its trigrams,
+    so candidates come from intersecting a few sets, smallest first, before each is checked directly.
+    Shorter fragments have no trigram to look up and are checked against every word.
+    """
+
+    def __init__(self):
+        self.words = set()
+        self.grams = {}
+
+    def trigrams(self, word):
+        return set(word[i : i + 3] for i in range(len(word) - 2))
+
+    def add(self, word):
+        if word in self.words:
+            return
+        self.words.add(word)
+        for gram in self.trigrams(word):
+            if gram not in self.grams:
+                self.grams[gram] = set()
+            self.grams[gram].add(word)
+
+    def remove(self, word):
+        if word not in self.words:
+            return
+        self.words.discard(word)
+        for gram in self.trigrams(word):
+            words = self.grams.get(gram)
+            if words is None:
+                continue
+            words.discard(word)
+            if len(words) == 0:
+                del self.grams[gram]
+
+    def containing(self, fragment):
+        """Returns the set of words within which fragment occurs"""
+        if len(fragment) < 3:
+            return set(word for word in self.words if fragment in word)
+        candidate_sets = []
+        for gram in self.trigrams(fragment):
+            if gram not in self.grams:
+                return set()
+            candidate_sets.append(self.grams[gram])
+        candidate_sets.sort(key=len)
+        candidates = candidate_sets[0].intersection(*candidate_sets[1:])
+        return set(word for word in candidates if fragment in word)
@@ -1,38 +1,61 @@
-from tkinter import Button, DISABLED
+from tkinter import Button, DISABLED, NORMAL
 
 
 class TagBox:
     def __init__(self, win, parent, tag):
         self.win = win
         self.parent = parent
+        self.bt = Button(parent, text=tag, command=self.devise_action)
+        self.default_bg = self.bt.cget("bg")
+        # (row, column, columnspan) the button was last gridded at, or None while hidden
+        self.cell = None
+        self.assign(tag)
+
+    def assign(self, tag):
+        """Reconfigures the button to represent the given tag, so it can be reused rather than recreated"""
         self.tag_text = tag
         self.is_trigger = False
         if self.win is not None:
             if self.win.dataset is not None:
                 if tag == self.win.dataset.trigger_word:
                     self.is_trigger = True
-        self.bt = Button(parent, text=tag, command=self.devise_action)
         if self.is_trigger:
             self.bt.config(text=f"{tag}🔒", bg="gold", state=DISABLED)
+        else:
+            self.bt.config(text=tag, bg=self.default_bg, state=NORMAL)
+
+    def place(self, row, column, span):
+        """Grids the button at the given cell, unless it is already there"""
+        if self.cell == (row, column, span):
+            return
+        self.bt.grid(
+            sticky="w", row=row, column=column, padx=2, pady=2, columnspan=span
+        )
+        self.cell = (row, column, span)
+
+    def hide(self):
+        if self.cell is not None:
+            self.bt.grid_remove()
+            self.cell = None
 
     def devise_action(self):
         if self.is_trigger:
             return
+        if self.win.task_runner.busy():
+            print("Captions cannot be edited while a dataset-wide operation runs.")
+            return
         match self.win.tag_click_mode.get():
             case "Delete":
                 self.win.dataset.remove_tag_from_image_caption(
                     self.tag_text, png_path=self.win.get_png_path()
                 )
             case "Delete_All":
-                print(
-                    f'Removing tag "{self.tag_text}" from all .txt files in dataset {self.win.directory}'
-                )
-                self.win.dataset.remove_tag_from_image_caption(self.tag_text, all=True)
+                # the window refreshes once the operation ends
+                self.win.start_bulk_edit("remove", self.tag_text)
+                return
             case "Apply_All":
-                print(
-                    f'Applying tag "{self.tag_text}" to all .txt files in dataset {self.win.directory}'
-                )
-                self.win.dataset.add_tag_to_image_caption(self.tag_text, all=True)
+                self.win.start_bulk_edit("add", self.tag_text)
+                return
             case _:
                 raise ValueError("only 'Delete' and 'Apply_All' are acceptable actions")
         self.win.refresh()
@@ -0,0 +1,57 @@
+import threading
+
+# number of captions edited between progress reports and cancellation checks
+TASK_CHUNK_SIZE = 500
+
+
+class TaskRunner:
+    """Runs one chunked dataset task at a time off the Tk thread.
+
+    A task is any object with 'total', 'finished', 'step(count)' and 'rollback' methods, such as a BulkTagEdit.
+    It is stepped on a worker thread started through 'win.run_in_background'; after every chunk,
+    on_progress(done, total) is called on the Tk thread. When the task ends, on_finish(completed) is called
+    on the Tk thread, with completed False if it was cancelled (and therefore rolled back).
+    """
+
+    def __init__(self, win, on_progress=None, on_finish=None):
+        self.win = win
+        self.on_progress = on_progress
+        self.on_finish = on_finish
+        self.task = None
+        self.cancel_event = threading.Event()
+
+    def busy(self):
+        return self.task is not None
+
+    def start(self, task):
+        if self.busy():
+            raise Exception("a dataset task is already running")
+        self.task = task
+        self.cancel_event.clear()
+        self.win.run_in_background(self.run, on_done=self.finish)
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def run(self):
+        task = self.task
+        try:
+            while not task.finished():
+                if self.cancel_event.is_set():
+                    task.rollback()
+                    return False
+                task.step(TASK_CHUNK_SIZE)
+                if self.on_progress is not None:
+                    self.win.call_on_ui_thread(
+                        self.on_progress, task.done, task.total()
+                    )
+        except Exception as e:
+            print(f"Dataset task failed and was rolled back: {e}")
+            task.rollback()
+            return False
+        return True
+
+    def finish(self, completed):
+        self.task = None
+        if self.on_finish is not None:
+            self.on_finish(completed)
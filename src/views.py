@@ -0,0 +1,151 @@
+from query import Query
+from bisect import bisect_left
+import threading
+
+ALL_IMAGES = "All Images"
+UNTAGGED = "Untagged"
+MISSING_TRIGGER = "Missing Trigger Word"
+EDITED = "Edited This Session"
+
+
+class View:
+    """A named subset of a dataset's images, navigated in dataset order.
+
+    Membership is decided by predicate(png_path). The ids of the member images (see 'Dataset.image_ids') are kept
+    in a sorted list, built by one pass over the dataset when the view is created and then maintained by 'update',
+    which the dataset calls for each image whose caption changes. Navigation bisects the sorted list.
+    """
+
+    def __init__(self, name, dataset, predicate, ids=None):
+        self.name = name
+        self.dataset = dataset
+        self.predicate = predicate
+        self.lock = threading.Lock()
+        if ids is None:
+            ids = [
+                i for i, png_path in enumerate(dataset.image_set) if predicate(png_path)
+            ]
+        self.ids = ids
+
+    def __len__(self):
+        return len(self.ids)
+
+    def update(self, png_path):
+        """Adds or drops a single image according to the predicate"""
+        i = self.dataset.image_ids.get(png_path)
+        if i is None:
+            return
+        wanted = self.predicate(png_path)
+        with self.lock:
+            position = bisect_left(self.ids, i)
+            present = position < len(self.ids) and self.ids[position] == i
+            if wanted and not present:
+                self.ids.insert(position, i)
+            elif present and not wanted:
+                del self.ids[position]
+
+    def position(self, i):
+        """Returns the position of image id i within the view, or None if it is not a member"""
+        with self.lock:
+            position = bisect_left(self.ids, i)
+            if position < len(self.ids) and self.ids[position] == i:
+                return position
+            return None
+
+    def neighbour(self, i, step):
+        """Returns the id of the member 'step' places away from image id i, wrapping around, or None if the view is empty.
+
+        If i is not itself a member, the nearest member in the direction of travel counts as the first step.
+        """
+        with self.lock:
+            if len(self.ids) == 0:
+                return None
+            position = bisect_left(self.ids, i)
+            if step > 0 and (position == len(self.ids) or self.ids[position] != i):
+                position -= 1
+            return self.ids[(position + step) % len(self.ids)]
+
+    def png_paths(self):
+        with self.lock:
+            return [self.dataset.image_set[i] for i in self.ids]
+
+
+class AllImagesView(View):
+    """The view of every image in the dataset"""
+
+    def __init__(self, dataset):
+        # a range supports the same bisection and indexing as the sorted list of other views
+        super().__init__(
+            ALL_IMAGES,
+            dataset,
+            lambda png_path: True,
+            ids=range(len(dataset.image_set)),
+        )
+
+    def update(self, png_path):
+        pass
+
+
+class DatasetViews:
+    """The navigation views of a dataset, one of them active at a time.
+
+    The built-in views (all images, untagged images, captions missing the trigger word, images edited this session)
+    are created the first time they are activated; query views (see 'Query') are added with 'add_query'.
+    Every view created is kept up to date from then on, through a single dataset listener.
+    """
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+        self.views = {ALL_IMAGES: AllImagesView(dataset)}
+        self.active = self.views[ALL_IMAGES]
+        dataset.listeners.append(self.update)
+
+    def update(self, png_path):
+        for view in list(self.views.values()):
+            view.update(png_path)
+
+    def builtin_predicate(self, name):
+        dataset = self.dataset
+        if name == UNTAGGED:
+            return lambda png_path: all(
+                tag == dataset.trigger_word for tag in dataset.caption_of(png_path)
+            )
+        if name == MISSING_TRIGGER:
+            return lambda png_path: png_path in dataset.missing_trigger
+        if name == EDITED:
+            return lambda png_path: png_path in dataset.edited
+        raise ValueError(f"no view named '{name}'")
+
+    def names(self):
+        names = [ALL_IMAGES, UNTAGGED, MISSING_TRIGGER, EDITED]
+        return names + [name for name in self.views if name not in names]
+
+    def activate(self, name):
+        """Makes the named view active, creating it if it is a built-in view seen for the first time.
+
+        Creating a view reads every caption, so on a lazy dataset it waits for loading to finish.
+        """
+        if name not in self.views:
+            self.dataset.wait_until_loaded()
+            self.views[name] = View(name, self.dataset, self.builtin_predicate(name))
+        self.active = self.views[name]
+        return self.active
+
+    def add_query(self, text):
+        """Creates, or replaces, a view of the images whose captions match a query, and makes it active.
+
+        The initial members come from 'Dataset.query_ids'; later changes are checked against the query image by image.
+        """
+        query = Query.parse(text)
+        view = View(
+            f"Query: {text.strip()}",
+            self.dataset,
+            lambda png_path: query.matches(self.dataset.caption_of(png_path)),
+            ids=self.dataset.query_ids(text),
+        )
+        self.views[view.name] = view
+        self.active = view
+        return view
+
+    def is_filtered(self):
+        return self.active.name != ALL_IMAGES
@@ -0,0 +1,121 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+)
+
+from dataset import Dataset
+
+CAPTIONS = {
+    "1": "trig, a, b",
+    "2": "trig, b, c",
+    "3": "trig, a, c, b",
+    "4": "trig",
+}
+
+
+def state(dataset):
+    """Returns everything a rolled-back edit must restore"""
+    return (
+        {key: caption.serialize() for key, (_, caption) in dataset.cache.items()},
+        set(dataset.dirty),
+        set(dataset.edited),
+        {tag: list(ids) for tag, ids in dataset.tag_images.items()},
+        {tag: dataset.tag_trie.get(tag) for tag in ["a", "b", "c", "d"]},
+    )
+
+
+class BulkTagEditTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = self.tmp.name
+        for stem, text in CAPTIONS.items():
+            open(os.path.join(self.root, f"{stem}.png"), "wb").close()
+            with open(os.path.join(self.root, f"{stem}.txt"), "w") as file:
+                file.write(text)
+        self.dataset = Dataset(self.root)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def png(self, stem):
+        return os.path.join(self.root, f"{stem}.png")
+
+    def test_targets_only_captions_that_change(self):
+        self.assertEqual(
+            self.dataset.bulk_edit("add", "a").targets, [self.png("2"), self.png("4")]
+        )
+        self.assertEqual(
+            self.dataset.bulk_edit("remove", "c").targets,
+            [self.png("2"), self.png("3")],
+        )
+
+    def test_rollback_restores_removed_tags_in_place(self):
+        # an earlier, unrelated edit must stay unsaved after the rollback
+        self.dataset.add_tag_to_image_caption("d", png_path=self.png("1"))
+        before = state(self.dataset)
+        edit = self.dataset.bulk_edit("remove", "b")
+        edit.step(2)
+        self.assertFalse(edit.finished())
+        edit.rollback()
+        self.assertEqual(state(self.dataset), before)
+        self.assertEqual(len(self.dataset.undo_stack), 1)
+
+    def test_rollback_of_a_finished_addition(self):
+        before = state(self.dataset)
+        edit = self.dataset.bulk_edit("add", "d")
+        edit.run()
+        self.assertEqual(self.dataset.tag_trie.get("d"), 4)
+        edit.rollback()
+        self.assertEqual(state(self.dataset), before)
+
+    def test_failed_run_is_rolled_back(self):
+        before = state(self.dataset)
+        edit = self.dataset.bulk_edit("add", "d")
+        add = self.dataset.add_tag_to_image_caption
+        calls = []
+
+        def failing_add(tag, png_path=None, all=False, record=True):
+            calls.append(png_path)
+            if len(calls) == 3:
+                raise OSError("disk on fire")
+            return add(tag, png_path=png_path, all=all, record=record)
+
+        self.dataset.add_tag_to_image_caption = failing_add
+        with self.assertRaises(OSError):
+            edit.run()
+        self.assertEqual(state(self.dataset), before)
+        self.assertEqual(self.dataset.undo_stack, [])
+
+    def test_additions_skip_unreadable_captions(self):
+        with open(os.path.join(self.root, "5.txt"), "wb") as file:
+            file.write(b"\xff\xfe not utf-8")
+        open(self.png("5"), "wb").close()
+        dataset = Dataset(self.root)
+        self.assertIsNone(dataset.cache[self.png("5")][1])
+        edit = dataset.bulk_edit("add", "d")
+        self.assertNotIn(self.png("5"), edit.targets)
+        edit.run()
+        self.assertEqual(dataset.tag_trie.get("d"), 4)
+
+    def test_undo_and_redo_in_steps(self):
+        before = state(self.dataset)[0]
+        self.dataset.bulk_edit("remove", "b").run()
+        after = state(self.dataset)[0]
+        history = self.dataset.undo_edit()
+        history.step(1)
+        history.rollback()
+        self.assertEqual(state(self.dataset)[0], after)
+        self.assertEqual(len(self.dataset.undo_stack), 1)
+        self.assertEqual(self.dataset.redo_stack, [])
+        self.dataset.undo()
+        self.assertEqual(state(self.dataset)[0], before)
+        self.dataset.redo()
+        self.assertEqual(state(self.dataset)[0], after)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+)
+
+from caption import Caption, split_tags
+from image_table import LONG_CAPTION_TAGS, ImageTable
+
+
+class SplitTagsTest(unittest.TestCase):
+    def test_strips_and_drops_empty_and_repeated_tags(self):
+        self.assertEqual(
+            split_tags(" trig,  long hair ,, sky, trig ,sky,  "),
+            ["trig", "long hair", "sky"],
+        )
+        self.assertEqual(split_tags(""), [])
+        self.assertEqual(split_tags(" , ,"), [])
+
+
+class CaptionTest(unittest.TestCase):
+    def test_parse_serialize_round_trip(self):
+        text = "trig, long hair, blue sky, 1girl"
+        caption = Caption.parse(text)
+        self.assertEqual(caption.serialize(), text)
+        self.assertEqual(Caption.parse(caption.serialize()).serialize(), text)
+        self.assertEqual(Caption.parse("a,b ,  c").serialize(), "a, b, c")
+        self.assertEqual(Caption.parse("").serialize(), "")
+
+    def test_add_and_remove(self):
+        caption = Caption.parse("a, b")
+        self.assertTrue(caption.add("c"))
+        self.assertFalse(caption.add("a"))
+        self.assertTrue(caption.remove("a"))
+        self.assertFalse(caption.remove("a"))
+        self.assertEqual(caption.serialize(), "b, c")
+        self.assertEqual(caption.first(), "b")
+        self.assertIsNone(Caption().first())
+
+    def test_index_and_insert(self):
+        caption = Caption.parse("a, b, c")
+        self.assertEqual(caption.index("c"), 2)
+        self.assertIsNone(caption.index("d"))
+        caption.insert(0, "d")
+        self.assertEqual(caption.serialize(), "d, a, b, c")
+        # inserting a present tag moves it
+        caption.insert(1, "c")
+        self.assertEqual(caption.serialize(), "d, c, a, b")
+        caption.insert(10, "e")
+        self.assertEqual(caption.serialize(), "d, c, a, b, e")
+        self.assertEqual(len(caption), 5)
+
+    def test_iteration_takes_a_snapshot(self):
+        caption = Caption.parse("a, b, c")
+        for tag in caption:
+            caption.remove(tag)
+        self.assertEqual(len(caption), 0)
+
+
+class CaptionViewTest(unittest.TestCase):
+    """A CaptionView over an ImageTable must behave exactly as a Caption, short or long"""
+
+    def test_random_edits_match_caption(self):
+        rng = random.Random(5)
+        table = ImageTable()
+        table.set_caption(table.add(os.path.join(os.sep, "d", "a.png")), [])
+        view = table.caption(0)
+        caption = Caption()
+        tags = [f"t{i}" for i in range(LONG_CAPTION_TAGS * 2)]
+        for step in range(4000):
+            tag = rng.choice(tags)
+            action = rng.random()
+            if action < 0.5:
+                self.assertEqual(view.add(tag), caption.add(tag))
+            elif action < 0.8:
+                self.assertEqual(view.remove(tag), caption.remove(tag))
+            else:
+                position = rng.randint(0, len(caption))
+                view.insert(position, tag)
+                caption.insert(position, tag)
+            self.assertEqual(list(view), list(caption), step)
+            probe = rng.choice(tags)
+            self.assertEqual(probe in view, probe in caption)
+            self.assertEqual(view.index(probe), caption.index(probe))
+        self.assertEqual(view.serialize(), caption.serialize())
+
+    def test_long_captions_keep_a_tag_set(self):
+        table = ImageTable()
+        i = table.add(os.path.join(os.sep, "d", "a.png"))
+        tags = [f"t{j}" for j in range(LONG_CAPTION_TAGS + 1)]
+        table.set_caption(i, tags)
+        self.assertIn(i, table.caption_sets)
+        table.caption(i).remove("t0")
+        self.assertNotIn("t0", table.caption(i))
+        table.set_caption(i, ["a"])
+        self.assertNotIn(i, table.caption_sets)
+
+
+if __name__ == "__main__":
+    unittest.main()
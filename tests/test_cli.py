@@ -0,0 +1,121 @@
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+)
+
+import cli
+
+CAPTIONS = {
+    "1": "trig, a, b",
+    "2": "trig, b, c",
+    os.path.join("sub", "3"): "trig, long hair, c",
+    os.path.join("sub", "4"): "trig, short hair, outdoors",
+}
+
+
+class CliTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = self.tmp.name
+        for stem, text in CAPTIONS.items():
+            self.write(stem, text)
+            open(os.path.join(self.root, f"{stem}.png"), "wb").close()
+        # an image without a caption, which edits skip
+        open(os.path.join(self.root, "5.png"), "wb").close()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, stem, text):
+        os.makedirs(os.path.dirname(os.path.join(self.root, stem)), exist_ok=True)
+        with open(os.path.join(self.root, f"{stem}.txt"), "w") as file:
+            file.write(text)
+
+    def read(self, stem):
+        with open(os.path.join(self.root, f"{stem}.txt")) as file:
+            return file.read()
+
+    def captions(self):
+        return {stem: self.read(stem) for stem in CAPTIONS}
+
+    def run_cli(self, *argv):
+        """Runs the command line tool, returning (exit status, stdout, stderr)"""
+        out = io.StringIO()
+        err = io.StringIO()
+        with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+            status = cli.main([argv[0], self.root, *argv[1:]])
+        return status, out.getvalue(), err.getvalue()
+
+    def test_add(self):
+        status, _, _ = self.run_cli("add", "b")
+        self.assertEqual(status, 0)
+        self.assertEqual(self.read("1"), "trig, a, b")
+        self.assertEqual(self.read(os.path.join("sub", "3")), "trig, long hair, c, b")
+        self.assertFalse(os.path.exists(os.path.join(self.root, "5.txt")))
+
+    def test_remove(self):
+        status, _, _ = self.run_cli("remove", "c")
+        self.assertEqual(status, 0)
+        self.assertEqual(self.read("2"), "trig, b")
+        self.assertEqual(self.read(os.path.join("sub", "3")), "trig, long hair")
+        self.assertEqual(self.read("1"), "trig, a, b")
+
+    def test_remove_containing(self):
+        status, _, err = self.run_cli("remove", "--containing", "hair")
+        self.assertEqual(status, 0)
+        self.assertIn("long hair, short hair", err)
+        self.assertEqual(self.read(os.path.join("sub", "3")), "trig, c")
+        self.assertEqual(self.read(os.path.join("sub", "4")), "trig, outdoors")
+
+    def test_rename_merges_into_an_existing_tag(self):
+        status, _, _ = self.run_cli("rename", "a", "c", "b")
+        self.assertEqual(status, 0)
+        self.assertEqual(self.read("1"), "trig, b")
+        self.assertEqual(self.read("2"), "trig, b")
+        # the new tag takes the place of the first tag replaced
+        self.assertEqual(self.read(os.path.join("sub", "3")), "trig, long hair, b")
+
+    def test_where(self):
+        status, _, _ = self.run_cli("add", "d", "--where", "c AND NOT b")
+        self.assertEqual(status, 0)
+        self.assertEqual(self.read(os.path.join("sub", "3")), "trig, long hair, c, d")
+        self.assertEqual(self.read("2"), "trig, b, c")
+        self.assertEqual(self.read("1"), "trig, a, b")
+
+    def test_dry_run_prints_a_diff_and_writes_nothing(self):
+        status, out, _ = self.run_cli("rename", "--dry-run", "b", "e")
+        self.assertEqual(status, 0)
+        self.assertEqual(self.captions(), CAPTIONS)
+        txt_path = os.path.join(self.root, "1.txt")
+        self.assertIn(f"--- {txt_path}", out)
+        self.assertIn("-trig, a, b", out)
+        self.assertIn("+trig, a, e", out)
+        self.assertIn("Dry run: 2 of 4 captions would change.", out)
+
+    def test_trigger_word_is_protected(self):
+        status, _, err = self.run_cli("remove", "trig")
+        self.assertEqual(status, 1)
+        self.assertIn("trigger word", err)
+        self.assertEqual(self.captions(), CAPTIONS)
+
+    def test_missing(self):
+        status, out, err = self.run_cli("missing")
+        self.assertEqual(status, 0)
+        self.assertEqual(out.splitlines(), [os.path.join(self.root, "5.png")])
+        self.assertIn("1 images without captions.", err)
+        self.run_cli("missing", "--create", "--dry-run")
+        self.assertFalse(os.path.exists(os.path.join(self.root, "5.txt")))
+        self.run_cli("missing", "--create")
+        self.assertTrue(os.path.exists(os.path.join(self.root, "5.txt")))
+        _, out, _ = self.run_cli("missing")
+        self.assertEqual(out, "")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+)
+
+import dataset as dataset_module
+from dataset import Dataset
+from dataset_index import INDEX_FILENAME, DatasetIndex
+
+CAPTIONS = {
+    "1": "trig, a, b",
+    "2": "trig, b, c",
+    os.path.join("sub", "3"): "trig, a, c",
+}
+
+
+class DatasetIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = self.tmp.name
+        for stem, text in CAPTIONS.items():
+            self.write(stem, text)
+            open(os.path.join(self.root, f"{stem}.png"), "wb").close()
+        self.reads = []
+        read_captions = dataset_module.read_captions
+
+        def counting_read_captions(txt_paths, **kwargs):
+            self.reads.extend(txt_paths)
+            return read_captions(txt_paths, **kwargs)
+
+        dataset_module.read_captions = counting_read_captions
+        self.addCleanup(setattr, dataset_module, "read_captions", read_captions)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, stem, text):
+        os.makedirs(os.path.dirname(os.path.join(self.root, stem)), exist_ok=True)
+        with open(os.path.join(self.root, f"{stem}.txt"), "w") as file:
+            file.write(text)
+
+    def txt(self, stem):
+        return os.path.join(self.root, f"{stem}.txt")
+
+    def load(self, lazy=False):
+        self.reads.clear()
+        dataset = Dataset(self.root, lazy=lazy)
+        dataset.wait_until_loaded()
+        return dataset
+
+    def captions(self, dataset):
+        return {
+            os.path.relpath(key, self.root): caption.serialize()
+            for key, (_, caption) in dataset.cache.items()
+        }
+
+    def test_unchanged_captions_are_not_read_again(self):
+        first = self.load()
+        self.assertEqual(len(self.reads), 3)
+        self.assertTrue(os.path.isfile(os.path.join(self.root, INDEX_FILENAME)))
+        for lazy in (False, True):
+            second = self.load(lazy=lazy)
+            # a lazy load reads the first caption itself to settle the trigger word
+            self.assertEqual(self.reads, [self.txt("1")] if lazy else [])
+            self.assertEqual(self.captions(second), self.captions(first))
+            self.assertEqual(second.tag_trie.get("a"), 2)
+
+    def test_modified_and_deleted_captions_are_detected(self):
+        self.load()
+        self.write("2", "trig, b, c, d, e")
+        os.remove(self.txt(os.path.join("sub", "3")))
+        dataset = self.load()
+        self.assertEqual(self.reads, [self.txt("2")])
+        self.assertEqual(
+            dataset.caption_of(dataset.image_set[1]).serialize(), "trig, b, c, d, e"
+        )
+        self.assertEqual(dataset.tag_trie.get("d"), 1)
+        index = DatasetIndex.load(self.root)
+        self.assertEqual(sorted(index.entries), ["1.png", "2.png"])
+        self.assertEqual(index.tag_counts["c"], 1)
+
+    def test_saved_edits_are_indexed(self):
+        dataset = self.load()
+        dataset.add_tag_to_image_caption("d", png_path=dataset.image_set[0])
+        dataset.save_dataset()
+        reloaded = self.load()
+        self.assertEqual(self.reads, [])
+        self.assertEqual(
+            reloaded.caption_of(reloaded.image_set[0]).serialize(), "trig, a, b, d"
+        )
+        self.assertEqual(reloaded.tag_trie.get("d"), 1)
+
+    def test_unsupported_or_damaged_index_is_ignored(self):
+        self.load()
+        path = os.path.join(self.root, INDEX_FILENAME)
+        for content in ["{not json", json.dumps({"version": -1})]:
+            with self.subTest(content=content):
+                with open(path, "w") as file:
+                    file.write(content)
+                dataset = self.load()
+                self.assertEqual(len(self.reads), 3)
+                self.assertEqual(dataset.tag_trie.get("b"), 2)
+
+    def test_unwritable_index_is_kept_in_memory(self):
+        # a directory in the way of the temporary file makes every write fail, as a read-only volume would
+        os.mkdir(os.path.join(self.root, f"{INDEX_FILENAME}.tmp"))
+        for lazy in (False, True):
+            dataset = self.load(lazy=lazy)
+            self.assertEqual(dataset.tag_trie.get("b"), 2)
+            self.assertFalse(dataset.index.persistent)
+            dataset.add_tag_to_image_caption("d", png_path=dataset.image_set[0])
+            summary = dataset.save_dataset()
+            self.assertEqual(summary.files_written, 1)
+            with open(self.txt("1")) as file:
+                self.assertEqual(file.read(), "trig, a, b, d")
+            self.write("1", "trig, a, b")
+        self.assertFalse(os.path.exists(os.path.join(self.root, INDEX_FILENAME)))
+
+
+if __name__ == "__main__":
+    unittest.main()
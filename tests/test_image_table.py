@@ -0,0 +1,111 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+)
+
+from dataset import Dataset
+from dataset_index import CompactIndex, DatasetIndex
+from image_table import LONG_CAPTION_TAGS, CaptionCache, ImageTable
+
+LONG_CAPTION = [f"t{j}" for j in range(LONG_CAPTION_TAGS + 10)]
+
+
+class ImageTableTest(unittest.TestCase):
+    def setUp(self):
+        self.table = ImageTable()
+        self.a = os.path.join("data", "a.png")
+        self.b = os.path.join("data", "sub", "b.png")
+        self.c = os.path.join("data", "c.png")
+
+    def test_ids_are_dense_and_reused(self):
+        self.assertEqual(
+            [self.table.add(p) for p in (self.a, self.b, self.c)], [0, 1, 2]
+        )
+        self.assertEqual(self.table.add(self.b), 1)
+        self.assertEqual(len(self.table), 3)
+        self.assertEqual(self.table.png_path(1), self.b)
+        self.assertEqual(self.table.txt_path(1), os.path.join("data", "sub", "b.txt"))
+        self.assertEqual(self.table.id_of(self.c), 2)
+        self.assertIsNone(self.table.id_of(os.path.join("data", "d.png")))
+        self.assertIsNone(self.table.id_of(os.path.join("data", "a.txt")))
+        # re-assigning a caption keeps the image's id
+        cache = CaptionCache(self.table)
+        cache[self.a] = (None, ["trig", "x"])
+        cache[self.a] = (None, ["trig", "y"])
+        self.assertEqual(self.table.id_of(self.a), 0)
+        self.assertEqual(len(cache), 3)
+        self.assertEqual(cache[self.a][1].serialize(), "trig, y")
+        # tags are interned once however many captions hold them
+        cache[self.b] = (None, ["trig", "y"])
+        self.assertEqual(len(self.table.vocabulary), 3)
+
+    def test_long_caption_membership(self):
+        i = self.table.add(self.a)
+        self.table.set_caption(i, LONG_CAPTION)
+        caption = self.table.caption(i)
+        self.assertIn(i, self.table.caption_sets)
+        self.assertIn("t70", caption)
+        self.assertTrue(caption.remove("t70"))
+        self.assertNotIn("t70", caption)
+        self.assertFalse(caption.remove("t70"))
+        self.assertTrue(caption.add("new"))
+        self.assertIn("new", caption)
+        self.assertFalse(caption.add("new"))
+        caption.insert(0, "t5")
+        self.assertEqual(caption.index("t5"), 0)
+        self.assertEqual(len(caption), len(LONG_CAPTION))
+        self.assertEqual(self.table.caption_sets[i], set(self.table.captions[i]))
+        # a short caption is scanned instead
+        self.table.set_caption(i, ["trig", "x"])
+        self.assertNotIn(i, self.table.caption_sets)
+        self.assertIn("x", self.table.caption(i))
+
+    def test_caption_growing_long_gets_a_tag_set(self):
+        i = self.table.add(self.a)
+        self.table.set_caption(i, LONG_CAPTION[:LONG_CAPTION_TAGS])
+        self.assertNotIn(i, self.table.caption_sets)
+        caption = self.table.caption(i)
+        caption.add("one more")
+        self.assertEqual(self.table.caption_sets[i], set(self.table.captions[i]))
+        self.assertIn("one more", caption)
+
+
+class LoadedIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = self.tmp.name
+        for stem, text in {"1": "trig, a", "2": "trig, b"}.items():
+            open(os.path.join(self.root, f"{stem}.png"), "wb").close()
+            with open(os.path.join(self.root, f"{stem}.txt"), "w") as file:
+                file.write(text)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_loaded_dataset_keeps_no_caption_text_in_its_index(self):
+        for lazy in (False, True):
+            with self.subTest(lazy=lazy):
+                dataset = Dataset(self.root, lazy=lazy)
+                dataset.wait_until_loaded()
+                self.assertIsInstance(dataset.index, CompactIndex)
+                self.assertFalse(hasattr(dataset.index, "entries"))
+
+    def test_compact_index_writes_the_full_index_file(self):
+        dataset = Dataset(self.root)
+        dataset.add_tag_to_image_caption("c", png_path=os.path.join(self.root, "1.png"))
+        dataset.save_dataset()
+        index = DatasetIndex.load(self.root)
+        self.assertEqual(
+            {key: entry[3] for key, entry in index.entries.items()},
+            {"1.png": "trig, a, c", "2.png": "trig, b"},
+        )
+        self.assertEqual(index.tag_counts["trig"], 2)
+        self.assertEqual(index.tag_counts["c"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,167 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+)
+
+from dataset import Dataset
+from journal import JOURNAL_FILENAME, Journal
+
+CAPTIONS = {
+    "1": "trig, a, b",
+    "2": "trig, b, c",
+    os.path.join("sub", "3"): "trig, a, c",
+}
+
+
+def make_dataset(root):
+    for stem, text in CAPTIONS.items():
+        os.makedirs(os.path.dirname(os.path.join(root, stem)), exist_ok=True)
+        open(os.path.join(root, f"{stem}.png"), "wb").close()
+        with open(os.path.join(root, f"{stem}.txt"), "w") as file:
+            file.write(text)
+
+
+def captions(dataset):
+    return {key: caption.serialize() for key, (_, caption) in dataset.cache.items()}
+
+
+class JournalReplayTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = self.tmp.name
+        make_dataset(self.root)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def edit(self, dataset):
+        png = os.path.join(self.root, "1.png")
+        dataset.add_tag_to_image_caption("d", png_path=png)
+        dataset.remove_tag_from_image_caption("a", png_path=png)
+        dataset.insert_tag_into_image_caption("e", png, 1)
+        dataset.bulk_edit("remove", "c").run()
+        dataset.bulk_edit("add", "f").run()
+        dataset.flush_journal()
+
+    def test_replay_restores_unsaved_edits(self):
+        dataset = Dataset(self.root, journal=True)
+        self.edit(dataset)
+        expected = captions(dataset)
+        restored = Dataset(self.root, journal=True)
+        self.assertEqual(captions(restored), expected)
+        self.assertEqual(len(restored.undo_stack), 5)
+        lazy = Dataset(self.root, lazy=True, journal=True)
+        lazy.wait_until_loaded()
+        self.assertEqual(captions(lazy), expected)
+
+    def test_replay_is_idempotent(self):
+        dataset = Dataset(self.root, journal=True)
+        self.edit(dataset)
+        expected = captions(dataset)
+        # each load replays the same journal over the unchanged files
+        Dataset(self.root, journal=True)
+        restored = Dataset(self.root, journal=True)
+        self.assertEqual(captions(restored), expected)
+        # replaying again over captions that already hold the edits changes nothing
+        restored.replay_journal()
+        self.assertEqual(captions(restored), expected)
+
+    def test_undo_after_replay(self):
+        dataset = Dataset(self.root, journal=True)
+        original = captions(dataset)
+        self.edit(dataset)
+        restored = Dataset(self.root, journal=True)
+        while restored.undo() is not None:
+            pass
+        self.assertEqual(captions(restored), original)
+
+    def test_save_and_discard_empty_the_journal(self):
+        dataset = Dataset(self.root, journal=True)
+        original = captions(dataset)
+        self.edit(dataset)
+        self.assertTrue(dataset.has_unsaved_edits())
+        dataset.discard_journal()
+        self.assertEqual(captions(Dataset(self.root, journal=True)), original)
+        self.edit(dataset)
+        dataset.save_dataset()
+        self.assertFalse(os.path.exists(os.path.join(self.root, JOURNAL_FILENAME)))
+        self.assertEqual(captions(Dataset(self.root, journal=True)), captions(dataset))
+
+
+class TornJournalTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = self.tmp.name
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_partial_last_line_is_dropped_and_truncated(self):
+        journal = Journal(self.root)
+        png = os.path.join(self.root, "1.png")
+        journal.append("add", "a", [(png, 1)])
+        journal.append("remove", "b", [(png, 0)])
+        journal.flush()
+        journal.close()
+        complete_size = os.path.getsize(journal.path)
+        with open(journal.path, "a") as file:
+            file.write('{"op":"add","tag":"c","ima')
+        entries = Journal(self.root).read()
+        self.assertEqual(
+            entries, [("add", "a", [(png, 1)]), ("remove", "b", [(png, 0)])]
+        )
+        self.assertEqual(os.path.getsize(journal.path), complete_size)
+        # entries appended after recovery follow the last complete one
+        journal = Journal(self.root)
+        journal.append("add", "d", [(png, 2)])
+        journal.flush()
+        journal.close()
+        self.assertEqual(Journal(self.root).read()[-1], ("add", "d", [(png, 2)]))
+
+    def test_missing_and_empty_journals(self):
+        journal = Journal(self.root)
+        self.assertEqual(journal.read(), [])
+        self.assertTrue(journal.empty())
+        journal.append("add", "a", [(os.path.join(self.root, "1.png"), 0)])
+        self.assertFalse(journal.empty())
+        journal.truncate()
+        self.assertTrue(journal.empty())
+
+
+class UnwritableJournalTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = self.tmp.name
+        make_dataset(self.root)
+        # a directory in the way of the journal file makes every write fail, as a read-only volume would
+        os.mkdir(os.path.join(self.root, JOURNAL_FILENAME))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_edits_carry_on_without_the_journal(self):
+        dataset = Dataset(self.root, journal=True)
+        png = os.path.join(self.root, "1.png")
+        self.assertTrue(dataset.add_tag_to_image_caption("d", png_path=png))
+        dataset.flush_journal()
+        self.assertTrue(dataset.journal_disabled())
+        # more edits than a journal batch, which would otherwise flush from within the edit
+        dataset.bulk_edit("add", "e").run()
+        for i in range(100):
+            dataset.add_tag_to_image_caption(f"t{i}", png_path=png)
+        self.assertIn("e", dataset.caption_of(png))
+        self.assertEqual(len(dataset.undo_stack), 102)
+        self.assertTrue(dataset.has_unsaved_edits())
+        dataset.undo()
+        self.assertNotIn("t99", dataset.caption_of(png))
+        dataset.save_dataset()
+        with open(os.path.join(self.root, "1.txt")) as file:
+            self.assertIn("t98", file.read())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+import os
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+)
+
+import dataset as dataset_module
+from dataset import Dataset
+from dataset_index import INDEX_FILENAME
+
+# ten images, so that a batch size of three loads them in four batches
+CAPTIONS = {
+    f"{i:02}": ", ".join(["trig"] + [f"t{j}" for j in range(i % 4 + 1)])
+    for i in range(10)
+}
+
+
+def snapshot(dataset):
+    tags = {tag for _, caption in dataset.cache.values() for tag in caption}
+    return (
+        {key: caption.serialize() for key, (_, caption) in dataset.cache.items()},
+        {tag: list(ids) for tag, ids in dataset.tag_images.items()},
+        {tag: dataset.tag_trie.get(tag) for tag in tags},
+    )
+
+
+class LazyLoadTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = self.tmp.name
+        for stem, text in CAPTIONS.items():
+            open(os.path.join(self.root, f"{stem}.png"), "wb").close()
+            with open(os.path.join(self.root, f"{stem}.txt"), "w") as file:
+                file.write(text)
+        batch_size = dataset_module.LOAD_BATCH_SIZE
+        dataset_module.LOAD_BATCH_SIZE = 3
+        self.addCleanup(setattr, dataset_module, "LOAD_BATCH_SIZE", batch_size)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def png(self, stem):
+        return os.path.join(self.root, f"{stem}.png")
+
+    def test_load_captions_reads_only_the_given_images(self):
+        dataset = Dataset(self.root, lazy=True)
+        dataset.load_captions([dataset.image_ids[self.png("05")]])
+        loaded = {
+            key for key, (_, caption) in dataset.cache.items() if caption is not None
+        }
+        # the first caption is read to settle the trigger word
+        self.assertEqual(loaded, {self.png("00"), self.png("05")})
+        self.assertFalse(dataset.is_loaded())
+        self.assertEqual(dataset.trigger_word, "trig")
+        self.assertEqual(dataset.tag_trie.get("t1"), 1)
+        self.assertFalse(os.path.exists(os.path.join(self.root, INDEX_FILENAME)))
+
+    def test_wait_until_loaded_matches_an_eager_load(self):
+        eager = Dataset(self.root)
+        lazy = Dataset(self.root, lazy=True)
+        lazy.caption_of(self.png("07"))
+        lazy.wait_until_loaded()
+        self.assertTrue(lazy.is_loaded())
+        self.assertEqual(snapshot(lazy), snapshot(eager))
+
+    def test_wait_until_loaded_waits_for_a_background_load(self):
+        dataset = Dataset(self.root, lazy=True)
+        progress = []
+        release = threading.Event()
+
+        def listener(loaded, total):
+            progress.append((loaded, total))
+            release.wait(5)
+
+        dataset.load_listeners.append(listener)
+        loader = threading.Thread(target=dataset.load_remaining)
+        loader.start()
+        waiter = threading.Thread(target=dataset.wait_until_loaded)
+        waiter.start()
+        waiter.join(0.1)
+        self.assertTrue(waiter.is_alive())
+        release.set()
+        waiter.join(5)
+        loader.join(5)
+        self.assertFalse(waiter.is_alive())
+        self.assertEqual(progress, [(3, 10), (6, 10), (9, 10), (10, 10)])
+        self.assertEqual(snapshot(dataset), snapshot(Dataset(self.root)))
+
+    def test_stop_loading_ends_the_load_between_batches(self):
+        dataset = Dataset(self.root, lazy=True)
+        dataset.load_listeners.append(lambda loaded, total: dataset.stop_loading())
+        dataset.load_remaining()
+        self.assertTrue(dataset.is_loaded())
+        loaded = [
+            key for key, (_, caption) in dataset.cache.items() if caption is not None
+        ]
+        self.assertEqual(loaded, [self.png(f"{i:02}") for i in range(3)])
+        # a stopped load does not write an index of the captions it never read
+        self.assertFalse(os.path.exists(os.path.join(self.root, INDEX_FILENAME)))
+        self.assertIsNone(dataset.index)
+
+    def test_edits_before_the_load_finishes_are_kept(self):
+        dataset = Dataset(self.root, lazy=True)
+        dataset.add_tag_to_image_caption("new", png_path=self.png("04"))
+        dataset.remove_tag_from_image_caption("t0", png_path=self.png("08"))
+        dataset.wait_until_loaded()
+        self.assertEqual(dataset.dirty, {self.png("04"), self.png("08")})
+        edited = snapshot(dataset)
+        self.assertIn("new", edited[0][self.png("04")])
+        self.assertNotIn("t0", edited[0][self.png("08")])
+        # the indexes agree with a dataset loaded from the saved captions
+        dataset.save_dataset()
+        self.assertEqual(edited, snapshot(Dataset(self.root)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import os
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+)
+
+from PIL import Image
+from preview_cache import PreviewCache
+
+
+class PreviewCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = self.tmp.name
+        self.paths = []
+        for i in range(4):
+            path = os.path.join(self.root, f"{i}.png")
+            Image.new("RGB", (600, 400), (i * 60, 0, 0)).save(path)
+            self.paths.append(path)
+        self.cache = PreviewCache(directory=os.path.join(self.root, "previews"))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_load_scales_to_the_display_height(self):
+        image = self.cache.load(self.paths[0], 100)
+        self.assertEqual(image.size, (150, 100))
+        self.assertEqual(self.cache.build(self.paths, 100), 0)
+
+    def test_canceled_build_stays_canceled_when_another_starts(self):
+        started = threading.Event()
+        release = threading.Event()
+        make_preview = self.cache.make_preview
+
+        def blocking_make_preview(path, height):
+            if path == self.paths[0]:
+                started.set()
+                release.wait(5)
+            return make_preview(path, height)
+
+        self.cache.make_preview = blocking_make_preview
+        results = {}
+        first = threading.Thread(
+            target=lambda: results.setdefault(
+                "first", self.cache.build(self.paths, 100, workers=1)
+            )
+        )
+        first.start()
+        started.wait(5)
+        self.cache.cancel_build()
+        # a build started after the cancellation runs in full
+        self.assertEqual(self.cache.build(self.paths[1:2], 300, workers=1), 0)
+        release.set()
+        first.join(5)
+        self.assertIsNone(results["first"])
+        self.assertEqual(self.cache.build_cancels, set())
+        stored = [
+            os.path.exists(self.cache.preview_path(path, 256)) for path in self.paths
+        ]
+        # the preview being made when the build was canceled is still stored; the rest are skipped
+        self.assertEqual(stored, [True, False, False, False])
+
+
+if __name__ == "__main__":
+    unittest.main()
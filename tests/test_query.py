@@ -0,0 +1,126 @@
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+)
+
+from query import BitsetCache, Query, bitset_members, make_bitset, tokenize
+
+
+class TokenizeTest(unittest.TestCase):
+    def test_keywords_and_symbols(self):
+        self.assertEqual(
+            tokenize("a AND b | !c"),
+            [
+                ("tag", "a"),
+                ("op", "&"),
+                ("tag", "b"),
+                ("op", "|"),
+                ("op", "!"),
+                ("tag", "c"),
+            ],
+        )
+
+    def test_bare_words_join_into_one_tag(self):
+        self.assertEqual(
+            tokenize("long  hair AND blue sky"),
+            [("tag", "long hair"), ("op", "&"), ("tag", "blue sky")],
+        )
+
+    def test_quoted_tags(self):
+        self.assertEqual(
+            tokenize('"hatsune miku (cosplay)" OR "!?"'),
+            [("tag", "hatsune miku (cosplay)"), ("op", "|"), ("tag", "!?")],
+        )
+
+    def test_unterminated_quote(self):
+        with self.assertRaises(ValueError):
+            tokenize('a AND "b')
+
+
+class ParseTest(unittest.TestCase):
+    def test_precedence(self):
+        # NOT binds tightest, then AND, then OR
+        self.assertEqual(
+            Query.parse("a OR b AND NOT c").tree,
+            ("or", [("tag", "a"), ("and", [("tag", "b"), ("not", ("tag", "c"))])]),
+        )
+
+    def test_parentheses(self):
+        self.assertEqual(
+            Query.parse("(a OR b) AND c").tree,
+            ("and", [("or", [("tag", "a"), ("tag", "b")]), ("tag", "c")]),
+        )
+
+    def test_tags(self):
+        self.assertEqual(Query.parse("a AND (b OR NOT a)").tags(), {"a", "b"})
+
+    def test_errors(self):
+        for text in ["", "   ", "a AND", "(a OR b", "a b)", "AND a", "a OR OR b", "()"]:
+            with self.subTest(text=text):
+                with self.assertRaises(ValueError):
+                    Query.parse(text)
+
+
+class BitsetTest(unittest.TestCase):
+    def test_round_trip(self):
+        ids = [0, 3, 8, 9, 63, 64, 200]
+        self.assertEqual(bitset_members(make_bitset(ids, 201)), ids)
+        self.assertEqual(bitset_members(make_bitset([], 10)), [])
+
+    def test_evaluate_matches_per_caption_matching(self):
+        rng = random.Random(19)
+        tags = ["a", "b", "c", "d"]
+        captions = [set(tag for tag in tags if rng.random() < 0.4) for _ in range(300)]
+
+        def tag_bitset(tag):
+            return make_bitset(
+                [i for i, caption in enumerate(captions) if tag in caption],
+                len(captions),
+            )
+
+        for text in [
+            "a",
+            "NOT a",
+            "a AND b",
+            "a OR b AND NOT c",
+            "(a OR b) AND NOT (c OR d)",
+            "NOT NOT d",
+            "a AND missing",
+            "NOT missing",
+        ]:
+            with self.subTest(text=text):
+                query = Query.parse(text)
+                expected = [
+                    i for i, caption in enumerate(captions) if query.matches(caption)
+                ]
+                bits = query.evaluate(tag_bitset, len(captions))
+                self.assertEqual(bitset_members(bits), expected)
+
+
+class BitsetCacheTest(unittest.TestCase):
+    def test_least_recently_used_entry_is_dropped(self):
+        built = []
+
+        def build(tag):
+            built.append(tag)
+            return len(built)
+
+        cache = BitsetCache(build, max_entries=2)
+        cache.get("a")
+        cache.get("b")
+        cache.get("a")
+        cache.get("c")
+        cache.get("a")
+        cache.get("b")
+        self.assertEqual(built, ["a", "b", "c", "b"])
+        cache.invalidate("a")
+        cache.get("a")
+        self.assertEqual(built, ["a", "b", "c", "b", "a"])
+
+
+if __name__ == "__main__":
+    unittest.main()
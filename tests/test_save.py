@@ -0,0 +1,91 @@
+import os
+import stat
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+)
+
+import dataset as dataset_module
+from dataset import Dataset, write_caption_atomic
+
+CAPTIONS = {
+    "1": "trig, a, b",
+    "2": "trig, b, c",
+    os.path.join("sub", "3"): "trig, a, c",
+}
+
+# an mtime well in the past, so that any rewrite of a caption shows
+OLD_MTIME_NS = 1_000_000_000 * 10**9
+
+
+class SaveTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = self.tmp.name
+        for stem, text in CAPTIONS.items():
+            os.makedirs(os.path.dirname(os.path.join(self.root, stem)), exist_ok=True)
+            open(os.path.join(self.root, f"{stem}.png"), "wb").close()
+            with open(self.txt(stem), "w") as file:
+                file.write(text)
+            os.utime(self.txt(stem), ns=(OLD_MTIME_NS, OLD_MTIME_NS))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def txt(self, stem):
+        return os.path.join(self.root, f"{stem}.txt")
+
+    def read(self, stem):
+        with open(self.txt(stem)) as file:
+            return file.read()
+
+    def leftovers(self):
+        return [
+            name
+            for _, _, names in os.walk(self.root)
+            for name in names
+            if name.endswith(".tmp")
+        ]
+
+    def test_write_caption_atomic_keeps_permissions(self):
+        os.chmod(self.txt("1"), 0o640)
+        st = write_caption_atomic(self.txt("1"), "trig, d")
+        self.assertEqual(self.read("1"), "trig, d")
+        self.assertEqual(stat.S_IMODE(os.stat(self.txt("1")).st_mode), 0o640)
+        self.assertEqual(st.st_size, len("trig, d"))
+        self.assertEqual(self.leftovers(), [])
+
+    def test_failed_write_leaves_the_original_and_no_temporary_file(self):
+        replace = dataset_module.os.replace
+
+        def failing_replace(src, dst):
+            raise OSError("disk full")
+
+        dataset_module.os.replace = failing_replace
+        try:
+            with self.assertRaises(OSError):
+                write_caption_atomic(self.txt("1"), "trig, d")
+        finally:
+            dataset_module.os.replace = replace
+        self.assertEqual(self.read("1"), CAPTIONS["1"])
+        self.assertEqual(self.leftovers(), [])
+
+    def test_only_edited_captions_are_written(self):
+        dataset = Dataset(self.root)
+        dataset.add_tag_to_image_caption("d", png_path=os.path.join(self.root, "2.png"))
+        summary = dataset.save_dataset()
+        self.assertEqual(summary.files_written, 1)
+        self.assertEqual(summary.bytes_written, len("trig, b, c, d"))
+        self.assertEqual(os.stat(self.txt("1")).st_mtime_ns, OLD_MTIME_NS)
+        self.assertEqual(self.read("2"), "trig, b, c, d")
+        self.assertEqual(dataset.dirty, set())
+        # nothing is left to write
+        self.assertEqual(dataset.save_dataset().files_written, 0)
+        self.assertEqual(os.stat(self.txt("1")).st_mtime_ns, OLD_MTIME_NS)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+)
+
+from dataset import Dataset
+from scan import iter_dataset, scan_dataset
+
+
+class ScanTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = self.tmp.name
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def path(self, *parts):
+        return os.path.join(self.root, *parts)
+
+    def touch(self, *parts):
+        os.makedirs(os.path.dirname(self.path(*parts)), exist_ok=True)
+        with open(self.path(*parts), "w") as file:
+            file.write("trig")
+
+    def test_pairs_within_nested_directories(self):
+        self.touch("b.png")
+        self.touch("b.txt")
+        self.touch("a.png")
+        self.touch("a.txt")
+        self.touch("x", "y", "z", "deep.png")
+        self.touch("x", "y", "z", "deep.txt")
+        self.touch("x", "c.png")
+        self.touch("x", "c.txt")
+        self.touch("w", "d.png")
+        self.touch("w", "d.txt")
+        pairs, missing = scan_dataset(self.root)
+        # depth-first, the entries of each directory sorted by name
+        self.assertEqual(
+            pairs,
+            [
+                (self.path("a.png"), self.path("a.txt")),
+                (self.path("b.png"), self.path("b.txt")),
+                (self.path("w", "d.png"), self.path("w", "d.txt")),
+                (self.path("x", "c.png"), self.path("x", "c.txt")),
+                (
+                    self.path("x", "y", "z", "deep.png"),
+                    self.path("x", "y", "z", "deep.txt"),
+                ),
+            ],
+        )
+        self.assertEqual(missing, [])
+
+    def test_orphan_files(self):
+        self.touch("a.png")
+        # a caption only pairs with an image of the same stem in the same directory
+        self.touch("sub", "a.txt")
+        self.touch("sub", "b.png")
+        self.touch("b.txt")
+        # captions without images, and files of other types, are ignored
+        self.touch("c.txt")
+        self.touch("notes.md")
+        os.mkdir(self.path("folder.png"))
+        self.touch("folder.png", "e.png")
+        self.touch("folder.png", "e.txt")
+        self.assertEqual(
+            list(iter_dataset(self.root)),
+            [
+                (self.path("a.png"), None),
+                (self.path("folder.png", "e.png"), self.path("folder.png", "e.txt")),
+                (self.path("sub", "b.png"), None),
+            ],
+        )
+
+    def test_dataset_reports_images_without_captions(self):
+        self.touch("a.png")
+        self.touch("a.txt")
+        self.touch("sub", "b.png")
+        self.touch("sub", "c.txt")
+        dataset = Dataset(self.root)
+        self.assertEqual(dataset.missing_captions, [self.path("sub", "b.png")])
+        self.assertEqual(list(dataset.image_set), [self.path("a.png")])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+)
+
+import dataset as dataset_module
+from batch import RemoveTag, RenameTags
+from dataset import Dataset
+from shards import ShardedDatasetEdit, edit_dataset_sharded
+
+CAPTIONS = {
+    "1": "trig, a, b",
+    "2": "trig, b, c",
+    os.path.join("sub", "3"): "trig, a, c",
+    os.path.join("sub", "4"): "trig, c, d",
+}
+
+
+def snapshot(dataset):
+    tags = set(dataset.tag_images) | {"a", "b", "c", "d", "e"}
+    return (
+        {key: caption.serialize() for key, (_, caption) in dataset.cache.items()},
+        {tag: list(ids) for tag, ids in dataset.tag_images.items()},
+        {tag: dataset.tag_trie.get(tag) for tag in tags},
+        sorted(dataset.tags_containing("")),
+        {tag: dataset.query(tag) for tag in tags},
+    )
+
+
+class ShardedDatasetEditTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = self.tmp.name
+        for stem, text in CAPTIONS.items():
+            os.makedirs(os.path.dirname(os.path.join(self.root, stem)), exist_ok=True)
+            open(os.path.join(self.root, f"{stem}.png"), "wb").close()
+            with open(os.path.join(self.root, f"{stem}.txt"), "w") as file:
+                file.write(text)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def png(self, stem):
+        return os.path.join(self.root, f"{stem}.png")
+
+    def assertMatchesReload(self, dataset):
+        reads = []
+        read_captions = dataset_module.read_captions
+
+        def counting_read_captions(txt_paths, **kwargs):
+            reads.extend(txt_paths)
+            return read_captions(txt_paths, **kwargs)
+
+        dataset_module.read_captions = counting_read_captions
+        try:
+            reloaded = Dataset(self.root)
+        finally:
+            dataset_module.read_captions = read_captions
+        self.assertEqual(snapshot(dataset), snapshot(reloaded))
+        # the dataset index was brought up to date with the rewritten captions
+        self.assertEqual(reads, [])
+
+    def test_sharded_rename_and_remove(self):
+        dataset = Dataset(self.root)
+        # cache query bitsets, which the edit must invalidate
+        for tag in ["a", "b", "c", "d", "e"]:
+            dataset.query(tag)
+        result = edit_dataset_sharded(dataset, RenameTags(["a", "d"], "e"), jobs=2)
+        self.assertEqual(result.captions_changed, 3)
+        self.assertEqual(dataset.caption_of(self.png("1")).serialize(), "trig, e, b")
+        self.assertEqual(dataset.tag_trie.get("e"), 3)
+        self.assertFalse(dataset.tag_trie.exists("a"))
+        self.assertEqual(
+            dataset.query("e"), [self.png(stem) for stem in ["1", "sub/3", "sub/4"]]
+        )
+        self.assertMatchesReload(dataset)
+        edit_dataset_sharded(dataset, RemoveTag("c"), jobs=2, shard_by="directory")
+        self.assertEqual(dataset.query("c"), [])
+        self.assertEqual(dataset.tags_containing("c"), [])
+        self.assertMatchesReload(dataset)
+
+    def test_unsaved_edits_are_saved_first(self):
+        dataset = Dataset(self.root)
+        dataset.add_tag_to_image_caption("b", png_path=self.png("sub/3"))
+        edit_dataset_sharded(dataset, RenameTags(["b"], "e"), jobs=2)
+        self.assertEqual(dataset.dirty, set())
+        self.assertEqual(dataset.tag_trie.get("e"), 3)
+        # positions recorded before the rewrite would no longer match the captions
+        self.assertEqual(dataset.undo_stack, [])
+        self.assertMatchesReload(dataset)
+
+    def test_task_reports_failure_without_raising(self):
+        dataset = Dataset(self.root)
+        task = ShardedDatasetEdit(dataset, RemoveTag("trig"), jobs=2)
+        task.step(1)
+        self.assertTrue(task.finished())
+        self.assertIsNone(task.result)
+        self.assertEqual(dataset.tag_trie.get("trig"), 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,134 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+)
+
+from dataset import Dataset
+from stats import np, TagStats
+
+# tag counts: trig 6, a 5, b 4, c 3, d 1, e 1
+CAPTIONS = {
+    "1": "trig, a, b, c",
+    "2": "trig, a, b, c",
+    "3": "trig, a, b",
+    "4": "trig, a, d",
+    "5": "trig, a, b, c",
+    "6": "trig, e",
+}
+
+
+def observed(stats, tags):
+    """Returns what the statistics report, in an order that does not depend on how tags were numbered"""
+    pairs = {}
+    for a in tags:
+        for b in tags:
+            count = stats.cooccurrence_of(a, b)
+            if count is not None:
+                pairs[(a, b)] = count
+    return (
+        sorted(stats.frequencies()),
+        list(stats.histogram()),
+        sorted(stats.rare_tags()),
+        pairs,
+        {tag: stats.recommend([tag], limit=len(tags)) for tag in tags},
+    )
+
+
+@unittest.skipIf(np is None, "NumPy is not installed")
+class TagStatsTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = self.tmp.name
+        for stem, text in CAPTIONS.items():
+            open(os.path.join(self.root, f"{stem}.png"), "wb").close()
+            with open(os.path.join(self.root, f"{stem}.txt"), "w") as file:
+                file.write(text)
+        self.dataset = Dataset(self.root)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def png(self, stem):
+        return os.path.join(self.root, f"{stem}.png")
+
+    def add(self, tag, stem):
+        self.dataset.add_tag_to_image_caption(tag, png_path=self.png(stem))
+
+    def remove(self, tag, stem):
+        self.dataset.remove_tag_from_image_caption(tag, png_path=self.png(stem))
+
+    def assertMatchesRebuild(self, stats):
+        tags = list(self.dataset.tag_images) + ["gone"]
+        rebuilt = TagStats(self.dataset, top_tags=stats.top_tags)
+        rebuilt.ensure_built()
+        self.assertEqual(observed(stats, tags), observed(rebuilt, tags))
+
+    def test_patched_statistics_match_a_rebuild(self):
+        stats = TagStats(self.dataset, top_tags=3)
+        stats.ensure_built()
+        # none of these change which tags are the three most frequent
+        self.remove("d", "4")
+        self.add("e", "1")
+        self.remove("c", "1")
+        self.add("gone", "3")
+        self.remove("gone", "3")
+        self.assertTrue(stats.ready())
+        self.assertMatchesRebuild(stats)
+
+    def test_top_tag_change_marks_statistics_stale(self):
+        stats = TagStats(self.dataset, top_tags=3)
+        stats.ensure_built()
+        # c ties b, the least frequent top tag
+        self.add("c", "3")
+        self.assertTrue(stats.ready())
+        # b falls below c, which a rebuild would bring into the top tags
+        self.remove("b", "2")
+        self.assertFalse(stats.ready())
+        self.assertEqual(stats.recommend(["a"]), [])
+        self.assertMatchesRebuild(stats)
+        self.assertEqual(stats.cooccurrence_of("a", "c"), 4)
+        self.assertIsNone(stats.cooccurrence_of("a", "b"))
+
+    def test_new_tag_marks_small_statistics_stale(self):
+        stats = TagStats(self.dataset)
+        stats.ensure_built()
+        self.add("f", "6")
+        self.assertFalse(stats.ready())
+        self.assertMatchesRebuild(stats)
+        self.assertEqual(stats.cooccurrence_of("e", "f"), 1)
+
+    def test_top_tag_dropping_out_marks_statistics_stale(self):
+        stats = TagStats(self.dataset)
+        stats.ensure_built()
+        self.remove("e", "6")
+        self.assertFalse(stats.ready())
+        self.assertMatchesRebuild(stats)
+
+    def test_recommend(self):
+        stats = TagStats(self.dataset)
+        stats.ensure_built()
+        recommendations = stats.recommend(["trig", "a"], exclude=("trig",))
+        # scores average P(t | trig) and P(t | a): b is in 4 of 6 and 4 of 5 captions
+        expected = [("b", (4 / 6 + 4 / 5) / 2), ("c", (3 / 6 + 3 / 5) / 2)]
+        expected += [("d", (1 / 6 + 1 / 5) / 2), ("e", (1 / 6 + 0) / 2)]
+        self.assertEqual([tag for tag, _ in recommendations], [t for t, _ in expected])
+        for (_, score), (_, expected_score) in zip(recommendations, expected):
+            self.assertAlmostEqual(score, expected_score)
+        self.assertEqual(
+            [tag for tag, _ in stats.recommend(["trig", "a"], limit=1)], ["b"]
+        )
+        self.assertEqual(stats.recommend(["unknown"]), [])
+        # an edit that keeps the top tags is reflected without a rebuild
+        self.add("d", "1")
+        self.add("d", "2")
+        self.assertTrue(stats.ready())
+        recommendations = dict(stats.recommend(["trig", "a"], exclude=("trig",)))
+        self.assertAlmostEqual(recommendations["d"], (3 / 6 + 3 / 5) / 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+)
+
+from structures import RadixTrie, Trie
+
+
+def random_word(rng):
+    # a small alphabet and short words make shared prefixes, and words that are prefixes of others, common
+    return "".join(rng.choice("abcd") for _ in range(rng.randint(1, 6)))
+
+
+class RadixTrieEquivalenceTest(unittest.TestCase):
+    """RadixTrie must answer every query exactly as the dict-of-dicts Trie it replaced"""
+
+    def assert_equivalent(self, trie, radix, words, rng):
+        for word in words:
+            self.assertEqual(trie.exists(word), radix.exists(word), word)
+            self.assertEqual(trie.get(word), radix.get(word), word)
+        self.assertEqual(trie.longest_common_prefix(), radix.longest_common_prefix())
+        for prefix in ["", "a", "ab", "abc", "d", "dd", "x"]:
+            self.assertEqual(
+                trie.words_with_prefix(prefix), radix.words_with_prefix(prefix), prefix
+            )
+            for k in (1, 3, 8, 20):
+                skip = set(rng.sample(words, min(3, len(words))))
+                self.assertEqual(
+                    trie.top_words_with_prefix(prefix, k),
+                    radix.top_words_with_prefix(prefix, k),
+                    (prefix, k),
+                )
+                self.assertEqual(
+                    trie.top_words_with_prefix(prefix, k, skip=skip),
+                    radix.top_words_with_prefix(prefix, k, skip=skip),
+                    (prefix, k, skip),
+                )
+        for word in rng.sample(words, min(5, len(words))):
+            for distance in (1, 2):
+                self.assertEqual(
+                    trie.fuzzy_words(word, distance),
+                    radix.fuzzy_words(word, distance),
+                    (word, distance),
+                )
+        document = "".join(rng.choice(words) for _ in range(5))
+        self.assertEqual(trie.find_matches(document), radix.find_matches(document))
+
+    def test_random_adds_and_removes(self):
+        rng = random.Random(8)
+        trie = Trie()
+        radix = RadixTrie()
+        words = sorted(set(random_word(rng) for _ in range(120)))
+        for step in range(1500):
+            word = rng.choice(words)
+            count = rng.randint(1, 4)
+            if rng.random() < 0.6:
+                trie.add(word, count)
+                radix.add(word, count)
+            else:
+                trie.remove(word, count)
+                radix.remove(word, count)
+            if step % 100 == 0:
+                self.assert_equivalent(trie, radix, words, rng)
+        self.assert_equivalent(trie, radix, words, rng)
+
+    def test_remove_everything(self):
+        trie = Trie()
+        radix = RadixTrie()
+        words = ["a", "ab", "abc", "abd", "b"]
+        for word in words:
+            trie.add(word, 2)
+            radix.add(word, 2)
+        for word in words:
+            trie.remove(word, 2)
+            radix.remove(word, 2)
+        for word in words:
+            self.assertFalse(radix.exists(word))
+        self.assertEqual(radix.words_with_prefix(""), trie.words_with_prefix(""))
+        self.assertEqual(radix.top_words_with_prefix("", 8), [])
+
+    def test_missing_words(self):
+        radix = RadixTrie()
+        radix.add("hair", 3)
+        radix.remove("hat")
+        radix.remove("ha")
+        self.assertEqual(radix.get("hair"), 3)
+        self.assertEqual(radix.get("ha"), 0)
+        self.assertFalse(radix.exists("ha"))
+        self.assertEqual(radix.words_with_prefix("hz"), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
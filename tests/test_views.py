@@ -0,0 +1,100 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+)
+
+from dataset import Dataset
+from views import ALL_IMAGES, EDITED, MISSING_TRIGGER, UNTAGGED, DatasetViews
+
+CAPTIONS = {
+    "1": "trig, a, b",
+    "2": "trig",
+    "3": "a, c",
+    "4": "trig, b, c",
+    "5": "trig, a",
+}
+
+QUERIES = ["a", "b AND NOT c", "NOT a OR c"]
+
+
+def members(views):
+    return {name: list(view.ids) for name, view in views.views.items()}
+
+
+class DatasetViewsTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = self.tmp.name
+        for stem, text in CAPTIONS.items():
+            open(os.path.join(self.root, f"{stem}.png"), "wb").close()
+            with open(os.path.join(self.root, f"{stem}.txt"), "w") as file:
+                file.write(text)
+        self.dataset = Dataset(self.root)
+        self.views = self.open_views()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def png(self, stem):
+        return os.path.join(self.root, f"{stem}.png")
+
+    def open_views(self):
+        views = DatasetViews(self.dataset)
+        for name in views.names():
+            views.activate(name)
+        for text in QUERIES:
+            views.add_query(text)
+        return views
+
+    def assertMatchesRecomputed(self):
+        recomputed = self.open_views()
+        self.assertEqual(members(self.views), members(recomputed))
+
+    def test_initial_views(self):
+        ids = self.dataset.image_ids
+        self.assertEqual(self.views.views[UNTAGGED].ids, [ids[self.png("2")]])
+        # 3.txt lacked the trigger word, which was inserted into its cached caption
+        self.assertEqual(self.views.views[MISSING_TRIGGER].ids, [ids[self.png("3")]])
+        self.assertEqual(self.views.views[EDITED].ids, [])
+        self.assertEqual(len(self.views.views[ALL_IMAGES]), 5)
+
+    def test_incremental_views_match_recomputed_views(self):
+        dataset = self.dataset
+        dataset.add_tag_to_image_caption("b", png_path=self.png("2"))
+        self.assertMatchesRecomputed()
+        dataset.remove_tag_from_image_caption("a", png_path=self.png("5"))
+        dataset.remove_tag_from_image_caption("c", png_path=self.png("4"))
+        self.assertMatchesRecomputed()
+        dataset.bulk_edit("add", "c").run()
+        self.assertMatchesRecomputed()
+        dataset.bulk_edit("remove", "b").run()
+        self.assertMatchesRecomputed()
+        dataset.undo()
+        self.assertMatchesRecomputed()
+        dataset.redo()
+        dataset.save_dataset()
+        self.assertEqual(self.views.views[MISSING_TRIGGER].ids, [])
+        self.assertMatchesRecomputed()
+
+    def test_navigation_within_a_view(self):
+        view = self.views.add_query("a")
+        ids = [self.dataset.image_ids[self.png(stem)] for stem in ["1", "3", "5"]]
+        self.assertEqual(view.ids, ids)
+        self.assertEqual(view.neighbour(ids[0], 1), ids[1])
+        self.assertEqual(view.neighbour(ids[2], 1), ids[0])
+        self.assertEqual(view.neighbour(ids[0], -1), ids[2])
+        # from an image outside the view, the nearest member in the direction of travel comes first
+        outside = self.dataset.image_ids[self.png("2")]
+        self.assertEqual(view.neighbour(outside, 1), ids[1])
+        self.assertEqual(view.neighbour(outside, -1), ids[0])
+        self.assertIsNone(view.position(outside))
+        self.dataset.remove_tag_from_image_caption("a", png_path=self.png("3"))
+        self.assertEqual(view.neighbour(ids[0], 1), ids[2])
+
+
+if __name__ == "__main__":
+    unittest.main()